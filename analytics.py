@@ -0,0 +1,179 @@
+# analytics.py
+"""
+平台統計彙總 (Rollup)
+
+管理後台要看的指標：每日新專案數、建立到選定接案人的時間、每個專案收到的提案數、
+各預算區間的成交率、結案率與退件率。每次都直接掃 projects / proposals 會越來越慢，
+所以改由排程 (tasks.refresh_analytics_rollups) 把結果彙總到 analytics_project_daily，
+後台與 API 只讀這張小表。
+
+增量更新 (水位線 watermark)：
+1. 找出上次處理之後 (projects.updated_at / proposals.created_at 晚於水位線) 有變動的專案，
+   換算成它們的「建立日」，只有這些天需要重算。
+2. 逐批 (每批 ANALYTICS_ROLLUP_BATCH_DAYS 天，一個交易) 刪掉這些天的彙總列，從原始資料重新計算寫回。
+   以「天」為單位整格重算而不是加減差額：專案狀態會一直變 (open -> in_progress -> completed)，
+   整格重算不必追蹤每一次轉換，重跑幾次結果都一樣。
+3. 全部完成後才把水位線推進到這次開始的時間；中途失敗下一輪會從舊水位線重來。
+
+專案依建立日 (資料庫時區) 歸類，後續的選定、結案都算回建立的那一天。
+"""
+from datetime import date, datetime, timedelta, timezone
+
+from config import ANALYTICS_ROLLUP_OVERLAP, ANALYTICS_ROLLUP_BATCH_DAYS
+from routes.contractor import BUDGET_RANGES
+
+WATERMARK_NAME = "project_daily"
+# 第一次執行 (還沒有水位線) 時從這個時間開始，等於全部重算
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# --- 1. 增量更新 (排程呼叫) ---
+
+DIRTY_DAYS_SQL = """
+SELECT created_at::date AS day FROM projects WHERE updated_at > %(since)s
+UNION
+SELECT p.created_at::date FROM proposals pr JOIN projects p ON p.id = pr.project_id
+WHERE pr.created_at > %(since)s
+ORDER BY day
+"""
+
+ROLLUP_SQL = """
+INSERT INTO analytics_project_daily (
+    day, budget, projects_created, projects_open, projects_awarded, projects_expired,
+    projects_completed, projects_rejected, award_timed, award_seconds_total, proposals, refreshed_at
+)
+SELECT d.day, COALESCE(p.budget, ''),
+       COUNT(*),
+       COUNT(*) FILTER (WHERE p.status = 'open'),
+       COUNT(*) FILTER (WHERE p.status IN ('in_progress', 'pending_approval', 'completed', 'rejected')),
+       COUNT(*) FILTER (WHERE p.status = 'expired'),
+       COUNT(*) FILTER (WHERE p.status = 'completed'),
+       COUNT(*) FILTER (WHERE p.status = 'rejected'),
+       COUNT(p.awarded_at),
+       COALESCE(SUM(EXTRACT(EPOCH FROM p.awarded_at - p.created_at)), 0),
+       COALESCE(SUM(pr.proposal_count), 0),
+       NOW()
+FROM unnest(%s::date[]) AS d(day)
+JOIN projects p ON p.created_at >= d.day AND p.created_at < d.day + 1
+LEFT JOIN LATERAL (
+    SELECT COUNT(*) AS proposal_count FROM proposals WHERE project_id = p.id
+) pr ON TRUE
+GROUP BY d.day, COALESCE(p.budget, '')
+"""
+
+
+async def refresh_rollups(conn) -> int:
+    """
+    重算水位線之後有變動的日期，回傳重算了幾天。conn 為 dict_row 連線 (不在交易中)。
+    """
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT NOW() AS started, (SELECT last_seen FROM analytics_watermarks WHERE name = %s) AS last_seen",
+                (WATERMARK_NAME,)
+            )
+            row = await cur.fetchone()
+            started = row["started"]
+            since = row["last_seen"] - timedelta(seconds=ANALYTICS_ROLLUP_OVERLAP) if row["last_seen"] else _EPOCH
+            await cur.execute(DIRTY_DAYS_SQL, {"since": since})
+            days = [r["day"] for r in await cur.fetchall()]
+
+    for i in range(0, len(days), ANALYTICS_ROLLUP_BATCH_DAYS):
+        batch = days[i:i + ANALYTICS_ROLLUP_BATCH_DAYS]
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute("DELETE FROM analytics_project_daily WHERE day = ANY(%s)", (batch,))
+                await cur.execute(ROLLUP_SQL, (batch,))
+
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                INSERT INTO analytics_watermarks (name, last_seen, updated_at) VALUES (%s, %s, NOW())
+                ON CONFLICT (name) DO UPDATE SET last_seen = EXCLUDED.last_seen, updated_at = NOW()
+                """,
+                (WATERMARK_NAME, started)
+            )
+    return len(days)
+
+
+# --- 2. 讀取 (後台頁面 / API 共用) ---
+
+def _ratio(numerator, denominator, digits: int = 3):
+    return round(numerator / denominator, digits) if denominator else None
+
+
+def _summarize(row: dict) -> dict:
+    """
+    把彙總欄位換算成指標。
+    成交率 = 已選定 / (已選定 + 截止未選定)，還在開放提案的不計入分母；結案率 / 退件率以已選定為分母。
+    """
+    created = row["projects_created"]
+    awarded = row["projects_awarded"]
+    return {
+        "projects_created": created,
+        "projects_open": row["projects_open"],
+        "projects_awarded": awarded,
+        "projects_expired": row["projects_expired"],
+        "projects_completed": row["projects_completed"],
+        "projects_rejected": row["projects_rejected"],
+        "proposals": row["proposals"],
+        "proposals_per_project": _ratio(row["proposals"], created, 2),
+        "avg_hours_to_award": _ratio(row["award_seconds_total"] / 3600, row["award_timed"], 1),
+        "award_rate": _ratio(awarded, awarded + row["projects_expired"]),
+        "completion_rate": _ratio(row["projects_completed"], awarded),
+        "rejection_rate": _ratio(row["projects_rejected"], awarded),
+    }
+
+
+_ROLLUP_COLUMNS = (
+    "projects_created", "projects_open", "projects_awarded", "projects_expired",
+    "projects_completed", "projects_rejected", "award_timed", "award_seconds_total", "proposals",
+)
+_SUM_COLUMNS = ", ".join(f"COALESCE(SUM({column}), 0) AS {column}" for column in _ROLLUP_COLUMNS)
+
+
+async def fetch_platform_analytics(conn, days: int = 30) -> dict:
+    """
+    最近 days 天 (依專案建立日) 的統計：總計、每日趨勢、各預算區間。只讀 analytics_project_daily。
+    """
+    start = date.today() - timedelta(days=days - 1)
+    async with conn.cursor() as cur:
+        await cur.execute(
+            f"SELECT day, {_SUM_COLUMNS} FROM analytics_project_daily WHERE day >= %s GROUP BY day ORDER BY day",
+            (start,)
+        )
+        daily_rows = {r["day"]: r for r in await cur.fetchall()}
+
+        await cur.execute(
+            f"SELECT budget, {_SUM_COLUMNS} FROM analytics_project_daily WHERE day >= %s GROUP BY budget",
+            (start,)
+        )
+        budget_rows = await cur.fetchall()
+
+        await cur.execute(f"SELECT {_SUM_COLUMNS} FROM analytics_project_daily WHERE day >= %s", (start,))
+        total_row = await cur.fetchone()
+
+        await cur.execute("SELECT last_seen FROM analytics_watermarks WHERE name = %s", (WATERMARK_NAME,))
+        watermark = await cur.fetchone()
+
+    # 沒有新專案的日子也列出來 (趨勢圖才不會跳過)
+    empty = dict.fromkeys(_ROLLUP_COLUMNS, 0)
+    daily = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        daily.append({"day": day.isoformat()} | _summarize(daily_rows.get(day, empty)))
+
+    # 依下拉選單的順序排列，不在選單裡的 (舊資料 / 未填) 排最後
+    order = {budget: i for i, budget in enumerate(BUDGET_RANGES)}
+    budget_rows.sort(key=lambda r: (order.get(r["budget"], len(order)), r["budget"]))
+    budgets = [{"budget": r["budget"] or "未填"} | _summarize(r) for r in budget_rows]
+
+    return {
+        "days": days,
+        "from": start.isoformat(),
+        "refreshed_at": watermark["last_seen"] if watermark else None,
+        "totals": _summarize(total_row),
+        "daily": daily,
+        "budgets": budgets,
+    }
@@ -0,0 +1,190 @@
+# app_logging.py
+"""
+結構化日誌 (Structured logging)
+
+- 非阻塞：所有模組的 logger 只把紀錄丟進記憶體佇列 (QueueHandler)，
+  真正寫到 stdout 的是背景執行緒 (QueueListener)，請求處理中不會因為輸出卡住 event loop。
+  佇列滿了 (輸出端跟不上) 就丟棄新紀錄，不會讓請求等待。
+- 每筆紀錄帶有 request_id (RequestIdMiddleware 設定，也會放在回應標頭 X-Request-ID)，
+  背景工作則是 "job-<id>"，方便把同一個請求 / 工作的訊息串起來。
+- 格式：LOG_FORMAT=json 一行一筆 JSON；text 給開發時閱讀。
+- 層級：LOG_LEVEL 為全域預設，LOG_LEVELS 可以針對個別模組調整 (logger 名稱就是模組名稱，例如 routes.ai)。
+- 抽樣：DEBUG 訊息依 LOG_DEBUG_SAMPLE_RATE 抽樣，以 request_id 決定，同一個請求的 DEBUG 訊息會一起保留。
+  個別呼叫也可以指定比例：logger.debug("...", extra={"sample_rate": 0.01})
+
+使用方式 (跟標準 logging 一樣)：
+    logger = logging.getLogger(__name__)
+    logger.info("專案已建立", extra={"project_id": project_id})
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE, LOG_QUEUE_SIZE
+
+# 目前請求 / 背景工作的識別碼
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+# LogRecord 內建的欄位；其餘 (透過 extra 傳入的) 會原樣輸出到 JSON
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request_id", "sample_rate", "taskName",
+}
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+# --- 1. 呼叫端 (請求的執行緒) ---
+
+def _keep_sample(rid: str | None, rate: float) -> bool:
+    if rid is None:
+        return random.random() < rate
+    return zlib.crc32(rid.encode()) % 10000 < rate * 10000
+
+
+class ContextFilter(logging.Filter):
+    """
+    在呼叫端補上 request_id (ContextVar 只有在呼叫端讀得到)，並對 DEBUG 訊息抽樣。
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        rid = request_id.get()
+        record.request_id = rid
+        if record.levelno <= logging.DEBUG:
+            rate = getattr(record, "sample_rate", LOG_DEBUG_SAMPLE_RATE)
+            if rate < 1 and not _keep_sample(rid, rate):
+                return False
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    只把訊息字串組好就放進佇列，JSON 格式化與輸出都交給背景執行緒。
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# --- 2. 輸出端 (背景執行緒) ---
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            data["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s [%(rid)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.rid = getattr(record, "request_id", None) or "-"
+        return super().format(record)
+
+
+def _parse_levels(spec: str) -> dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """
+    設定根 logger：所有紀錄經過佇列，由背景執行緒輸出到 stdout。重複呼叫不會重複設定。
+    main.py、worker.py、outbox.py 啟動時呼叫一次。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # 結束前把佇列裡剩下的紀錄寫完
+
+
+# --- 3. Request ID ---
+
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    """
+    純 ASGI middleware：沿用反向代理傳來的 X-Request-ID (格式正確時)，否則產生一個新的，
+    並在回應標頭帶回去，前端回報問題時可以直接對到日誌。
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        rid = None
+        for key, value in scope.get("headers", ()):
+            if key == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _VALID_REQUEST_ID.match(candidate):
+                    rid = candidate
+                break
+        rid = rid or uuid.uuid4().hex[:16]
+        header = (b"x-request-id", rid.encode())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), header]
+            await send(message)
+
+        token = request_id.set(rid)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,229 @@
+# benchmarks/bench_hot_paths.py
+"""
+熱點函式微基準測試 (Micro-benchmarks)
+
+不需要 PostgreSQL：查詢函式改接 benchmarks/fakedb.py 的假連線，只量 Python 端的 CPU 成本。
+1. parse_budget_max_value / get_budget_limit        : 預算字串解析
+2. fetch_contractor_dashboard                       : 案件大廳的預算過濾 + 排序迴圈 (1k / 10k 筆)
+3. dashboard_contractor.html 渲染 (1k 筆)           : 片段快取全部失效 (cold) / 全部命中 (warm)
+4. save_upload_file                                 : 上傳檔案寫入速度 (MB/s)
+
+輸出為 JSON (每個項目一筆)，--output 會附加到 JSONL 檔案，方便長期追蹤：
+    python benchmarks/bench_hot_paths.py
+    python benchmarks/bench_hot_paths.py --only dashboard --rounds 50 --output bench_output.jsonl
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # 樣板、uploads 等路徑都是相對於專案根目錄
+
+from starlette.datastructures import Headers, UploadFile
+from starlette.requests import Request
+
+from benchmarks.fakedb import FakeConnection
+from routes.contractor import parse_budget_max_value, get_budget_limit, fetch_contractor_dashboard
+from fragment_cache import fragment_cache
+from templating import templates
+import utils
+
+BUDGETS = [
+    "5,000 以下", "5,001 - 10,000", "10,001 - 50,000", "50,001 - 100,000",
+    "100,001 - 300,000", "300,001 - 1,000,000", "1,000,001 - 3,000,000", "3,000,000 以上",
+    "1萬 - 5萬", "面議", "", None,  # 對照表以外的舊資料，會走正規表示式 / 預設值
+]
+
+
+# --- 1. 量測工具 ---
+
+def measure(func, rounds: int, ops_per_round: int = 1) -> dict:
+    """
+    執行 rounds 次 func()，回傳每次耗時的統計 (毫秒) 與每秒可執行次數。
+    """
+    func()  # 暖身 (載入樣板、建立快取等一次性成本不算在內)
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    mean = statistics.mean(samples)
+    return {
+        "rounds": rounds,
+        "mean_ms": round(mean * 1000, 4),
+        "p50_ms": round(statistics.median(samples) * 1000, 4),
+        "min_ms": round(min(samples) * 1000, 4),
+        "stdev_ms": round(statistics.pstdev(samples) * 1000, 4),
+        "ops_per_sec": round(ops_per_round / mean, 1),
+    }
+
+
+def make_projects(n: int, seed: int = 42) -> list[dict]:
+    """
+    產生 n 筆「案件大廳查詢」會回傳的資料列 (欄位與 fetch_contractor_dashboard 的 SELECT 相同)。
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i in range(1, n + 1):
+        created_at = now - timedelta(hours=rng.uniform(1, 2000))
+        rows.append({
+            "id": i, "client_id": rng.randint(1, 500), "contractor_id": None,
+            "title": f"專案 {i} 網站前端開發", "description": "需要有相關作品集，請在提案中附上過去的案例。" * 2,
+            "status": "open", "deadline": now + timedelta(days=rng.uniform(1, 60)),
+            "budget": rng.choice(BUDGETS[:9]), "created_at": created_at, "updated_at": created_at,
+            "client_name": f"client{i % 500}", "has_proposed": rng.random() < 0.1,
+        })
+    return rows
+
+
+def dashboard_conn(rows: list[dict]) -> FakeConnection:
+    return FakeConnection([
+        ("FROM projects p", rows),
+        ("COUNT(*)", [{"count": len(rows)}]),
+    ])
+
+
+def fake_request(query_string: bytes = b"status=open"):
+    # 需要真的路由表，樣板裡的 url_for 才會跟正式環境一樣逐一比對路由
+    # 匯入 main 時的啟動訊息改印到 stderr，stdout 只保留 JSON 結果
+    with contextlib.redirect_stdout(sys.stderr):
+        from main import app
+    return Request({
+        "type": "http", "method": "GET", "path": "/contractor/dashboard", "root_path": "",
+        "query_string": query_string, "headers": [], "scheme": "http", "server": ("testserver", 80),
+        "app": app, "router": app.router,
+    })
+
+
+# --- 2. 各項基準測試 ---
+
+def bench_budget(rounds: int) -> list[dict]:
+    values = BUDGETS * 100
+
+    def run_parse():
+        for v in values:
+            parse_budget_max_value(v)
+
+    def run_limit():
+        for v in values:
+            get_budget_limit(v)
+
+    return [
+        {"name": "parse_budget_max_value", **measure(run_parse, rounds, len(values))},
+        {"name": "get_budget_limit", **measure(run_limit, rounds, len(values))},
+    ]
+
+
+def bench_dashboard(rounds: int) -> list[dict]:
+    results = []
+    for n in (1_000, 10_000):
+        conn = dashboard_conn(make_projects(n))
+
+        def run(conn=conn):
+            asyncio.run(fetch_contractor_dashboard(
+                conn, 1, "open", min_b_val=5000, max_b_val=1_000_000, sort="budget_high",
+            ))
+
+        results.append({"name": f"fetch_contractor_dashboard[{n}]", **measure(run, rounds)})
+    return results
+
+
+def bench_render(rounds: int) -> list[dict]:
+    projects = make_projects(1_000)
+    for p in projects:
+        p["budget_val"] = parse_budget_max_value(p["budget"])
+    template = templates.get_template("dashboard_contractor.html")
+    context = {
+        "request": fake_request(),
+        "user": {"id": 1, "username": "bench", "role": "contractor"},
+        "projects": projects,
+        "current_filter": "open",
+        "search_query": None,
+        "stats": {"open": len(projects), "in_progress": 3, "pending": 1, "completed": 7},
+    }
+
+    def run_cold():
+        fragment_cache.clear()
+        template.render(context)
+
+    def run_warm():
+        template.render(context)
+
+    return [
+        {"name": "render_dashboard_contractor[1000,cold]", **measure(run_cold, rounds)},
+        {"name": "render_dashboard_contractor[1000,warm]", **measure(run_warm, rounds)},
+    ]
+
+
+def bench_upload(rounds: int, size_mb: int = 20) -> list[dict]:
+    payload = os.urandom(1024 * 1024) * size_mb
+    tmp_dir = tempfile.mkdtemp(prefix="upload_bench_")
+    original_root = utils.UPLOAD_ROOT
+    utils.UPLOAD_ROOT = tmp_dir  # 寫到暫存資料夾，不污染 uploads/
+
+    def run():
+        upload = UploadFile(io.BytesIO(payload), filename="bench.pdf",
+                            headers=Headers({"content-type": "application/pdf"}))
+        path = asyncio.run(utils.save_upload_file(upload, 1, utils.FOLDER_DELIVERABLES))
+        os.remove(path)
+
+    try:
+        stats = measure(run, rounds)
+    finally:
+        utils.UPLOAD_ROOT = original_root
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    stats["mb_per_sec"] = round(size_mb / (stats["mean_ms"] / 1000), 1)
+    return [{"name": f"save_upload_file[{size_mb}MB]", **stats}]
+
+
+BENCHMARKS = {
+    "budget": bench_budget,
+    "dashboard": bench_dashboard,
+    "render": bench_render,
+    "upload": bench_upload,
+}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="熱點函式微基準測試")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--only", choices=list(BENCHMARKS), action="append", help="只跑指定項目 (可重複指定)")
+    parser.add_argument("--output", help="將結果附加到 JSONL 檔案 (每個項目一行)")
+    args = parser.parse_args()
+
+    meta = {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": git_commit(),
+            "python": sys.version.split()[0]}
+    results = []
+    for key in args.only or list(BENCHMARKS):
+        for result in BENCHMARKS[key](args.rounds):
+            results.append({**meta, **result})
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
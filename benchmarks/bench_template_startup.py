@@ -0,0 +1,84 @@
+# benchmarks/bench_template_startup.py
+"""
+樣板啟動時間基準測試 (Template startup benchmark)
+
+比較部署後「第一次載入所有樣板」的成本：
+1. legacy      : 舊做法，main.py 與 routes/auth.py 各自建立環境，沒有 bytecode 快取 (每份都要解析 + 編譯)
+2. cold_cache  : 共用環境，bytecode 快取是空的 (第一次部署)
+3. warm_cache  : 共用環境，bytecode 快取已存在 (重啟 / 其他 worker)
+
+執行方式 (在專案根目錄)：
+    python benchmarks/bench_template_startup.py --rounds 20
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+TEMPLATE_DIR = "templates"
+
+
+def load_all(env: Environment):
+    for name in env.list_templates(extensions=["html"]):
+        env.get_template(name)
+
+
+def run_legacy() -> float:
+    start = time.perf_counter()
+    for _ in range(2):  # 兩份獨立環境
+        load_all(Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True))
+    return time.perf_counter() - start
+
+
+def run_shared(cache_dir: str) -> float:
+    start = time.perf_counter()
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=True,
+        bytecode_cache=FileSystemBytecodeCache(cache_dir),
+        auto_reload=False,
+    )
+    load_all(env)
+    return time.perf_counter() - start
+
+
+def summarize(samples: list[float]) -> dict:
+    ms = [s * 1000 for s in samples]
+    return {"mean_ms": round(statistics.mean(ms), 3), "min_ms": round(min(ms), 3), "max_ms": round(max(ms), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jinja2 樣板啟動時間基準測試")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    legacy, cold, warm = [], [], []
+    for _ in range(args.rounds):
+        legacy.append(run_legacy())
+
+        cache_dir = tempfile.mkdtemp(prefix="jinja_bench_")
+        try:
+            cold.append(run_shared(cache_dir))  # 快取是空的：解析 + 編譯 + 寫入快取
+            warm.append(run_shared(cache_dir))  # 新環境，但直接讀取 bytecode 快取
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(json.dumps({
+        "benchmark": "template_startup",
+        "rounds": args.rounds,
+        "legacy": summarize(legacy),
+        "cold_cache": summarize(cold),
+        "warm_cache": summarize(warm),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
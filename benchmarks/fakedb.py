@@ -0,0 +1,69 @@
+# benchmarks/fakedb.py
+"""
+假的非同步資料庫連線 (不需要 PostgreSQL)
+
+依 SQL 內容回傳預先準備好的資料列，用來單獨量測路由 / 查詢函式在 Python 端花的 CPU 時間：
+
+    conn = FakeConnection([
+        ("FROM projects p", project_rows),          # SQL 含有這段文字 -> 回傳這些資料列
+        ("COUNT(*)", [{"count": 42}]),
+    ])
+    data = await fetch_contractor_dashboard(conn, 1)
+
+規則依序比對，第一個符合的生效；都不符合就回傳空結果。
+每次 fetch 都回傳資料列的淺拷貝 (路由會直接修改 dict，例如補上 budget_val)，不同輪之間互不影響。
+"""
+import re
+from contextlib import asynccontextmanager
+
+
+class FakeCursor:
+    def __init__(self, conn: "FakeConnection"):
+        self.conn = conn
+        self._rows: list[dict] = []
+        self.rowcount = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, sql: str, params=None):
+        self.conn.executed.append((sql, params))
+        self._rows = self.conn.rows_for(sql)
+        self.rowcount = len(self._rows)
+
+    async def fetchone(self):
+        return dict(self._rows[0]) if self._rows else None
+
+    async def fetchall(self):
+        return [dict(row) for row in self._rows]
+
+
+class FakeConnection:
+    def __init__(self, rules: list[tuple[str, list[dict]]] | None = None):
+        # (SQL 片段 或 已編譯的正規表示式, 資料列)
+        self.rules = [
+            (re.compile(re.escape(p)) if isinstance(p, str) else p, rows)
+            for p, rows in (rules or [])
+        ]
+        self.executed: list[tuple[str, object]] = []
+
+    def rows_for(self, sql: str) -> list[dict]:
+        for pattern, rows in self.rules:
+            if pattern.search(sql):
+                return rows
+        return []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield self
+
+    async def execute(self, sql: str, params=None):
+        cur = FakeCursor(self)
+        await cur.execute(sql, params)
+        return cur
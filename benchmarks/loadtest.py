@@ -0,0 +1,256 @@
+# benchmarks/loadtest.py
+"""
+端對端壓力測試 (End-to-end load test)
+
+模擬真實的使用流程，對本機啟動的網站 (uvicorn + 本機 PostgreSQL) 發送請求：
+- 委託人：登入 -> 儀表板 -> 建立專案 -> 專案詳情 -> 選擇提案 -> 開 Issue -> 驗收結案
+- 接案人：登入 -> 搜尋 / 瀏覽案件 (不同篩選與排序) -> 專案詳情 -> 上傳 PDF 投標
+          -> 回覆 Issue -> 上傳交付檔案
+每一組「委託人 + 接案人」跑完一整個專案生命週期，多組同時進行。
+
+輸出每個端點的吞吐量 (req/s) 與 p50 / p95 / p99 延遲，並可以跟儲存的基準值 (baseline) 比較，
+超出容許範圍就列為退步 (regression) 並以結束碼 1 離開，方便放進 CI。
+
+執行方式 (先啟動網站，建議先用 seed_data.py 灌入大量資料)：
+    uvicorn main:app --workers 4
+    python benchmarks/loadtest.py --pairs 20 --iterations 5 --save-baseline benchmarks/baselines/loadtest.json
+    python benchmarks/loadtest.py --pairs 20 --iterations 5 --baseline benchmarks/baselines/loadtest.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+BUDGETS = [
+    ("5,000 以下", 1000, 5000),
+    ("5,001 - 10,000", 5001, 10000),
+    ("10,001 - 50,000", 10001, 50000),
+    ("50,001 - 100,000", 50001, 100000),
+]
+SEARCH_TERMS = [None, "設計", "網站", "App", "Logo"]
+BROWSE_VARIANTS = [
+    {"sort": "newest"},
+    {"sort": "deadline"},
+    {"sort": "budget_high"},
+    {"sort": "newest", "min_budget": 10000},
+    {"sort": "newest", "deadline_days": "7"},
+]
+# 佔位用的最小 PDF (投標 / 交付檔案)
+PDF_BYTES = b"%PDF-1.4\n1 0 obj<<>>endobj\ntrailer<<>>\n%%EOF\n" + b"0" * 50_000
+
+
+# --- 1. 統計 ---
+
+class Recorder:
+    """
+    依端點名稱 (例如 "GET /client/project/{id}") 記錄每次請求的延遲與錯誤數。
+    """
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def request(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            raise
+        elapsed = time.perf_counter() - start
+        self.latencies.setdefault(name, []).append(elapsed)
+        # 303 導向是表單送出成功的正常回應
+        if resp.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return resp
+
+    def summary(self, wall_time: float) -> dict:
+        result = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            if len(values) >= 2:
+                q = statistics.quantiles(values, n=100, method="inclusive")
+                p50, p95, p99 = q[49], q[94], q[98]
+            else:
+                p50 = p95 = p99 = values[0]
+            result[name] = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "throughput_rps": round(len(values) / wall_time, 2),
+                "p50_ms": round(p50 * 1000, 2),
+                "p95_ms": round(p95 * 1000, 2),
+                "p99_ms": round(p99 * 1000, 2),
+            }
+        return result
+
+
+# --- 2. 使用者流程 ---
+
+async def register_and_login(rec: Recorder, client: httpx.AsyncClient, username: str, role: str, password: str):
+    await rec.request(client, "POST /register", "POST", "/register", data={
+        "username": username, "email": f"{username}@loadtest.local", "password": password, "role": role,
+    })
+    resp = await rec.request(client, "POST /login", "POST", "/login", data={"username": username, "password": password})
+    if resp.status_code >= 400 or "session" not in client.cookies:
+        raise RuntimeError(f"登入失敗: {username} ({resp.status_code})")
+
+
+async def contractor_browse(rec: Recorder, contractor: httpx.AsyncClient, rng: random.Random):
+    """
+    接案人搜尋與瀏覽：關鍵字搜尋 + 幾種不同的篩選 / 排序 (相當於翻閱案件列表)。
+    """
+    q = rng.choice(SEARCH_TERMS)
+    params = {"status": "open", **({"q": q} if q else {})}
+    await rec.request(contractor, "GET /contractor/dashboard?q", "GET", "/contractor/dashboard", params=params)
+    for variant in rng.sample(BROWSE_VARIANTS, 2):
+        await rec.request(contractor, "GET /contractor/dashboard?filter", "GET", "/contractor/dashboard",
+                          params={"status": "open", **variant})
+
+
+async def project_lifecycle(rec: Recorder, client: httpx.AsyncClient, contractor: httpx.AsyncClient,
+                            rng: random.Random, tag: str):
+    """
+    一個專案從建立到結案的完整流程。
+    """
+    # A. 委託人：儀表板 -> 建立專案
+    await rec.request(client, "GET /client/dashboard", "GET", "/client/dashboard")
+    budget, low, high = rng.choice(BUDGETS)
+    title = f"壓測專案 {tag}"
+    deadline = (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%dT%H:%M")
+    await rec.request(client, "POST /client/create_project", "POST", "/client/create_project", data={
+        "title": title, "description": "壓力測試自動建立的專案，請忽略。", "deadline": deadline, "budget": budget,
+    })
+    resp = await rec.request(client, "GET /api/v1/client/dashboard", "GET", "/api/v1/client/dashboard", params={"status": "open"})
+    project_id = next(p["id"] for p in resp.json()["projects"] if p["title"] == title)
+
+    # B. 接案人：搜尋 -> 詳情 -> 投標
+    await contractor_browse(rec, contractor, rng)
+    await rec.request(contractor, "GET /contractor/project/{id}", "GET", f"/contractor/project/{project_id}")
+    await rec.request(contractor, "POST /contractor/project/{id}/propose", "POST", f"/contractor/project/{project_id}/propose",
+                      data={"quote": str(rng.randint(low, high)), "message": "壓力測試提案"},
+                      files={"proposal_pdf": ("proposal.pdf", PDF_BYTES, "application/pdf")})
+
+    # C. 委託人：詳情 -> 選擇提案 -> 開 Issue
+    await rec.request(client, "GET /client/project/{id}", "GET", f"/client/project/{project_id}")
+    detail = (await rec.request(client, "GET /api/v1/client/projects/{id}", "GET", f"/api/v1/client/projects/{project_id}")).json()
+    proposal_id = detail["proposals"][0]["id"]
+    await rec.request(client, "POST /client/select_proposal/{id}/{id}", "POST", f"/client/select_proposal/{project_id}/{proposal_id}")
+    await rec.request(client, "POST /client/project/{id}/create_issue", "POST", f"/client/project/{project_id}/create_issue",
+                      data={"title": "進度確認", "description": "請問目前進度如何？"})
+    detail = (await rec.request(client, "GET /api/v1/client/projects/{id}", "GET", f"/api/v1/client/projects/{project_id}")).json()
+    issue_id = detail["issues"][0]["id"]
+
+    # D. 接案人：回覆 Issue -> 上傳交付檔案
+    await rec.request(contractor, "POST /contractor/issue/{id}/comment", "POST", f"/contractor/issue/{issue_id}/comment",
+                      data={"message": "已完成八成，今天會上傳。"})
+    await rec.request(contractor, "POST /contractor/project/{id}/upload", "POST", f"/contractor/project/{project_id}/upload",
+                      files={"file": ("deliverable.pdf", PDF_BYTES, "application/pdf")})
+
+    # E. 委託人：關閉 Issue -> 驗收通過 (還有未解決的 Issue 時不能結案)
+    await rec.request(client, "POST /client/issue/{id}/resolve", "POST", f"/client/issue/{issue_id}/resolve")
+    await rec.request(client, "POST /client/project/{id}/approve", "POST", f"/client/project/{project_id}/approve")
+    await rec.request(client, "GET /client/dashboard", "GET", "/client/dashboard", params={"status": "completed"})
+
+
+async def run_pair(rec: Recorder, args, run_id: str, index: int):
+    rng = random.Random(args.seed * 100_000 + index)
+    limits = httpx.Limits(max_connections=2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client, \
+               httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as contractor:
+        await register_and_login(rec, client, f"lt{run_id}c{index}", "client", args.password)
+        await register_and_login(rec, contractor, f"lt{run_id}k{index}", "contractor", args.password)
+        for i in range(args.iterations):
+            try:
+                await project_lifecycle(rec, client, contractor, rng, f"{run_id}-{index}-{i}")
+            except (httpx.HTTPError, StopIteration, KeyError, IndexError, ValueError) as e:
+                # 單一流程失敗 (例如回應不是預期的內容) 不中斷整個測試，錯誤數已經記在 Recorder 裡
+                print(f"[pair {index}] 第 {i} 次流程失敗: {type(e).__name__}: {e}", file=sys.stderr)
+
+
+# --- 3. 基準值比較 ---
+
+def compare_with_baseline(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    p95 變慢或吞吐量下降超過 tolerance (例如 0.2 = 20%) 就列為退步。
+    """
+    regressions = []
+    for name, base in baseline.get("endpoints", {}).items():
+        cur = current["endpoints"].get(name)
+        if cur is None:
+            continue
+        if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} ms -> {cur['p95_ms']} ms")
+        if cur["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} -> {cur['throughput_rps']} req/s")
+        if cur["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {cur['errors']}")
+    return regressions
+
+
+def print_table(endpoints: dict):
+    print(f"{'endpoint':<45} {'count':>6} {'err':>4} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, s in endpoints.items():
+        print(f"{name:<45} {s['count']:>6} {s['errors']:>4} {s['throughput_rps']:>8} "
+              f"{s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8}")
+
+
+async def main_async(args) -> int:
+    rec = Recorder()
+    run_id = f"{int(time.time()) % 1_000_000}"
+    start = time.perf_counter()
+    await asyncio.gather(*(run_pair(rec, args, run_id, i) for i in range(args.pairs)))
+    wall_time = time.perf_counter() - start
+
+    report = {
+        "config": {"pairs": args.pairs, "iterations": args.iterations, "base_url": args.base_url, "seed": args.seed},
+        "wall_time_s": round(wall_time, 2),
+        "endpoints": rec.summary(wall_time),
+    }
+    print_table(report["endpoints"])
+    print(f"總時間 {report['wall_time_s']} 秒")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.save_baseline) or ".", exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"已儲存基準值: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"發現 {len(regressions)} 項效能退步 (容許範圍 {args.tolerance:.0%})：")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("與基準值相比沒有退步。")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端對端壓力測試 (委託人 / 接案人流程)")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--pairs", type=int, default=10, help="同時進行的「委託人 + 接案人」組數")
+    parser.add_argument("--iterations", type=int, default=3, help="每組跑幾次完整的專案流程")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="將結果寫成 JSON")
+    parser.add_argument("--baseline", help="與這份基準值 JSON 比較")
+    parser.add_argument("--save-baseline", help="將這次結果存成基準值")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="容許的退步比例 (預設 20%%)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
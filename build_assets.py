@@ -0,0 +1,125 @@
+# build_assets.py
+"""
+靜態資源建置腳本 (部署前執行一次)：
+
+    python build_assets.py
+
+1. 圖片最佳化 (需要 Pillow；沒安裝就原檔複製)
+2. 依內容雜湊重新命名 (fingerprint)：style.css -> style.3f2a1b9c0d.css
+3. 文字類檔案預先壓縮成 .gz 與 .br (brotli 需要 pip install brotli)
+4. 輸出 static/dist/manifest.json，給樣板的 asset_url() 查詢
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+from static_assets import STATIC_DIR, DIST_DIR, MANIFEST_PATH
+
+# --- 套件相容性檢查 (都是選用) ---
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+try:
+    from PIL import Image
+    HAS_PILLOW = True
+except ImportError:
+    HAS_PILLOW = False
+
+# 值得預先壓縮的文字類檔案 (圖片本身已經是壓縮格式，再壓一次沒意義)
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+# 壓縮後至少要小這麼多才值得保留壓縮版
+MIN_SAVING_RATIO = 0.9
+
+
+def optimize_image(data: bytes, ext: str) -> bytes:
+    """
+    重新編碼圖片：JPEG 使用漸進式 + 最佳化霍夫曼表，PNG 使用最佳化壓縮。
+    結果比原檔大時保留原檔。
+    """
+    if not HAS_PILLOW:
+        return data
+    with Image.open(io.BytesIO(data)) as img:
+        out = io.BytesIO()
+        if ext in (".jpg", ".jpeg"):
+            img.convert("RGB").save(out, format="JPEG", quality=82, optimize=True, progressive=True)
+        else:
+            img.save(out, format="PNG", optimize=True)
+    optimized = out.getvalue()
+    return optimized if len(optimized) < len(data) else data
+
+
+def fingerprint(name: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(name)
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    return f"{stem}.{digest}{ext}"
+
+
+def write_compressed_variants(path: str, data: bytes) -> list[str]:
+    """
+    產生 .gz 與 .br；壓縮效果不明顯的就不產生。
+    """
+    written = []
+    # mtime=0 讓同樣內容每次 build 出完全相同的 .gz (方便比對與快取)
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data) * MIN_SAVING_RATIO:
+        with open(path + ".gz", "wb") as f:
+            f.write(gz)
+        written.append(".gz")
+    if HAS_BROTLI:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data) * MIN_SAVING_RATIO:
+            with open(path + ".br", "wb") as f:
+                f.write(br)
+            written.append(".br")
+    return written
+
+
+def build_assets():
+    dist_dir = os.path.join(STATIC_DIR, DIST_DIR)
+    # 每次都重建，避免舊雜湊檔案越堆越多
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    for root, dirs, files in os.walk(STATIC_DIR):
+        # 跳過輸出資料夾本身
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for filename in sorted(files):
+            src = os.path.join(root, filename)
+            rel = os.path.relpath(src, STATIC_DIR).replace(os.sep, "/")
+            ext = os.path.splitext(filename)[1].lower()
+
+            with open(src, "rb") as f:
+                data = f.read()
+            original_size = len(data)
+
+            if ext in IMAGE_EXTENSIONS:
+                data = optimize_image(data, ext)
+
+            out_rel = fingerprint(rel, data)
+            out_path = os.path.join(dist_dir, out_rel)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            with open(out_path, "wb") as f:
+                f.write(data)
+
+            variants = write_compressed_variants(out_path, data) if ext in COMPRESSIBLE_EXTENSIONS else []
+            manifest[rel] = out_rel
+            print(f"{rel} -> {DIST_DIR}/{out_rel} ({original_size} -> {len(data)} bytes) {' '.join(variants)}")
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"已輸出 {len(manifest)} 個檔案到 {dist_dir}")
+    if not HAS_BROTLI:
+        print("提示：未安裝 brotli，只產生 .gz (pip install brotli)")
+    if not HAS_PILLOW:
+        print("提示：未安裝 Pillow，圖片未最佳化 (pip install Pillow)")
+
+
+if __name__ == "__main__":
+    build_assets()
@@ -0,0 +1,136 @@
+# config.py
+import os
+
+# --- 全域設定 ---
+# 集中管理從環境變數讀取的設定值，其他模組一律從這裡匯入，
+# 避免同一個環境變數在多個檔案裡各自寫一份預設值。
+
+# Session / 簽章用的密鑰 (正式上線務必以環境變數覆寫)
+SECRET_KEY = os.getenv("SECRET_KEY", "a_very_secret_key_please_change_me")
+
+# --- 檔案傳輸模式 ---
+# "direct"     : 由 Python worker 直接讀檔回傳 (開發環境預設)
+# "x-accel"    : 只做權限檢查，回傳 X-Accel-Redirect 讓 nginx 送檔
+# "x-sendfile" : 只做權限檢查，回傳 X-Sendfile 讓 Apache / lighttpd 送檔
+FILE_SERVING_MODE = os.getenv("FILE_SERVING_MODE", "direct").lower()
+
+# nginx 的 internal location 前綴，需與 nginx 設定一致，例如：
+#   location /protected-uploads/ { internal; alias /srv/app/uploads/; }
+X_ACCEL_PREFIX = os.getenv("X_ACCEL_PREFIX", "/protected-uploads/")
+
+# 是否改用「短效簽章網址」下載檔案 (權限檢查通過後 303 導向簽章網址)
+FILE_SIGNED_URLS = os.getenv("FILE_SIGNED_URLS", "false").lower() in ("1", "true", "yes")
+# 簽章網址有效秒數
+FILE_SIGNED_URL_TTL = int(os.getenv("FILE_SIGNED_URL_TTL", "300"))
+
+# --- 密碼雜湊 (Argon2) ---
+# 成本參數越高越安全，但每次登入花費的 CPU / 記憶體也越多
+PASSWORD_HASH_TIME_COST = int(os.getenv("PASSWORD_HASH_TIME_COST", "3"))            # 迭代次數
+PASSWORD_HASH_MEMORY_COST = int(os.getenv("PASSWORD_HASH_MEMORY_COST", "65536"))    # 記憶體 (KiB)
+PASSWORD_HASH_PARALLELISM = int(os.getenv("PASSWORD_HASH_PARALLELISM", "1"))        # 單次雜湊的執行緒數
+# 同時進行雜湊的上限 (專用執行緒池大小)，避免登入尖峰把整台機器的 CPU 吃光
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+# --- Session 身分快取 ---
+# Session Cookie 內會帶一份簽章過的身分 (id / role / username / 版本號)，
+# 角色檢查在這段時間內直接信任它，不查資料庫；超過時間才回資料庫比對版本號。
+SESSION_IDENTITY_TTL = int(os.getenv("SESSION_IDENTITY_TTL", "300"))
+
+# --- 執行環境 ---
+# "development" 或 "production"；正式環境會關閉樣板自動重新載入等開發用功能
+APP_ENV = os.getenv("APP_ENV", "development").lower()
+IS_PRODUCTION = APP_ENV == "production"
+
+# --- 樣板引擎 (Jinja2) ---
+# 編譯後的樣板 bytecode 存放位置 (重啟 / 多個 worker 之間共用，不必每次重新編譯)
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR", ".jinja_cache")
+# 啟動時是否預先編譯所有樣板 (避免部署後第一個請求特別慢)
+TEMPLATE_PRECOMPILE = os.getenv("TEMPLATE_PRECOMPILE", "true" if IS_PRODUCTION else "false").lower() in ("1", "true", "yes")
+
+# --- 樣板片段快取 (Fragment Cache) ---
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "5000"))  # LRU 上限 (筆)
+# 每筆片段最多保留幾秒：其他 worker 的失效通知不會跨行程，超過時間一律重新渲染
+FRAGMENT_CACHE_TTL = int(os.getenv("FRAGMENT_CACHE_TTL", "300"))
+
+# --- 通知發送 (outbox.py) ---
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))          # 每批最多處理幾筆事件
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "10"))    # 沒有事件時幾秒後再查 (也是合併摘要的時間窗)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))         # 失敗幾次後放棄
+
+# Email 通知 (沒設定 SMTP_HOST 就只發站內通知)
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_FROM = os.getenv("SMTP_FROM", "noreply@example.com")
+
+# --- 背景工作佇列 (jobs.py / worker.py) ---
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))  # 每個 worker 同時執行幾個工作
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))          # 沒工作時幾秒後再查
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT", "600"))            # 超過幾秒沒有心跳視為 worker 已當機，重新排入佇列
+JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", "60"))  # 執行中的工作每幾秒刷新一次 locked_at (需小於 JOB_LOCK_TIMEOUT)
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "10")) # 重試等待 = base * 2^(次數-1)
+
+# --- 過期專案清理 (tasks.expire_overdue_projects) ---
+PROJECT_EXPIRY_SWEEP_INTERVAL = int(os.getenv("PROJECT_EXPIRY_SWEEP_INTERVAL", "60"))  # 幾秒掃一次
+PROJECT_EXPIRY_BATCH_SIZE = int(os.getenv("PROJECT_EXPIRY_BATCH_SIZE", "500"))         # 每批最多更新幾筆 (縮短鎖定時間)
+
+# --- 監控指標 (GET /metrics) ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# 設定後 Prometheus 需帶 Authorization: Bearer <token>；沒設定則不檢查 (請在反向代理層限制來源)
+# 正式環境 (APP_ENV=production) 必須設定，否則 main.py 不會掛載 /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# --- 查詢追蹤與 N+1 偵測 (query_trace.py) ---
+# 預設只在非正式環境開啟；正式環境需要時再用環境變數打開
+QUERY_TRACE_ENABLED = os.getenv("QUERY_TRACE_ENABLED", "false" if IS_PRODUCTION else "true").lower() in ("1", "true", "yes")
+# 同一個請求裡，同一種 SQL (常數代換後) 執行超過幾次視為 N+1
+QUERY_TRACE_N_PLUS_ONE_THRESHOLD = int(os.getenv("QUERY_TRACE_N_PLUS_ONE_THRESHOLD", "10"))
+# 測試模式 (APP_ENV=test) 下偵測到 N+1 時回應改為 500 (在回應送出前檢查)，其他環境只印警告
+QUERY_TRACE_STRICT = os.getenv("QUERY_TRACE_STRICT", "true" if APP_ENV == "test" else "false").lower() in ("1", "true", "yes")
+# 每個請求的 span tree 附加寫入這個 JSONL 檔案；不設定就不輸出
+QUERY_TRACE_EXPORT_PATH = os.getenv("QUERY_TRACE_EXPORT_PATH")
+
+# --- 慢查詢紀錄 (slow_query.py) ---
+# 開發 / 測試機預設開啟；正式環境的 EXPLAIN ANALYZE 會多跑一次查詢，需要時再手動打開
+SLOW_QUERY_LOG_ENABLED = os.getenv("SLOW_QUERY_LOG_ENABLED", "false" if IS_PRODUCTION else "true").lower() in ("1", "true", "yes")
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))   # 超過幾毫秒算慢查詢
+SLOW_QUERY_LOG_PATH = os.getenv("SLOW_QUERY_LOG_PATH", "slow_queries.jsonl")
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")  # 是否自動擷取執行計畫
+SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))  # 同一種 SQL 幾秒內只 EXPLAIN 一次
+
+# --- 日誌 (app_logging.py) ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # 全域層級
+# 個別模組的層級，例如 "routes.ai=DEBUG,jobs=WARNING,psycopg.pool=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# "json" : 一行一筆 JSON (給日誌收集系統)；"text" : 給人看的單行格式
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json" if IS_PRODUCTION else "text").lower()
+# DEBUG 訊息的抽樣比例 (0~1)；同一個請求的 DEBUG 訊息會一起保留或一起丟棄
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1" if IS_PRODUCTION else "1"))
+# 日誌佇列上限：輸出端跟不上時直接丟棄新訊息，而不是讓請求卡住
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# --- 專案批次匯入 (project_import.py) ---
+PROJECT_IMPORT_MAX_ROWS = int(os.getenv("PROJECT_IMPORT_MAX_ROWS", "1000"))        # 單次最多幾筆
+PROJECT_IMPORT_MAX_BYTES = int(os.getenv("PROJECT_IMPORT_MAX_BYTES", str(2 * 1024 * 1024)))  # 上傳檔案大小上限
+
+# --- 管理員 ---
+# 可以進入管理後台 (/admin/...) 的帳號，逗號分隔的 username；沒設定就沒有人可以進入
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+# --- 平台統計彙總 (analytics.py) ---
+ANALYTICS_ROLLUP_INTERVAL = int(os.getenv("ANALYTICS_ROLLUP_INTERVAL", "300"))    # 排程幾秒更新一次
+# 每次往回多看幾秒 (彌補執行較久、較晚 commit 的交易)；重算同一天是冪等的，多看不會重複計算
+ANALYTICS_ROLLUP_OVERLAP = int(os.getenv("ANALYTICS_ROLLUP_OVERLAP", "300"))
+ANALYTICS_ROLLUP_BATCH_DAYS = int(os.getenv("ANALYTICS_ROLLUP_BATCH_DAYS", "31"))  # 每個交易重算幾天
+
+# --- 個人檔案 ---
+PROFILE_REVIEWS_PAGE_SIZE = int(os.getenv("PROFILE_REVIEWS_PAGE_SIZE", "20"))  # 評價列表每頁 (每次「載入更多」) 幾筆
+USER_PREVIEW_MAX_AGE = int(os.getenv("USER_PREVIEW_MAX_AGE", "60"))  # Hover 預覽卡 API 讓瀏覽器快取幾秒
+
+# --- 接案人排行榜 (rating_stats.py) ---
+# 貝氏平均：分數 = (C * 全站平均 + 評分加總) / (C + 評價數)；C 越大，評價少的人越被拉向全站平均
+LEADERBOARD_PRIOR_REVIEWS = int(os.getenv("LEADERBOARD_PRIOR_REVIEWS", "5"))
+# 全站平均變動超過這個值才整份重算，否則只更新有新評價的接案人
+LEADERBOARD_PRIOR_TOLERANCE = float(os.getenv("LEADERBOARD_PRIOR_TOLERANCE", "0.05"))
+LEADERBOARD_REFRESH_INTERVAL = int(os.getenv("LEADERBOARD_REFRESH_INTERVAL", "300"))  # 排程幾秒更新一次
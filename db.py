@@ -1,8 +1,14 @@
 # db.py
 import os
+import time
+import logging
 from fastapi import HTTPException
+from psycopg import AsyncCursor
 from psycopg_pool import AsyncConnectionPool
 from psycopg.rows import dict_row
+from metrics import DB_CHECKOUT_DURATION
+
+logger = logging.getLogger(__name__)
 
 # --- 資料庫設定 ---
 # 在正式環境中，建議使用 os.getenv 從環境變數讀取，安全性較高
@@ -15,40 +21,97 @@ DB_PORT = 5432
 # 組合連線字串 (Connection String)
 DATABASE_URL = f"dbname={DEFAULT_DB} user={DB_USER} password={DB_PASSWORD} host={DB_HOST} port={DB_PORT}"
 
+# --- 查詢監聽 (Query hooks) ---
+# 每條 SQL 執行完都會呼叫這裡註冊的函式：hook(sql, params, 耗時秒數, rowcount, 例外或 None)
+# 例如 metrics.py 用來統計查詢時間。沒有註冊任何 hook 時完全不計時，沒有額外成本。
+QUERY_HOOKS: list = []
+
+def add_query_hook(hook):
+    QUERY_HOOKS.append(hook)
+
+class InstrumentedCursor(AsyncCursor):
+    """
+    連線池預設使用的 Cursor：在 execute 前後計時，並通知 QUERY_HOOKS。
+    """
+    async def execute(self, query, params=None, **kwargs):
+        if not QUERY_HOOKS:
+            return await super().execute(query, params, **kwargs)
+
+        start = time.perf_counter()
+        error = None
+        try:
+            return await super().execute(query, params, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            for hook in QUERY_HOOKS:
+                try:
+                    hook(query, params, duration, self.rowcount, error)
+                except Exception as hook_error:
+                    # 監控程式本身出錯不能影響正常的查詢
+                    logger.exception("Query hook error: %s", hook_error)
+
 # 宣告全域連線池變數，預設為 None
 _pool: AsyncConnectionPool | None = None
 
-async def getDB():
+async def get_pool() -> AsyncConnectionPool:
     """
-    FastAPI 的 Dependency (依賴項) 函式。
-    
-    用途：
-    1. 管理資料庫連線池的生命週期。
-    2. 確保每次請求都有可用的連線。
-    3. 使用 yield 讓 FastAPI 在請求結束後自動關閉該次連線。
+    取得 (必要時建立) 全域連線池。
+
+    getDB 以及不經過 Depends 的地方 (例如權限檢查只在 Session 過期時才查資料庫)
+    都透過這個函式共用同一個連線池。
     """
     global _pool
 
     # Lazy Loading: 第一次被呼叫時才建立連線池
     if _pool is None:
-        print("正在初始化資料庫連線池 (Initializing Connection Pool)...")
+        logger.info("正在初始化資料庫連線池 (Initializing Connection Pool)...")
         _pool = AsyncConnectionPool(
             conninfo=DATABASE_URL,
-            kwargs={"row_factory": dict_row},  # 設定：讓查詢結果變成 Dictionary (例如 record['id']) 而不是 Tuple
+            kwargs={
+                "row_factory": dict_row,  # 設定：讓查詢結果變成 Dictionary (例如 record['id']) 而不是 Tuple
+                "cursor_factory": InstrumentedCursor,  # 查詢計時 (見上方 QUERY_HOOKS)
+            },
             open=False  # 先設定好參數，暫不開啟，由下方 open() 觸發
         )
         try:
             await _pool.open()  # 正式開啟連線池
-            print("資料庫連線池已開啟 (Connection Pool Opened).")
+            logger.info("資料庫連線池已開啟 (Connection Pool Opened).")
         except Exception as e:
-            print(f"無法開啟連線池: {e}")
+            logger.error("無法開啟連線池: %s", e)
             _pool = None
             raise
 
     if _pool is None:
         raise HTTPException(status_code=500, detail="Database connection pool is not available.")
 
+    return _pool
+
+def pool_stats() -> dict:
+    """
+    連線池目前的統計數字 (psycopg_pool 的 get_stats)；連線池還沒建立時回傳空 dict。
+    """
+    return _pool.get_stats() if _pool is not None else {}
+
+async def getDB():
+    """
+    FastAPI 的 Dependency (依賴項) 函式。
+    
+    用途：
+    1. 管理資料庫連線池的生命週期。
+    2. 確保每次請求都有可用的連線。
+    3. 使用 yield 讓 FastAPI 在請求結束後自動關閉該次連線。
+    (查詢追蹤 / N+1 偵測由 query_trace.QueryTraceMiddleware 負責，不在這裡：
+     yield 之後的程式碼在回應送出後才執行，來不及影響回應。)
+    """
+    pool = await get_pool()
+
     # 使用 context manager (async with) 取得連線
     # 這會自動處理連線的借出與歸還
-    async with _pool.connection() as conn:
+    checkout_start = time.perf_counter()
+    async with pool.connection() as conn:
+        # 借到連線花了多久 (連線池不夠用時會在這裡排隊)
+        DB_CHECKOUT_DURATION.observe(time.perf_counter() - checkout_start)
         yield conn
\ No newline at end of file
@@ -0,0 +1,191 @@
+# exports.py
+"""
+委託人專案歷史匯出 (給會計對帳用)
+
+資料集 (每個一個 CSV / XLSX 工作表)：
+- projects     : 每個專案一列，附提案數、報價區間、得標報價、交付次數、雙方評分
+- proposals    : 每份提案 (報價) 一列
+- deliverables : 每個交付檔案版本一列
+- reviews      : 與專案有關的評價 (給出 / 收到)
+
+記憶體用量與資料筆數無關：
+- 用「具名游標」(server-side cursor) 每次只向資料庫拿 EXPORT_FETCH_SIZE 筆，整份結果不會進到 Python。
+- CSV 邊讀邊送 (StreamingResponse)；連線在開始讀取時才從連線池借出，游標讀完就歸還，
+  不會像 Depends(getDB) 一樣綁住整個請求。
+- XLSX 需要寫完整個檔案，交給背景工作 (tasks.export_project_history_xlsx) 以 openpyxl 的 write_only 模式產生。
+"""
+import csv
+import io
+from datetime import datetime
+
+from psycopg.rows import tuple_row
+
+from db import get_pool
+from utils import UPLOAD_ROOT
+
+# --- 套件相容性檢查 ---
+# XLSX 需要 openpyxl (pip install openpyxl)；沒安裝時只提供 CSV
+try:
+    from openpyxl import Workbook
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+# 具名游標每次抓取的筆數
+EXPORT_FETCH_SIZE = 2000
+# XLSX 匯出檔存放位置 (uploads/exports/<client_id>/<export_id>.xlsx)
+EXPORT_FOLDER = "exports"
+
+
+# --- 1. 資料集定義 (欄位標題, SQL) ---
+# SQL 一律以 %(client_id)s 限定為該委託人的專案，並依 id 排序 (專案大的委託人也能穩定分批讀取)
+
+DATASETS: dict[str, tuple[list[str], str]] = {
+    "projects": (
+        ["專案ID", "標題", "狀態", "預算", "截止日", "建立時間", "最後更新", "接案人",
+         "提案數", "最低報價", "平均報價", "得標報價", "交付版本數", "最後交付時間",
+         "給接案人的評分", "收到的評分"],
+        """
+        SELECT p.id, p.title, p.status::text, p.budget, p.deadline, p.created_at, p.updated_at,
+               c.username,
+               pr.proposal_count, pr.min_quote, pr.avg_quote, pr.awarded_quote,
+               f.file_count, f.last_uploaded_at,
+               given.average_score, received.average_score
+        FROM projects p
+        LEFT JOIN users c ON c.id = p.contractor_id
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) AS proposal_count, MIN(quote) AS min_quote, ROUND(AVG(quote), 2) AS avg_quote,
+                   MAX(quote) FILTER (WHERE contractor_id = p.contractor_id) AS awarded_quote
+            FROM proposals WHERE project_id = p.id
+        ) pr ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) AS file_count, MAX(uploaded_at) AS last_uploaded_at
+            FROM project_files WHERE project_id = p.id
+        ) f ON TRUE
+        LEFT JOIN reviews given ON given.project_id = p.id AND given.reviewer_id = p.client_id
+        LEFT JOIN reviews received ON received.project_id = p.id AND received.reviewee_id = p.client_id
+        WHERE p.client_id = %(client_id)s
+        ORDER BY p.id
+        """,
+    ),
+    "proposals": (
+        ["專案ID", "專案標題", "提案ID", "接案人", "報價", "是否得標", "提案時間", "提案說明"],
+        """
+        SELECT p.id, p.title, pr.id, u.username, pr.quote,
+               (pr.contractor_id = p.contractor_id) AS awarded, pr.created_at, pr.message
+        FROM projects p
+        JOIN proposals pr ON pr.project_id = p.id
+        JOIN users u ON u.id = pr.contractor_id
+        WHERE p.client_id = %(client_id)s
+        ORDER BY p.id, pr.id
+        """,
+    ),
+    "deliverables": (
+        ["專案ID", "專案標題", "檔案ID", "檔名", "版本", "版本說明", "上傳者", "上傳時間"],
+        """
+        SELECT p.id, p.title, f.id, f.filename, f.version, f.description, u.username, f.uploaded_at
+        FROM projects p
+        JOIN project_files f ON f.project_id = p.id
+        JOIN users u ON u.id = f.uploader_id
+        WHERE p.client_id = %(client_id)s
+        ORDER BY p.id, f.id
+        """,
+    ),
+    "reviews": (
+        ["專案ID", "專案標題", "方向", "對象", "評分1", "評分2", "評分3", "平均", "評語", "評價時間"],
+        """
+        SELECT p.id, p.title,
+               CASE WHEN r.reviewer_id = p.client_id THEN '給出' ELSE '收到' END,
+               u.username, r.rating_1, r.rating_2, r.rating_3, r.average_score, r.comment, r.created_at
+        FROM projects p
+        JOIN reviews r ON r.project_id = p.id
+        JOIN users u ON u.id = CASE WHEN r.reviewer_id = p.client_id THEN r.reviewee_id ELSE r.reviewer_id END
+        WHERE p.client_id = %(client_id)s
+        ORDER BY p.id, r.id
+        """,
+    ),
+}
+
+
+# --- 2. 讀取 ---
+
+async def iter_export_batches(conn, dataset: str, client_id: int, fetch_size: int = EXPORT_FETCH_SIZE):
+    """
+    以具名游標分批讀取資料集，每次 yield 一批 tuple。
+    具名游標只能在交易內使用；讀完 (或呼叫端提早停止) 時交易隨之結束。
+    """
+    _, sql = DATASETS[dataset]
+    async with conn.transaction():
+        async with conn.cursor(name=f"export_{dataset}", row_factory=tuple_row) as cur:
+            await cur.execute(sql, {"client_id": client_id})
+            while True:
+                rows = await cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield rows
+
+
+def format_cell(value):
+    """
+    轉成試算表看得懂的值：時間去掉微秒、None 變空字串 (金額維持 Decimal，XLSX 裡才是數字)。
+    文字開頭是 = + - @ 的加上單引號，避免被 Excel 當成公式執行 (CSV injection)。
+    """
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, bool):
+        return "是" if value else "否"
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@"):
+        return "'" + value
+    return value
+
+
+# --- 3. CSV (串流) ---
+
+async def stream_csv(dataset: str, client_id: int):
+    """
+    StreamingResponse 用的產生器：先送標題列，再一批一批送資料列。
+    開頭加上 UTF-8 BOM，Excel 直接開啟時中文才不會變亂碼。
+    """
+    headers, _ = DATASETS[dataset]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    buffer.write("\ufeff")
+    writer.writerow(headers)
+    yield buffer.getvalue()
+
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async for rows in iter_export_batches(conn, dataset, client_id):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([format_cell(v) for v in row] for row in rows)
+            yield buffer.getvalue()
+
+
+# --- 4. XLSX (背景工作) ---
+
+def xlsx_export_path(client_id: int, export_id: str) -> str:
+    """
+    export_id 是隨機產生的 UUID，檔名猜不到 (開發模式下 /uploads 是公開掛載的)。
+    """
+    return f"{UPLOAD_ROOT}/{EXPORT_FOLDER}/{client_id}/{export_id}.xlsx"
+
+
+async def write_xlsx(conn, client_id: int, path: str):
+    """
+    把所有資料集寫成同一個活頁簿 (每個資料集一個工作表)。
+    write_only 模式會把資料列直接寫到暫存檔，記憶體用量與筆數無關。
+    """
+    if not HAS_OPENPYXL:
+        raise RuntimeError("匯出 XLSX 需要安裝 openpyxl (pip install openpyxl)")
+    workbook = Workbook(write_only=True)
+    for dataset, (headers, _) in DATASETS.items():
+        sheet = workbook.create_sheet(title=dataset)
+        sheet.append(headers)
+        async for rows in iter_export_batches(conn, dataset, client_id):
+            for row in rows:
+                sheet.append([format_cell(v) for v in row])
+    workbook.save(path)
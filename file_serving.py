@@ -0,0 +1,95 @@
+# file_serving.py
+import os
+import hmac
+import hashlib
+import time
+import urllib.parse
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from config import (
+    SECRET_KEY, FILE_SERVING_MODE, X_ACCEL_PREFIX,
+    FILE_SIGNED_URLS, FILE_SIGNED_URL_TTL,
+)
+from utils import UPLOAD_ROOT
+
+# --- 檔案傳輸 (下載) 工具 ---
+# 大檔案如果由 Python worker 自己讀檔回傳，整段傳輸期間都會佔住一個 worker。
+# 正式環境可以把「送檔」交給前面的反向代理 (nginx / Apache)，
+# 應用程式只負責權限檢查，然後回一個帶有特殊 Header 的空回應。
+
+
+def is_safe_upload_path(path: str) -> bool:
+    """
+    檢查路徑是否位於 uploads/ 底下，且沒有 ".." (防止 Path Traversal 攻擊)。
+    """
+    return ".." not in path and path.startswith(f"{UPLOAD_ROOT}/")
+
+
+def _relative_upload_path(path: str) -> str:
+    """
+    將 "uploads/12/deliverables/a.pdf" 轉為 "12/deliverables/a.pdf"。
+    """
+    return path[len(UPLOAD_ROOT) + 1:]
+
+
+def send_upload_file(path: str) -> Response:
+    """
+    依照 FILE_SERVING_MODE 回傳檔案。
+
+    注意：呼叫前必須已經做完權限與路徑檢查。
+    - direct     : FileResponse，由 Python 讀檔 (開發環境)
+    - x-accel    : 回傳 X-Accel-Redirect，nginx 從 internal location 送檔
+    - x-sendfile : 回傳 X-Sendfile (絕對路徑)，由 Apache / lighttpd 送檔
+    """
+    if FILE_SERVING_MODE == "x-accel":
+        # nginx 會對 X-Accel-Redirect 做 URL 解碼，所以中文檔名要先編碼
+        location = X_ACCEL_PREFIX + urllib.parse.quote(_relative_upload_path(path))
+        return Response(headers={"X-Accel-Redirect": location})
+
+    if FILE_SERVING_MODE == "x-sendfile":
+        # Header 只能是 latin-1；先轉成 UTF-8 位元組，讓中文路徑原樣送給 Web Server
+        abs_path = os.path.abspath(path)
+        return Response(headers={"X-Sendfile": abs_path.encode("utf-8").decode("latin-1")})
+
+    # 預設：直接由 Python 回傳檔案
+    return FileResponse(path)
+
+
+# --- 短效簽章網址 ---
+# 簽章內容 = HMAC-SHA256(SECRET_KEY, "路徑:到期時間")
+# 網址本身就是授權，不需要 Session，適合交給瀏覽器 / 下載工具直接使用。
+
+def _sign(path: str, expires: int) -> str:
+    message = f"{path}:{expires}".encode("utf-8")
+    return hmac.new(SECRET_KEY.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def build_signed_url(path: str, ttl: int = FILE_SIGNED_URL_TTL) -> str:
+    """
+    產生 /files/signed?path=...&expires=...&sig=... 的短效下載網址。
+    """
+    expires = int(time.time()) + ttl
+    query = urllib.parse.urlencode({"path": path, "expires": expires, "sig": _sign(path, expires)})
+    return f"/files/signed?{query}"
+
+
+def verify_signed_url(path: str, expires: int, sig: str) -> bool:
+    """
+    檢查簽章是否正確且尚未過期 (使用 compare_digest 防止時間差攻擊)。
+    """
+    if expires < int(time.time()):
+        return False
+    return hmac.compare_digest(_sign(path, expires), sig)
+
+
+def download_response(path: str) -> Response:
+    """
+    下載路由 (client / contractor 的 download_file) 共用的出口：
+    - 開啟 FILE_SIGNED_URLS 時，導向短效簽章網址
+    - 否則直接依 FILE_SERVING_MODE 送檔
+    """
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    if FILE_SIGNED_URLS:
+        return RedirectResponse(url=build_signed_url(path), status_code=303)
+    return send_upload_file(path)
@@ -0,0 +1,113 @@
+# fragment_cache.py
+import time
+from collections import OrderedDict
+from jinja2 import nodes
+from jinja2.ext import Extension
+from config import FRAGMENT_CACHE_MAX_ENTRIES, FRAGMENT_CACHE_TTL
+
+# --- 樣板片段快取 (Fragment Cache) ---
+# 儀表板的專案卡片、個人檔案的評價列表，大部分時候內容都沒變，卻每次都重新渲染。
+# 這裡把渲染好的 HTML 片段存在記憶體 (LRU)，樣板用法：
+#
+#   {% cache "project", project.id, project.updated_at, project.proposal_count %}
+#       ... 專案卡片 HTML ...
+#   {% endcache %}
+#
+# 快取 Key = (網站網址, 實體版本號, 所有參數)
+# - 第 1、2 個參數固定是「命名空間」與「實體 ID」，用來對應版本號
+# - 寫入路由呼叫 invalidate_fragment("project", 12) 時版本號 +1，舊片段就不會再被命中
+# - 其餘參數 (updated_at、數量等) 讓其他 worker 的資料變動也能反映在 Key 上
+
+
+class FragmentCache:
+    """
+    簡單的 LRU + TTL 快取。
+    樣板渲染都在 event loop 的同一條執行緒上進行，所以不需要加鎖。
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()   # key -> (到期時間, HTML)
+        self._versions: dict[tuple, int] = {}        # (命名空間, 實體 ID) -> 版本號
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, namespace: str, entity_id) -> int:
+        return self._versions.get((namespace, entity_id), 0)
+
+    def invalidate(self, namespace: str, entity_id):
+        """
+        讓某個實體的所有片段失效 (版本號 +1)。
+        舊的片段不必主動刪除，沒人讀取後會自然被 LRU 淘汰。
+        """
+        key = (namespace, entity_id)
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, html = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)  # 最近使用過 -> 移到尾端
+        self.hits += 1
+        return html
+
+    def set(self, key, html):
+        self._entries[key] = (time.monotonic() + self.ttl, html)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)  # 淘汰最久沒用的
+
+    def clear(self):
+        self._entries.clear()
+        self._versions.clear()
+
+
+# 全域快取實例 (每個 worker 一份)
+fragment_cache = FragmentCache(FRAGMENT_CACHE_MAX_ENTRIES, FRAGMENT_CACHE_TTL)
+
+
+def invalidate_fragment(namespace: str, entity_id):
+    """
+    給寫入路由使用：資料變動後呼叫，例如 invalidate_fragment("project", project_id)。
+    """
+    fragment_cache.invalidate(namespace, entity_id)
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Jinja2 擴充：提供 {% cache 命名空間, 實體ID, ... %} ... {% endcache %} 標籤。
+    """
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        # 讀取逗號分隔的參數
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        call = self.call_method("_render_cached", [nodes.ContextReference(), nodes.List(args)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, context, parts, caller):
+        namespace, entity_id = parts[0], parts[1]
+
+        # url_for 產生的是完整網址，不同 Host 的片段不能混用
+        request = context.get("request")
+        base_url = str(request.base_url) if request is not None else ""
+
+        key = (base_url, fragment_cache.version(namespace, entity_id), *parts)
+        html = fragment_cache.get(key)
+        if html is None:
+            html = caller()
+            fragment_cache.set(key, html)
+        return html
@@ -1,7 +1,11 @@
 # init_db.py
+import logging
 import psycopg
 # 從 db.py 匯入連線參數
 from db import DATABASE_URL
+from rating_stats import rebuild_rating_stats
+
+logger = logging.getLogger(__name__)
 
 # 定義初始化 SQL 指令
 # 使用 IF NOT EXISTS 避免重複建立錯誤
@@ -12,7 +16,7 @@ DO $$ BEGIN
         CREATE TYPE user_role AS ENUM ('client', 'contractor');
     END IF;
     IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'project_status') THEN
-        CREATE TYPE project_status AS ENUM ('open', 'in_progress', 'pending_approval', 'completed', 'rejected');
+        CREATE TYPE project_status AS ENUM ('open', 'in_progress', 'pending_approval', 'completed', 'rejected', 'expired');
     END IF;
 END $$;
 
@@ -25,6 +29,7 @@ CREATE TABLE IF NOT EXISTS users (
     role user_role NOT NULL,
     avatar VARCHAR(500),      -- 頭像路徑
     introduction TEXT,        -- 自我介紹
+    session_version INT NOT NULL DEFAULT 1, -- 角色/帳號變更時 +1，讓舊的 Session 身分失效
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
@@ -38,8 +43,16 @@ CREATE TABLE IF NOT EXISTS projects (
     status project_status NOT NULL DEFAULT 'open',
     deadline TIMESTAMPTZ,
     budget VARCHAR(100),      -- 預算範圍文字
-    created_at TIMESTAMPTZ DEFAULT NOW()
+    awarded_at TIMESTAMPTZ,   -- 選定接案人的時間 (由觸發器維護，平台統計用)
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW() -- 最後更新時間 (由觸發器維護，樣板片段快取以此為 Key)
 );
+-- 只索引「開放中」的專案：過了截止日的由排程改成 expired，自動離開索引，
+-- 案件大廳不必每次掃過越積越多的過期專案
+CREATE INDEX IF NOT EXISTS idx_projects_open_feed ON projects(created_at DESC) WHERE status = 'open';
+CREATE INDEX IF NOT EXISTS idx_projects_open_deadline ON projects(deadline) WHERE status = 'open'; -- 排程找過期專案 / 依截止日排序
+CREATE INDEX IF NOT EXISTS idx_projects_client ON projects(client_id, id); -- 委託人的專案列表 / 匯出依 id 分批讀取
+CREATE INDEX IF NOT EXISTS idx_projects_created ON projects(created_at); -- 統計彙總：重算某一天建立的專案
 
 -- 4. 建立提案表 (proposals) - 接案人投標用
 CREATE TABLE IF NOT EXISTS proposals (
@@ -51,6 +64,7 @@ CREATE TABLE IF NOT EXISTS proposals (
     proposal_file VARCHAR(500),    -- 提案 PDF 路徑
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
+CREATE INDEX IF NOT EXISTS idx_proposals_project ON proposals(project_id);
 
 -- 5. 建立專案檔案表 (project_files) - 成果交付用
 CREATE TABLE IF NOT EXISTS project_files (
@@ -63,6 +77,7 @@ CREATE TABLE IF NOT EXISTS project_files (
     description TEXT,               -- 版本說明
     uploaded_at TIMESTAMPTZ DEFAULT NOW()
 );
+CREATE INDEX IF NOT EXISTS idx_project_files_project ON project_files(project_id);
 
 -- 6. 建立問題追蹤表 (project_issues)
 CREATE TABLE IF NOT EXISTS project_issues (
@@ -101,7 +116,131 @@ CREATE TABLE IF NOT EXISTS reviews (
 );
 
 -- 建立索引以加速查詢
-CREATE INDEX IF NOT EXISTS idx_reviews_reviewee ON reviews(reviewee_id);
+-- 個人檔案的評價列表依 (created_at, id) 由新到舊分頁，索引順序與 ORDER BY 相同，每頁只讀 PAGE_SIZE 筆
+-- (只查 reviewee_id 的查詢也能用這個索引，舊的 idx_reviews_reviewee 在下方移除)
+CREATE INDEX IF NOT EXISTS idx_reviews_reviewee_created ON reviews(reviewee_id, created_at DESC, id DESC);
+
+-- 8-1. 使用者評分統計 (user_rating_stats) - 每人一列，與新增評價在同一個交易內累加 (見 rating_stats.py)
+CREATE TABLE IF NOT EXISTS user_rating_stats (
+    user_id INT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    review_count INT NOT NULL DEFAULT 0,
+    score_sum DECIMAL(12, 1) NOT NULL DEFAULT 0,  -- average_score 加總
+    rating_1_sum INT NOT NULL DEFAULT 0,
+    rating_2_sum INT NOT NULL DEFAULT 0,
+    rating_3_sum INT NOT NULL DEFAULT 0,
+    stars_1 INT NOT NULL DEFAULT 0,               -- 星等分佈 (單則平均分數四捨五入)
+    stars_2 INT NOT NULL DEFAULT 0,
+    stars_3 INT NOT NULL DEFAULT 0,
+    stars_4 INT NOT NULL DEFAULT 0,
+    stars_5 INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_user_rating_stats_updated ON user_rating_stats(updated_at); -- 排行榜增量更新
+
+-- 8-2. 接案人排行榜 (貝氏平均，由排程從 user_rating_stats 增量更新)
+CREATE TABLE IF NOT EXISTS contractor_leaderboard (
+    user_id INT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    review_count INT NOT NULL,
+    avg_rating DECIMAL(3, 2) NOT NULL,     -- 原始平均
+    bayes_score DOUBLE PRECISION NOT NULL, -- 排名依據
+    prior_mean DOUBLE PRECISION NOT NULL,  -- 計算時使用的全站平均
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_contractor_leaderboard_rank ON contractor_leaderboard(bayes_score DESC, review_count DESC, user_id);
+
+-- 9. 建立通知寄件匣 (outbox) - Transactional Outbox
+-- 與狀態變更寫在同一個交易裡，交易成功才會有通知；由 outbox.py 的背景程式批次發送
+CREATE TABLE IF NOT EXISTS outbox (
+    id BIGSERIAL PRIMARY KEY,
+    recipient_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    event_type VARCHAR(50) NOT NULL,   -- proposal_received / deliverable_uploaded / project_status
+    payload JSONB NOT NULL DEFAULT '{}',
+    attempts INT NOT NULL DEFAULT 0,   -- 發送失敗次數
+    available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(), -- 失敗重試時延後到這個時間
+    processed_at TIMESTAMPTZ,          -- NULL = 尚未發送
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+-- 只索引「尚未發送」的資料，發送完的舊資料不會拖慢撈取速度
+CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox(available_at, id) WHERE processed_at IS NULL;
+
+-- 10. 建立站內通知表 (notifications)
+CREATE TABLE IF NOT EXISTS notifications (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    title VARCHAR(255) NOT NULL,
+    body TEXT,
+    event_count INT NOT NULL DEFAULT 1, -- 這則摘要合併了幾個事件
+    is_read BOOLEAN NOT NULL DEFAULT FALSE,
+    email_status VARCHAR(20),           -- NULL = 不寄信 / pending / sent / failed (與站內通知分開重試)
+    email_attempts INT NOT NULL DEFAULT 0,
+    email_available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(), -- 寄信失敗重試時延後到這個時間
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_unread ON notifications(user_id, created_at DESC) WHERE NOT is_read;
+
+-- 11. 建立背景工作佇列 (jobs) - 由 worker.py 執行，不佔用網站請求
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    queue VARCHAR(50) NOT NULL DEFAULT 'default',
+    name VARCHAR(100) NOT NULL,         -- 對應 @job 註冊的名稱
+    args JSONB NOT NULL DEFAULT '{}',
+    priority INT NOT NULL DEFAULT 0,    -- 數字越大越優先
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- queued / running / done / failed
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),     -- 最早執行時間 (重試時延後)
+    locked_at TIMESTAMPTZ,
+    locked_by VARCHAR(100),
+    last_error TEXT,
+    dedupe_key VARCHAR(200),            -- 同一個 key 同時只會有一個等待中 / 執行中的工作 (排程用)
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+-- 只索引等待中的工作，依「優先度 -> 時間」排序，認領時直接走索引
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(queue, priority DESC, run_at, id) WHERE status = 'queued';
+
+-- 12. 平台統計彙總表 (analytics.py 的排程增量更新；管理後台只讀這張表，不掃描 projects / proposals)
+-- 以「專案建立日 + 預算選項」為一格，專案後續的狀態變化都算回它建立的那一天
+CREATE TABLE IF NOT EXISTS analytics_project_daily (
+    day DATE NOT NULL,
+    budget VARCHAR(100) NOT NULL,               -- 預算選項 ('' = 未填)
+    projects_created INT NOT NULL DEFAULT 0,
+    projects_open INT NOT NULL DEFAULT 0,       -- 仍在開放提案
+    projects_awarded INT NOT NULL DEFAULT 0,    -- 已選定接案人 (執行中 / 待驗收 / 已結案 / 已退件)
+    projects_expired INT NOT NULL DEFAULT 0,    -- 截止仍未選定接案人
+    projects_completed INT NOT NULL DEFAULT 0,
+    projects_rejected INT NOT NULL DEFAULT 0,
+    award_timed INT NOT NULL DEFAULT 0,         -- 有 awarded_at 的專案數 (舊資料沒有選定時間)
+    award_seconds_total DOUBLE PRECISION NOT NULL DEFAULT 0, -- 建立到選定接案人的秒數加總
+    proposals INT NOT NULL DEFAULT 0,           -- 收到的提案數
+    refreshed_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (day, budget)
+);
+
+-- 13. 增量處理的水位線 (上次處理到的時間點)
+CREATE TABLE IF NOT EXISTS analytics_watermarks (
+    name VARCHAR(50) PRIMARY KEY,
+    last_seen TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+"""
+
+# projects.updated_at 自動更新觸發器 (第一次填入 contractor_id 時一併記下 awarded_at)
+PROJECTS_UPDATED_AT_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION set_projects_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    IF NEW.contractor_id IS NOT NULL AND OLD.contractor_id IS NULL AND NEW.awarded_at IS NULL THEN
+        NEW.awarded_at = NOW();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_projects_updated_at ON projects;
+CREATE TRIGGER trg_projects_updated_at
+    BEFORE UPDATE ON projects
+    FOR EACH ROW EXECUTE FUNCTION set_projects_updated_at();
 """
 
 def init_database():
@@ -111,7 +250,7 @@ def init_database():
     2. 自動檢查並修復舊表格的欄位缺失 (Migration)。
     """
     try:
-        print("正在檢查並更新資料庫結構...")
+        logger.info("正在檢查並更新資料庫結構...")
         # 這裡使用同步連線 (psycopg.connect) 因為初始化通常在伺服器啟動前執行一次即可
         with psycopg.connect(DATABASE_URL) as conn:
             with conn.cursor() as cur:
@@ -124,14 +263,20 @@ def init_database():
                 # [修復 users] 檢查 avatar
                 cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='users' AND column_name='avatar'")
                 if not cur.fetchone():
-                    print("--> 檢測到舊版 users 表，正在新增 avatar 與 introduction 欄位...")
+                    logger.info("--> 檢測到舊版 users 表，正在新增 avatar 與 introduction 欄位...")
                     cur.execute("ALTER TABLE users ADD COLUMN avatar VARCHAR(500)")
                     cur.execute("ALTER TABLE users ADD COLUMN introduction TEXT")
 
+                # [修復 users] 檢查 session_version
+                cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='users' AND column_name='session_version'")
+                if not cur.fetchone():
+                    logger.info("--> 檢測到 users 表缺少 session_version，正在新增...")
+                    cur.execute("ALTER TABLE users ADD COLUMN session_version INT NOT NULL DEFAULT 1")
+
                 # [修復 proposals] 檢查 created_at
                 cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='proposals' AND column_name='created_at'")
                 if not cur.fetchone():
-                    print("--> 檢測到 proposals 表缺少 created_at，正在修復...")
+                    logger.info("--> 檢測到 proposals 表缺少 created_at，正在修復...")
                     # 檢查是否有舊名的 submitted_at
                     cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='proposals' AND column_name='submitted_at'")
                     if cur.fetchone():
@@ -142,20 +287,82 @@ def init_database():
                 # [修復 projects] 檢查 budget
                 cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='projects' AND column_name='budget'")
                 if not cur.fetchone():
-                    print("--> 檢測到 projects 表缺少 budget，正在新增...")
+                    logger.info("--> 檢測到 projects 表缺少 budget，正在新增...")
                     cur.execute("ALTER TABLE projects ADD COLUMN budget VARCHAR(100)")
                 
+                # [修復 projects] 檢查 updated_at
+                cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='projects' AND column_name='updated_at'")
+                if not cur.fetchone():
+                    logger.info("--> 檢測到 projects 表缺少 updated_at，正在新增...")
+                    cur.execute("ALTER TABLE projects ADD COLUMN updated_at TIMESTAMPTZ DEFAULT NOW()")
+
+                # 統計彙總用：找出水位線之後有變動的專案 / 新提案 (欄位可能是上面才補上的，所以不放在 INIT_SQL)
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_projects_updated ON projects(updated_at)")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_proposals_created ON proposals(created_at)")
+
+                # [修復 projects] 檢查 awarded_at (觸發器會用到，必須在建立觸發器之前)
+                cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='projects' AND column_name='awarded_at'")
+                if not cur.fetchone():
+                    logger.info("--> 檢測到 projects 表缺少 awarded_at，正在新增...")
+                    cur.execute("ALTER TABLE projects ADD COLUMN awarded_at TIMESTAMPTZ")
+
+                # [修復 project_status] 新增 expired (提案截止後由排程自動設定)
+                # 注意：新增的 Enum 值在同一個交易內不能使用，所以這裡只新增、不引用
+                cur.execute("ALTER TYPE project_status ADD VALUE IF NOT EXISTS 'expired'")
+
+                # projects 任何 UPDATE 都自動刷新 updated_at (不論是哪個路由改的)
+                cur.execute(PROJECTS_UPDATED_AT_TRIGGER_SQL)
+
                 # [修復 project_files] 檢查 version (新增)
                 cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='project_files' AND column_name='version'")
                 if not cur.fetchone():
-                    print("--> 檢測到 project_files 表缺少 version，正在新增...")
+                    logger.info("--> 檢測到 project_files 表缺少 version，正在新增...")
                     cur.execute("ALTER TABLE project_files ADD COLUMN version INT NOT NULL DEFAULT 1")
                     cur.execute("ALTER TABLE project_files ADD COLUMN description TEXT")
 
+                # [修復 reviews] 舊索引已被 idx_reviews_reviewee_created 取代
+                cur.execute("DROP INDEX IF EXISTS idx_reviews_reviewee")
+
+                # [修復 user_rating_stats] 統計表是後來才加的：舊資料庫的評價不在統計裡 (或只累加了新評價)，
+                # 評價總數對不上就從 reviews 整份重建，不必手動執行 python rating_stats.py --rebuild
+                cur.execute(
+                    "SELECT (SELECT COUNT(*) FROM reviews) AS reviews, "
+                    "(SELECT COALESCE(SUM(review_count), 0) FROM user_rating_stats) AS counted"
+                )
+                reviews, counted = cur.fetchone()
+                if reviews != counted:
+                    logger.info("--> 評分統計與 reviews 不一致 (%d / %d 則)，正在重建...", counted, reviews)
+                    rebuild_rating_stats(cur)
+
+                # [修復 jobs] 檢查 dedupe_key
+                cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='jobs' AND column_name='dedupe_key'")
+                if not cur.fetchone():
+                    logger.info("--> 檢測到 jobs 表缺少 dedupe_key，正在新增...")
+                    cur.execute("ALTER TABLE jobs ADD COLUMN dedupe_key VARCHAR(200)")
+                cur.execute(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs(dedupe_key) "
+                    "WHERE status IN ('queued', 'running')"
+                )
+
+                # [修復 notifications] 檢查 email_status (Email 與站內通知分開發送)
+                cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='notifications' AND column_name='email_status'")
+                if not cur.fetchone():
+                    logger.info("--> 檢測到 notifications 表缺少 email_status，正在新增...")
+                    cur.execute("ALTER TABLE notifications ADD COLUMN email_status VARCHAR(20)")
+                    cur.execute("ALTER TABLE notifications ADD COLUMN email_attempts INT NOT NULL DEFAULT 0")
+                    cur.execute("ALTER TABLE notifications ADD COLUMN email_available_at TIMESTAMPTZ NOT NULL DEFAULT NOW()")
+                # 只索引「還沒寄出」的 Email
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_notifications_email_pending ON notifications(email_available_at, id) "
+                    "WHERE email_status = 'pending'"
+                )
+
             conn.commit()
-            print("資料庫初始化/更新完成！")
+            logger.info("資料庫初始化/更新完成！")
     except Exception as e:
-        print(f"資料庫初始化失敗: {e}")
+        logger.error("資料庫初始化失敗: %s", e)
 
 if __name__ == "__main__":
+    from app_logging import setup_logging
+    setup_logging()
     init_database()
\ No newline at end of file
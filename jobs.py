@@ -0,0 +1,278 @@
+# jobs.py
+"""
+背景工作佇列 (以 PostgreSQL 的 jobs 資料表實作，不需要另外架 Redis / RabbitMQ)。
+
+定義工作 (tasks.py)：
+    @job("shrink_avatar", priority=5)
+    async def shrink_avatar(path: str): ...
+
+從路由排入佇列 (與路由的其他寫入在同一個交易；交易 rollback，工作也不會出現)：
+    await shrink_avatar.enqueue(cur, path=avatar_path)
+
+執行工作 (獨立程式，不跟 uvicorn 跑在一起，可以開多個)：
+    python worker.py
+
+認領工作使用 FOR UPDATE SKIP LOCKED：多個 worker 各拿各的，不會重複執行也不會互相等待。
+執行中每 JOB_HEARTBEAT_INTERVAL 秒刷新 locked_at (心跳)；超過 JOB_LOCK_TIMEOUT 沒有心跳才視為 worker 當機。
+失敗時依次數指數延後重試，超過 max_attempts 標記為 failed (保留 last_error 方便排查)。
+
+定期工作 (例如過期專案清理)：@job("expire_projects", every=60)
+worker 啟動時排入第一次，之後每次執行完 (不論成功失敗) 再排入下一次；
+dedupe_key 保證同一時間只會有一筆在等待 / 執行，開多個 worker 也不會重複。
+"""
+import asyncio
+import inspect
+import logging
+import os
+import socket
+import traceback
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from db import DATABASE_URL
+from app_logging import request_id
+from config import (
+    JOB_WORKER_CONCURRENCY, JOB_POLL_INTERVAL,
+    JOB_LOCK_TIMEOUT, JOB_HEARTBEAT_INTERVAL, JOB_RETRY_BASE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# --- 1. 工作註冊 ---
+
+# 名稱 -> Job；worker 依 jobs.name 找到要執行的函式
+JOB_REGISTRY: dict[str, "Job"] = {}
+
+
+class Job:
+    """
+    被 @job 裝飾後的工作函式。
+    直接呼叫 = 立即執行 (測試 / 管理指令用)；.enqueue(cur, ...) = 排入佇列。
+    """
+    def __init__(self, func, name: str, queue: str, priority: int, max_attempts: int, every: int | None):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.every = every  # 定期工作的間隔秒數 (None = 一般工作)
+        self.__doc__ = func.__doc__
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    async def enqueue(self, cur, *, delay: int = 0, priority: int | None = None,
+                      dedupe_key: str | None = None, **kwargs) -> int | None:
+        """
+        排入佇列 (在呼叫端的交易內執行)。參數必須能轉成 JSON。
+
+        參數:
+        - delay: 幾秒後才開始執行
+        - priority: 覆寫預設優先度 (數字越大越優先)
+        - dedupe_key: 已有相同 key 的工作在等待 / 執行中時不重複排入 (回傳 None)
+        """
+        await cur.execute(
+            """
+            INSERT INTO jobs (queue, name, args, priority, max_attempts, run_at, dedupe_key)
+            VALUES (%s, %s, %s, %s, %s, NOW() + make_interval(secs => %s), %s)
+            ON CONFLICT (dedupe_key) WHERE status IN ('queued', 'running') DO NOTHING
+            RETURNING id
+            """,
+            (self.queue, self.name, Jsonb(kwargs),
+             self.priority if priority is None else priority, self.max_attempts, delay, dedupe_key)
+        )
+        row = await cur.fetchone()
+        return row["id"] if row else None
+
+    async def schedule_next(self, cur, delay: int):
+        """
+        定期工作：排入下一次執行 (已經有一筆在等待就略過)。
+        """
+        await self.enqueue(cur, delay=delay, dedupe_key=f"periodic:{self.name}")
+
+    async def run(self, args: dict):
+        # 支援 async def 與一般 def；同步函式 (例如 Pillow 縮圖) 丟到執行緒，避免卡住其他工作
+        if inspect.iscoroutinefunction(self.func):
+            return await self.func(**args)
+        return await asyncio.to_thread(self.func, **args)
+
+
+def job(name: str | None = None, *, queue: str = "default", priority: int = 0,
+        max_attempts: int = 5, every: int | None = None):
+    """
+    註冊背景工作的裝飾器。every 有值時為定期工作 (每 every 秒執行一次，不接受參數)。
+    """
+    def decorator(func):
+        job_name = name or func.__name__
+        if job_name in JOB_REGISTRY:
+            raise ValueError(f"Job '{job_name}' is already registered")
+        wrapped = Job(func, job_name, queue, priority, max_attempts, every)
+        JOB_REGISTRY[job_name] = wrapped
+        return wrapped
+    return decorator
+
+
+# --- 2. Worker ---
+
+async def claim_job(conn, worker_id: str, queues: list[str]) -> dict | None:
+    """
+    認領一個可以執行的工作 (優先度高的先、同優先度先到先做)。
+    """
+    async with conn.cursor() as cur:
+        await cur.execute(
+            """
+            UPDATE jobs
+            SET status = 'running', locked_at = NOW(), locked_by = %s, attempts = attempts + 1
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE status = 'queued' AND queue = ANY(%s) AND run_at <= NOW()
+                ORDER BY priority DESC, run_at, id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, name, args, attempts, max_attempts
+            """,
+            (worker_id, queues)
+        )
+        return await cur.fetchone()
+
+
+async def finish_job(conn, job_row: dict, error: str | None):
+    async with conn.cursor() as cur:
+        if error is None:
+            await cur.execute(
+                "UPDATE jobs SET status = 'done', finished_at = NOW(), locked_at = NULL, last_error = NULL WHERE id = %s",
+                (job_row["id"],)
+            )
+        elif job_row["attempts"] >= job_row["max_attempts"]:
+            await cur.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = NOW(), locked_at = NULL, last_error = %s WHERE id = %s",
+                (error, job_row["id"])
+            )
+        else:
+            # 指數退避：base, base*2, base*4 ...
+            backoff = JOB_RETRY_BASE_SECONDS * 2 ** (job_row["attempts"] - 1)
+            await cur.execute(
+                """
+                UPDATE jobs
+                SET status = 'queued', locked_at = NULL, locked_by = NULL, last_error = %s,
+                    run_at = NOW() + make_interval(secs => %s)
+                WHERE id = %s
+                """,
+                (error, backoff, job_row["id"])
+            )
+            return
+
+        # 定期工作：這一次結束了 (成功或放棄)，排入下一次
+        registered = JOB_REGISTRY.get(job_row["name"])
+        if registered and registered.every:
+            await registered.schedule_next(cur, registered.every)
+
+
+async def heartbeat(conn, job_id: int, worker_id: str, stop: asyncio.Event):
+    """
+    工作執行期間定期刷新 locked_at，執行很久的工作才不會被 requeue_stale_jobs 當成當機而重複執行。
+    用 stop 結束 (不用 cancel，避免打斷執行到一半的 SQL)。
+    """
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=JOB_HEARTBEAT_INTERVAL)
+        except asyncio.TimeoutError:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "UPDATE jobs SET locked_at = NOW() WHERE id = %s AND locked_by = %s AND status = 'running'",
+                    (job_id, worker_id)
+                )
+
+
+async def requeue_stale_jobs(conn) -> int:
+    """
+    worker 當機 / 被 kill 時，它手上的工作會一直停在 running (心跳也停了)；
+    超過 JOB_LOCK_TIMEOUT 秒沒有心跳的工作重新排入佇列 (已算過一次嘗試次數)。
+    次數用完而標記為 failed 的定期工作，與 finish_job 一樣排入下一次，定期工作才不會就此停擺。
+    """
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                    finished_at = CASE WHEN attempts >= max_attempts THEN NOW() END,
+                    locked_at = NULL, locked_by = NULL, last_error = 'lock timeout'
+                WHERE status = 'running' AND locked_at < NOW() - make_interval(secs => %s)
+                RETURNING name, status
+                """,
+                (JOB_LOCK_TIMEOUT,)
+            )
+            stale = await cur.fetchall()
+            for row in stale:
+                registered = JOB_REGISTRY.get(row["name"])
+                if row["status"] == "failed" and registered and registered.every:
+                    await registered.schedule_next(cur, registered.every)
+        return len(stale)
+
+
+async def _worker_loop(slot: int, worker_id: str, queues: list[str]):
+    """
+    單一執行槽：自己一條連線，認領 -> 執行 -> 回報，沒工作就休息。
+    """
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                DATABASE_URL, row_factory=dict_row, autocommit=True
+            ) as conn:
+                while True:
+                    if slot == 0:
+                        stale = await requeue_stale_jobs(conn)
+                        if stale:
+                            logger.warning("已重新排入 %d 個逾時工作", stale)
+
+                    job_row = await claim_job(conn, worker_id, queues)
+                    if job_row is None:
+                        await asyncio.sleep(JOB_POLL_INTERVAL)
+                        continue
+
+                    registered = JOB_REGISTRY.get(job_row["name"])
+                    error = None
+                    if registered is None:
+                        error = f"Unknown job: {job_row['name']}"
+                    else:
+                        # 工作執行期間的日誌都帶 job-<id>，方便對照
+                        token = request_id.set(f"job-{job_row['id']}")
+                        stop = asyncio.Event()
+                        beat = asyncio.create_task(heartbeat(conn, job_row["id"], worker_id, stop))
+                        try:
+                            await registered.run(job_row["args"])
+                        except Exception:
+                            error = traceback.format_exc(limit=5)
+                        finally:
+                            stop.set()
+                            await beat
+                            request_id.reset(token)
+                    if error:
+                        logger.error("工作失敗 #%s %s (第 %s 次)", job_row["id"], job_row["name"], job_row["attempts"],
+                                     extra={"job_id": job_row["id"], "error": error})
+                    await finish_job(conn, job_row, error)
+        except (psycopg.OperationalError, psycopg.InterfaceError) as e:
+            logger.warning("資料庫連線中斷: %s，5 秒後重新連線...", e)
+            await asyncio.sleep(5)
+
+
+async def run_worker(queues: list[str] | None = None, concurrency: int = JOB_WORKER_CONCURRENCY):
+    """
+    worker 主程式：開 concurrency 個執行槽同時處理工作。
+    """
+    queues = queues or sorted({j.queue for j in JOB_REGISTRY.values()}) or ["default"]
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info("背景工作 worker 啟動 (%s) queues=%s concurrency=%s", worker_id, queues, concurrency)
+    logger.info("已註冊工作: %s", ", ".join(sorted(JOB_REGISTRY)))
+
+    # 定期工作排入第一次 (其他 worker 已經排過就會被 dedupe_key 擋下)
+    periodic = [j for j in JOB_REGISTRY.values() if j.every and j.queue in queues]
+    if periodic:
+        async with await psycopg.AsyncConnection.connect(DATABASE_URL, row_factory=dict_row, autocommit=True) as conn:
+            async with conn.cursor() as cur:
+                for j in periodic:
+                    await j.schedule_next(cur, 0)
+
+    await asyncio.gather(*(_worker_loop(i, worker_id, queues) for i in range(concurrency)))
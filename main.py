@@ -1,11 +1,22 @@
 from fastapi import FastAPI, Depends, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 from psycopg_pool import AsyncConnectionPool
-from db import getDB # 匯入資料庫連線依賴函式
-import os
+from app_logging import setup_logging, RequestIdMiddleware
+from db import getDB, add_query_hook # 匯入資料庫連線依賴函式 / 查詢監聽
+from config import (
+    SECRET_KEY, FILE_SERVING_MODE, TEMPLATE_PRECOMPILE,
+    METRICS_ENABLED, METRICS_TOKEN, IS_PRODUCTION, QUERY_TRACE_ENABLED, SLOW_QUERY_LOG_ENABLED,
+)
+from templating import templates, precompile_templates
+from static_assets import PrecompressedStaticFiles
+import logging
+
+# --- 0. 日誌 ---
+# 所有模組的 logger 都經過佇列，由背景執行緒輸出 (見 app_logging.py)
+setup_logging()
+logger = logging.getLogger("main")
 
 # --- 1. 資料庫初始化 ---
 from init_db import init_database
@@ -20,29 +31,61 @@ app = FastAPI()
 # --- 3. 掛載靜態檔案 ---
 # 讓瀏覽器可以讀取 CSS, JS, 圖片等靜態資源
 # 例如：HTML 裡的 <link href="/static/style.css"> 會對應到專案的 static 資料夾
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# 使用 PrecompressedStaticFiles：優先回傳 build_assets.py 預先壓縮的 .br / .gz，
+# static/dist/ 底下帶雜湊的檔案會加上 Cache-Control: immutable
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 
 # 掛載上傳檔案目錄
 # 讓使用者上傳的頭像或檔案可以透過 URL 被讀取
 # 例如：<img src="/uploads/avatars/..."> 會對應到 uploads 資料夾
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# 只有開發模式 (direct) 由 Python 直接送檔；其他模式改由 routes/files.py 回傳
+# X-Accel-Redirect / X-Sendfile，交給反向代理處理
+if FILE_SERVING_MODE == "direct":
+    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 # --- 4. 設定樣板引擎 ---
 # 指定 HTML 檔案都放在 "templates" 資料夾內
 # Jinja2 讓我們可以在 HTML 裡面寫變數，例如 {{ user.username }}
-templates = Jinja2Templates(directory="templates")
+# templates 統一由 templating.py 建立 (全站共用一個環境 + bytecode 快取)
+# 正式環境啟動時先把所有樣板編譯好，第一個請求就不會特別慢
+if TEMPLATE_PRECOMPILE:
+    elapsed = precompile_templates()
+    logger.info("樣板預先編譯完成 (%.1f ms)", elapsed * 1000)
 
 # --- 5. 設定 Session (登入狀態管理) ---
 # Session 用來像餅乾(Cookie)一樣記住使用者的登入狀態
 app.add_middleware(
     SessionMiddleware,
     # SECRET_KEY 是加密用的鑰匙，正式上線時建議改用環境變數讀取
-    secret_key=os.getenv("SECRET_KEY", "a_very_secret_key_please_change_me"), 
+    secret_key=SECRET_KEY, 
     max_age=86400,  # 登入狀態維持 1 天 (86400秒)
     same_site="lax", # 防止 CSRF 攻擊的設定
     https_only=False, # 本地開發設為 False，正式上線有 HTTPS 時應設為 True
 )
 
+# --- 5-1. 查詢追蹤 / N+1 偵測 (query_trace.py) ---
+# 加在監控指標之前 (比較內層)：測試模式下 N+1 改回 500 時，監控指標記到的也是 500
+if QUERY_TRACE_ENABLED:
+    from query_trace import QueryTraceMiddleware, record_query
+    app.add_middleware(QueryTraceMiddleware)
+    add_query_hook(record_query)
+
+# --- 5-2. 監控指標 (Prometheus) ---
+# 最後加入的 middleware 在最外層，量到的延遲包含 Session 解碼等所有處理
+if METRICS_ENABLED:
+    from metrics import MetricsMiddleware, observe_query
+    app.add_middleware(MetricsMiddleware)
+    add_query_hook(observe_query) # 每條 SQL 的執行時間
+
+# --- 5-3. 慢查詢紀錄 + 自動 EXPLAIN (slow_query.py) ---
+if SLOW_QUERY_LOG_ENABLED:
+    from slow_query import record_slow_query
+    add_query_hook(record_slow_query)
+
+# --- 5-4. Request ID ---
+# 放在最外層：之後所有 middleware、路由與查詢監聽的日誌都帶有同一個 request_id
+app.add_middleware(RequestIdMiddleware)
+
 # --- 6. 匯入各個功能的路由 (Router) ---
 # 我們把不同功能拆到不同檔案，避免 main.py 太長
 from routes.auth import router as auth_router, get_current_user
@@ -51,16 +94,37 @@ from routes.contractor import router as contractor_router
 from routes.users import router as users_router # 使用者個人檔案與評價功能
 from routes.support import router as support_router # 客服頁面
 from routes.ai import router as ai_router # AI 小助手功能
+from routes.files import router as files_router, public_router as public_files_router # 檔案下載
+from routes.api import router as api_router # JSON API (v1)：給手機 App 與前端局部更新使用
+from routes.events import router as events_router # 即時事件 (SSE)
+from routes.metrics import router as metrics_router # Prometheus 監控指標
+from routes.exports import router as exports_router # 委託人專案歷史匯出 (CSV / XLSX)
+from routes.admin import router as admin_router # 管理後台 (平台統計)
+from routes.rating import router as rating_router # 評價提交、接案人評分預覽與排行榜
 
 # --- 7. 註冊路由到主程式 ---
 # prefix 表示網址的前綴
 # 例如 client_router 的功能都會在 http://網站/client/... 底下
 app.include_router(auth_router) # 登入註冊 (無前綴)
 app.include_router(client_router, prefix="/client")
+app.include_router(exports_router, prefix="/client") # /client/export/...
 app.include_router(contractor_router, prefix="/contractor")
 app.include_router(users_router, prefix="/users")
 app.include_router(support_router) # 客服 (無前綴)
 app.include_router(ai_router, prefix="/api/ai") # AI API
+app.include_router(api_router, prefix="/api/v1") # JSON API (與 HTML 頁面共用查詢函式)
+app.include_router(events_router) # 即時事件串流 (無前綴)
+app.include_router(admin_router, prefix="/admin") # 管理後台
+app.include_router(rating_router) # /ratings、/contractors/... (無前綴)
+app.include_router(files_router) # 簽章下載 (無前綴)
+if METRICS_ENABLED:
+    # 正式環境沒設定 METRICS_TOKEN 時不開放：路由清單、連線池狀態、AI 用量都不該公開
+    if IS_PRODUCTION and not METRICS_TOKEN:
+        logger.warning("正式環境未設定 METRICS_TOKEN，不開放 /metrics (指標仍會收集)")
+    else:
+        app.include_router(metrics_router) # /metrics
+if FILE_SERVING_MODE != "direct":
+    app.include_router(public_files_router) # /uploads 改由反向代理送檔
 
 # --- 8. 首頁路由邏輯 ---
 @app.get("/")
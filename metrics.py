@@ -0,0 +1,242 @@
+# metrics.py
+"""
+Prometheus 監控指標 (GET /metrics，格式為 Prometheus text exposition 0.0.4)
+
+- 路由：每個路由的延遲分布 (histogram) 與狀態碼次數
+- 資料庫：連線池大小 / 排隊數 / 借用連線等待時間、每條查詢的執行時間
+- 上傳：位元組數、耗時、速度
+- AI：每個模型 (MODEL_CANDIDATES) 的呼叫延遲與錯誤次數
+
+為什麼不用 prometheus_client：
+它的每個指標都帶一把 threading.Lock。本專案的請求、查詢與樣板渲染都在 event loop 的同一條執行緒上，
+根本不會同時寫入同一個指標，所以這裡直接用 dict / list 記錄，熱路徑上只有幾次加法，不拿任何鎖。
+(跟 fragment_cache.py 一樣的前提：不要在其他執行緒裡呼叫 inc / observe。)
+
+注意：數值是「每個 worker 各自一份」。uvicorn 開多個 worker 時，請讓 Prometheus 分別抓取每個 worker
+(例如每個 worker 監聽不同 port)，或只在單一 worker 的部署上使用。
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# 延遲類指標的預設分界 (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 單條 SQL 通常比整個請求快很多，分界往下延伸
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+# --- 1. 指標類型 ---
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [各分界的次數 (最後一格是 +Inf), 總和, 次數]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+# --- 2. 指標定義 ---
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status code", ("method", "route", "status"))
+HTTP_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ("operation", "route"), QUERY_BUCKETS
+)
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "SQL statements that raised an error", ("operation", "route"))
+DB_CHECKOUT_DURATION = Histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a pool connection in getDB", (), QUERY_BUCKETS
+)
+# 連線池目前狀態 (抓取時才讀取，不佔熱路徑)
+DB_POOL = Gauge("db_pool", "AsyncConnectionPool statistics (psycopg_pool get_stats)", ("stat",))
+
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes written by file uploads", ("kind",))
+UPLOAD_DURATION = Histogram("upload_duration_seconds", "Time to write an uploaded file", ("kind",))
+UPLOAD_THROUGHPUT = Histogram(
+    "upload_throughput_bytes_per_second", "Per-upload write throughput", ("kind",),
+    (64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6),
+)
+
+AI_DURATION = Histogram(
+    "ai_request_duration_seconds", "AI model call latency", ("model",),
+    (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0),
+)
+AI_REQUESTS = Counter("ai_requests_total", "AI model calls by outcome", ("model", "outcome"))
+
+REGISTRY = [
+    HTTP_REQUESTS, HTTP_DURATION,
+    DB_QUERY_DURATION, DB_QUERY_ERRORS, DB_CHECKOUT_DURATION, DB_POOL,
+    UPLOAD_BYTES, UPLOAD_DURATION, UPLOAD_THROUGHPUT,
+    AI_DURATION, AI_REQUESTS,
+]
+
+# 抓取 /metrics 時才執行的函式 (例如讀取連線池狀態)
+_collectors: list = []
+
+
+def add_collector(func):
+    _collectors.append(func)
+
+
+def render_metrics() -> str:
+    for collect in _collectors:
+        collect()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- 3. 記錄用的小工具 (給其他模組呼叫) ---
+
+# 目前請求的 ASGI scope (查詢指標要知道是哪個路由發出的)
+current_scope: ContextVar[dict | None] = ContextVar("current_scope", default=None)
+
+
+def route_label(scope: dict | None) -> str:
+    """
+    路由樣板 (例如 /client/project/{project_id})，而不是實際網址，避免每個 ID 都變成一組新的標籤。
+    """
+    if scope is None:
+        return "<background>"
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    # Mount (例如 /static) 不會寫入 route，但會把掛載路徑接到 root_path 後面
+    mount_path = scope.get("root_path", "")[len(scope.get("app_root_path", "")):]
+    if "endpoint" in scope and mount_path:
+        return mount_path
+    return "<unmatched>"
+
+
+def sql_operation(query) -> str:
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    if not isinstance(query, str):
+        return "OTHER"
+    stripped = query.lstrip()
+    return stripped[:stripped.find(" ")].upper() if " " in stripped else stripped.upper()
+
+
+def observe_query(query, params, duration: float, rowcount: int, error: BaseException | None):
+    """
+    db.py 的查詢監聽 (每條 SQL 執行完呼叫一次)。
+    """
+    labels = (sql_operation(query), route_label(current_scope.get()))
+    DB_QUERY_DURATION.observe(duration, *labels)
+    if error is not None:
+        DB_QUERY_ERRORS.inc(*labels)
+
+
+def record_upload(kind: str, size: int, duration: float):
+    UPLOAD_BYTES.inc(kind, amount=size)
+    UPLOAD_DURATION.observe(duration, kind)
+    if duration > 0:
+        UPLOAD_THROUGHPUT.observe(size / duration, kind)
+
+
+def record_ai_call(model: str, duration: float, outcome: str):
+    """
+    outcome: "success" 或錯誤代碼 (例如 "429")。
+    """
+    AI_REQUESTS.inc(model, outcome)
+    if outcome == "success":
+        AI_DURATION.observe(duration, model)
+
+
+# --- 4. ASGI Middleware ---
+
+class MetricsMiddleware:
+    """
+    純 ASGI middleware (不用 BaseHTTPMiddleware：那個會多包一層 task，也會影響串流回應)。
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_code = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for key, value in message.get("headers", ()):
+                    if key == b"content-type" and value.startswith(b"text/event-stream"):
+                        streaming = True  # SSE 連線會開好幾分鐘，不計入延遲分布
+            await send(message)
+
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_scope.reset(token)
+            route = route_label(scope)
+            HTTP_REQUESTS.inc(scope["method"], route, str(status_code))
+            if not streaming:
+                HTTP_DURATION.observe(time.perf_counter() - start, scope["method"], route)
@@ -0,0 +1,230 @@
+# outbox.py
+"""
+通知寄件匣 (Transactional Outbox) 與批次發送程式。
+
+寫入端 (路由)：
+    await enqueue_outbox(cur, recipient_id, "proposal_received", {...})
+    與狀態變更在同一個交易裡；交易 rollback，通知也不會出現。
+
+發送端 (獨立程式，不跟 uvicorn 跑在一起)：
+    python outbox.py
+
+每一輪用 FOR UPDATE SKIP LOCKED 認領一批事件 (可以同時開多個發送程式，不會重複發送)，
+同一位使用者的多個事件合併成「一則摘要」，寫入站內通知。
+Email 是另一段：站內通知先 commit (email_status = 'pending')，再由 send_pending_emails 寄出，
+SMTP 失敗只重試 Email，不會連站內通知一起 rollback 掉。
+"""
+import asyncio
+import logging
+import smtplib
+from email.message import EmailMessage
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from db import DATABASE_URL
+from config import (
+    OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_ATTEMPTS,
+    SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_FROM,
+)
+
+logger = logging.getLogger(__name__)
+
+# --- 1. 寫入端 ---
+
+async def enqueue_outbox(cur, recipient_id: int, event_type: str, payload: dict):
+    """
+    新增一筆待發送的通知事件 (在呼叫端的交易內執行)。
+    """
+    await cur.execute(
+        "INSERT INTO outbox (recipient_id, event_type, payload) VALUES (%s, %s, %s)",
+        (recipient_id, event_type, Jsonb(payload))
+    )
+
+
+# --- 2. 事件 -> 文字 ---
+
+STATUS_LABELS = {
+    "open": "開放提案",
+    "in_progress": "執行中",
+    "pending_approval": "待驗收",
+    "completed": "已結案",
+    "rejected": "已退件",
+    "expired": "提案已截止 (仍可從收到的提案中選擇)",
+}
+
+def describe_event(event_type: str, payload: dict) -> str:
+    """
+    把單一事件轉成一行說明文字。
+    """
+    title = payload.get("title", "")
+    if event_type == "proposal_received":
+        return f"「{title}」收到新的提案 (報價 ${payload.get('quote')})"
+    if event_type == "deliverable_uploaded":
+        return f"「{title}」有新的交付檔案 ({payload.get('filename')})，等待您驗收"
+    if event_type == "project_status":
+        status = STATUS_LABELS.get(payload.get("status"), payload.get("status"))
+        return f"「{title}」狀態變更為：{status}"
+    return f"{event_type}: {title}"
+
+
+def build_digest(events: list[dict]) -> tuple[str, str]:
+    """
+    把同一位使用者的多個事件合併成一則摘要。
+
+    回傳:
+    - (標題, 內文)
+    """
+    lines = [describe_event(e["event_type"], e["payload"]) for e in events]
+    if len(lines) == 1:
+        return lines[0], lines[0]
+    return f"您有 {len(lines)} 則新動態", "\n".join(f"• {line}" for line in lines)
+
+
+# --- 3. 發送端 ---
+
+def _send_email_sync(to_address: str, subject: str, body: str):
+    msg = EmailMessage()
+    msg["From"] = SMTP_FROM
+    msg["To"] = to_address
+    msg["Subject"] = f"[工作委託平台] {subject}"
+    msg.set_content(body)
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as smtp:
+        smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        smtp.send_message(msg)
+
+
+async def dispatch_batch(conn) -> int:
+    """
+    認領並發送一批事件，回傳處理的事件數 (0 表示目前沒有待發送事件)。
+    """
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            # A. 認領一批事件：SKIP LOCKED 讓多個發送程式各拿各的，不會互相等待或重複發送
+            await cur.execute(
+                """
+                SELECT o.id, o.recipient_id, o.event_type, o.payload, o.attempts, u.email
+                FROM outbox o
+                JOIN users u ON o.recipient_id = u.id
+                WHERE o.processed_at IS NULL AND o.available_at <= NOW()
+                ORDER BY o.id
+                LIMIT %s
+                FOR UPDATE OF o SKIP LOCKED
+                """,
+                (OUTBOX_BATCH_SIZE,)
+            )
+            rows = await cur.fetchall()
+            if not rows:
+                return 0
+
+            # B. 依收件人分組
+            by_user: dict[int, list[dict]] = {}
+            for row in rows:
+                by_user.setdefault(row["recipient_id"], []).append(row)
+
+            # C. 每位使用者產生一則摘要
+            for user_id, events in by_user.items():
+                ids = [e["id"] for e in events]
+                title, body = build_digest(events)
+                # Email (選用) 先記成 pending，commit 之後由 send_pending_emails 寄出
+                email_status = "pending" if SMTP_HOST and events[0]["email"] else None
+                try:
+                    # 巢狀 transaction = SAVEPOINT：某位使用者失敗時只回滾他那一段，不影響整批
+                    async with conn.transaction():
+                        # 站內通知 (與標記已處理在同一個交易，保證不會重複)
+                        await cur.execute(
+                            """
+                            INSERT INTO notifications (user_id, title, body, event_count, email_status)
+                            VALUES (%s, %s, %s, %s, %s)
+                            """,
+                            (user_id, title, body, len(events), email_status)
+                        )
+                        await cur.execute("UPDATE outbox SET processed_at = NOW() WHERE id = ANY(%s)", (ids,))
+                except Exception as e:
+                    logger.warning("通知發送失敗 (user %s): %s", user_id, e)
+                    # 失敗：次數 +1，依次數延後重試；超過上限就放棄 (標記為已處理)
+                    await cur.execute(
+                        """
+                        UPDATE outbox
+                        SET attempts = attempts + 1,
+                            available_at = NOW() + (INTERVAL '30 seconds' * POWER(2, attempts)),
+                            processed_at = CASE WHEN attempts + 1 >= %s THEN NOW() END
+                        WHERE id = ANY(%s)
+                        """,
+                        (OUTBOX_MAX_ATTEMPTS, ids)
+                    )
+
+            return len(rows)
+
+
+async def send_pending_emails(conn) -> int:
+    """
+    寄出一批 email_status = 'pending' 的通知，回傳處理的筆數。
+    失敗只影響 Email：次數 +1、依次數延後重試，超過 OUTBOX_MAX_ATTEMPTS 標記為 failed。
+    """
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT n.id, n.title, n.body, u.email
+                FROM notifications n
+                JOIN users u ON n.user_id = u.id
+                WHERE n.email_status = 'pending' AND n.email_available_at <= NOW()
+                ORDER BY n.email_available_at, n.id
+                LIMIT %s
+                FOR UPDATE OF n SKIP LOCKED
+                """,
+                (OUTBOX_BATCH_SIZE,)
+            )
+            rows = await cur.fetchall()
+
+            for row in rows:
+                try:
+                    # smtplib 是同步 I/O，丟到執行緒執行
+                    await asyncio.to_thread(_send_email_sync, row["email"], row["title"], row["body"])
+                except Exception as e:
+                    logger.warning("Email 發送失敗 (notification %s): %s", row["id"], e)
+                    await cur.execute(
+                        """
+                        UPDATE notifications
+                        SET email_attempts = email_attempts + 1,
+                            email_available_at = NOW() + (INTERVAL '30 seconds' * POWER(2, email_attempts)),
+                            email_status = CASE WHEN email_attempts + 1 >= %s THEN 'failed' ELSE 'pending' END
+                        WHERE id = %s
+                        """,
+                        (OUTBOX_MAX_ATTEMPTS, row["id"])
+                    )
+                else:
+                    await cur.execute("UPDATE notifications SET email_status = 'sent' WHERE id = %s", (row["id"],))
+
+            return len(rows)
+
+
+async def run_dispatcher():
+    """
+    發送程式主迴圈：有事件就連續處理，沒事件就休息 OUTBOX_POLL_INTERVAL 秒。
+    休息的這段時間內累積的事件，下一輪會被合併成同一則摘要。
+    """
+    logger.info("通知發送程式啟動 (Outbox dispatcher)...")
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(DATABASE_URL, row_factory=dict_row) as conn:
+                while True:
+                    processed = await dispatch_batch(conn)
+                    if processed:
+                        logger.info("已處理 %d 筆通知事件", processed)
+                    emailed = await send_pending_emails(conn) if SMTP_HOST else 0
+                    if emailed:
+                        logger.info("已處理 %d 封 Email", emailed)
+                    if processed < OUTBOX_BATCH_SIZE and emailed < OUTBOX_BATCH_SIZE:
+                        await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+        except (psycopg.OperationalError, psycopg.InterfaceError) as e:
+            logger.warning("資料庫連線中斷: %s，5 秒後重新連線...", e)
+            await asyncio.sleep(5)
+
+
+if __name__ == "__main__":
+    from app_logging import setup_logging
+    setup_logging()
+    asyncio.run(run_dispatcher())
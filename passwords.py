@@ -0,0 +1,122 @@
+# passwords.py
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    PASSWORD_HASH_TIME_COST, PASSWORD_HASH_MEMORY_COST,
+    PASSWORD_HASH_PARALLELISM, PASSWORD_HASH_WORKERS,
+)
+
+# --- 1. 套件相容性檢查 ---
+# 優先使用 argon2-cffi (pip install argon2-cffi)。
+# 如果環境沒有安裝，就降級使用 Python 內建的 hashlib.scrypt，至少不會是明碼。
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import VerifyMismatchError, InvalidHashError
+    HAS_ARGON2 = True
+except ImportError:
+    HAS_ARGON2 = False
+
+# --- 2. 專用執行緒池 ---
+# 雜湊是刻意設計成「很慢」的運算 (每次數十毫秒)。
+# 如果直接在 async def 裡呼叫，會卡住整個 event loop，其他使用者的請求全部要排隊。
+# 所以丟到獨立的執行緒池執行 (argon2 / scrypt 計算時會釋放 GIL)，
+# 並用 max_workers 限制同時計算的數量：早上 9 點的登入尖峰只會在這裡排隊，不會拖垮整個網站。
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwhash")
+
+if HAS_ARGON2:
+    _hasher = PasswordHasher(
+        time_cost=PASSWORD_HASH_TIME_COST,
+        memory_cost=PASSWORD_HASH_MEMORY_COST,
+        parallelism=PASSWORD_HASH_PARALLELISM,
+    )
+
+# scrypt 備援參數 (n 必須是 2 的次方)
+_SCRYPT_N, _SCRYPT_R, _SCRYPT_P = 2 ** 14, 8, 1
+
+
+# --- 3. 同步版本 (在執行緒池裡跑) ---
+
+def _hash_sync(password: str) -> str:
+    if HAS_ARGON2:
+        return _hasher.hash(password)
+
+    # 格式: $scrypt$n=16384,r=8,p=1$<salt>$<hash>
+    salt = os.urandom(16)
+    digest = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=_SCRYPT_N, r=_SCRYPT_R, p=_SCRYPT_P)
+    salt_b64 = base64.b64encode(salt).decode("ascii")
+    hash_b64 = base64.b64encode(digest).decode("ascii")
+    return f"$scrypt$n={_SCRYPT_N},r={_SCRYPT_R},p={_SCRYPT_P}${salt_b64}${hash_b64}"
+
+
+def _verify_scrypt(stored: str, password: str) -> bool:
+    try:
+        _, _, params, salt_b64, hash_b64 = stored.split("$")
+        opts = dict(item.split("=") for item in params.split(","))
+        digest = hashlib.scrypt(
+            password.encode("utf-8"),
+            salt=base64.b64decode(salt_b64),
+            n=int(opts["n"]), r=int(opts["r"]), p=int(opts["p"]),
+        )
+    except (ValueError, KeyError):
+        return False
+    return hmac.compare_digest(digest, base64.b64decode(hash_b64))
+
+
+def _is_hashed(stored: str) -> bool:
+    return stored.startswith("$argon2") or stored.startswith("$scrypt$")
+
+
+def _verify_sync(stored: str, password: str) -> tuple[bool, str | None]:
+    """
+    回傳 (密碼是否正確, 需要更新的新雜湊值 或 None)。
+    """
+    # A. 舊資料：資料庫裡還是明碼 -> 比對成功就順便升級成雜湊
+    if not _is_hashed(stored):
+        if hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8")):
+            return True, _hash_sync(password)
+        return False, None
+
+    # B. Argon2 雜湊
+    if stored.startswith("$argon2"):
+        if not HAS_ARGON2:
+            return False, None
+        try:
+            _hasher.verify(stored, password)
+        except (VerifyMismatchError, InvalidHashError):
+            return False, None
+        # 成本參數調整過 (例如調高 time_cost) -> 重新雜湊
+        if _hasher.check_needs_rehash(stored):
+            return True, _hash_sync(password)
+        return True, None
+
+    # C. scrypt 備援雜湊：之後裝了 argon2 就自動升級
+    if not _verify_scrypt(stored, password):
+        return False, None
+    return True, (_hash_sync(password) if HAS_ARGON2 else None)
+
+
+# --- 4. 非同步介面 (給路由使用) ---
+
+async def hash_password(password: str) -> str:
+    """
+    將密碼雜湊 (在專用執行緒池執行，不阻塞 event loop)。
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _hash_sync, password)
+
+
+async def verify_password(stored: str, password: str) -> tuple[bool, str | None]:
+    """
+    驗證密碼。
+
+    回傳:
+    - (True, None)      : 正確，不需更新
+    - (True, new_hash)  : 正確，但資料庫裡是明碼或舊參數，呼叫端應該寫回 new_hash
+    - (False, None)     : 密碼錯誤
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _verify_sync, stored, password)
@@ -0,0 +1,192 @@
+# project_import.py
+"""
+專案批次匯入 (CSV / JSON)
+
+企業委託人一次建立數十個類似專案時，不必一個一個填 create_project.html：
+1. 解析：CSV (第一列為欄位名稱) 或 JSON 陣列，欄位為 title / description / deadline / budget。
+2. 驗證：以「欄」為單位整批檢查 (預算是否為下拉選單的選項、截止日格式與是否已過、必填與長度)，
+   每一欄只跑一次迴圈，錯誤依列號彙整成報表。
+3. 寫入：同一個交易內，先用 COPY 把資料送進暫存表，再一句 INSERT ... SELECT 寫入 projects。
+   任何一步失敗整批回滾，不會只建立一半。
+
+預設「有任何一列錯誤就整批不匯入」；skip_invalid=True 時只匯入通過驗證的列。
+"""
+import csv
+import io
+import json
+import re
+from datetime import datetime, time as dt_time
+
+from config import PROJECT_IMPORT_MAX_ROWS
+from routes.contractor import BUDGET_RANGES
+
+FIELDS = ("title", "description", "deadline", "budget")
+# CSV 標題也接受中文欄位名稱 (與 create_project.html 的標籤一致)
+FIELD_ALIASES = {
+    "標題": "title", "專案標題": "title",
+    "描述": "description", "需求描述": "description", "專案描述": "description",
+    "截止日": "deadline", "提案截止日期": "deadline",
+    "預算": "budget", "預算範圍": "budget",
+}
+TITLE_MAX_LENGTH = 255  # projects.title 為 VARCHAR(255)
+
+# "5,001 - 10,000" / "5001-10000" / "5,001-10,000" 都視為同一個選項
+_BUDGET_KEYS = {re.sub(r"[\s,]", "", key): key for key in BUDGET_RANGES}
+
+
+class ImportFormatError(ValueError):
+    """整份檔案無法解析 (不是單一列的問題)。"""
+
+
+# --- 1. 解析 ---
+
+def parse_rows(data: bytes, filename: str = "", content_type: str = "") -> list[dict]:
+    """
+    依副檔名 / Content-Type 判斷 CSV 或 JSON，回傳 dict 列表 (值一律是字串或 None)。
+    """
+    try:
+        text = data.decode("utf-8-sig")  # Excel 存的 CSV 開頭常有 BOM
+    except UnicodeDecodeError:
+        raise ImportFormatError("檔案必須是 UTF-8 編碼")
+
+    is_json = filename.lower().endswith(".json") or "json" in content_type or text.lstrip()[:1] in ("[", "{")
+    if is_json:
+        try:
+            payload = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ImportFormatError(f"JSON 格式錯誤 (第 {e.lineno} 行)")
+        if isinstance(payload, dict):
+            payload = payload.get("projects")
+        if not isinstance(payload, list) or not all(isinstance(item, dict) for item in payload):
+            raise ImportFormatError("JSON 必須是專案物件的陣列 (或 {\"projects\": [...]})")
+        rows = payload
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise ImportFormatError("CSV 是空的")
+        reader.fieldnames = [FIELD_ALIASES.get(name.strip(), name.strip().lower()) for name in reader.fieldnames]
+        missing = [field for field in FIELDS if field not in reader.fieldnames]
+        if missing:
+            raise ImportFormatError(f"CSV 缺少欄位: {', '.join(missing)}")
+        rows = list(reader)
+
+    if not rows:
+        raise ImportFormatError("沒有任何資料列")
+    if len(rows) > PROJECT_IMPORT_MAX_ROWS:
+        raise ImportFormatError(f"單次最多匯入 {PROJECT_IMPORT_MAX_ROWS} 筆 (收到 {len(rows)} 筆)")
+
+    return [
+        {field: (None if row.get(field) is None else str(row.get(field)).strip()) for field in FIELDS}
+        for row in rows
+    ]
+
+
+# --- 2. 驗證 (逐欄整批處理) ---
+
+def _parse_deadline(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("/", "-"))
+    except ValueError:
+        return None
+    if len(value) <= 10:  # 只有日期：當天結束前都可以提案
+        parsed = datetime.combine(parsed.date(), dt_time(23, 59))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)  # 與表單一樣存成伺服器當地時間
+    return parsed
+
+
+def validate_rows(rows: list[dict], now: datetime | None = None) -> tuple[list[tuple], list[dict]]:
+    """
+    回傳 (通過驗證的列, 錯誤報表)。
+    通過的列為 (列號, title, description, deadline, budget)，budget 已換成標準選項文字。
+    列號從 1 開始 (CSV 則是不含標題列的第幾筆資料)。
+    """
+    now = now or datetime.now()
+    errors: list[dict] = []
+
+    def add_errors(field: str, bad_indexes, message: str):
+        errors.extend({"row": i + 1, "field": field, "message": message} for i in bad_indexes)
+
+    titles = [row["title"] for row in rows]
+    add_errors("title", [i for i, t in enumerate(titles) if not t], "標題為必填")
+    add_errors("title", [i for i, t in enumerate(titles) if t and len(t) > TITLE_MAX_LENGTH],
+               f"標題不可超過 {TITLE_MAX_LENGTH} 字")
+
+    descriptions = [row["description"] for row in rows]
+    add_errors("description", [i for i, d in enumerate(descriptions) if not d], "需求描述為必填")
+
+    budgets = [_BUDGET_KEYS.get(re.sub(r"[\s,]", "", row["budget"] or "")) for row in rows]
+    add_errors("budget", [i for i, b in enumerate(budgets) if b is None],
+               "預算必須是下列其中之一: " + " / ".join(BUDGET_RANGES))
+
+    deadlines = [_parse_deadline(row["deadline"]) for row in rows]
+    add_errors("deadline", [i for i, d in enumerate(deadlines) if d is None],
+               "截止日格式錯誤 (例如 2025-12-31 或 2025-12-31T18:00)")
+    add_errors("deadline", [i for i, d in enumerate(deadlines) if d is not None and d <= now],
+               "截止日必須晚於現在")
+
+    bad_rows = {error["row"] for error in errors}
+    valid = [
+        (i + 1, titles[i], descriptions[i], deadlines[i], budgets[i])
+        for i in range(len(rows)) if i + 1 not in bad_rows
+    ]
+    errors.sort(key=lambda error: error["row"])
+    return valid, errors
+
+
+# --- 3. 寫入 (COPY -> 暫存表 -> INSERT ... SELECT) ---
+
+async def insert_projects(conn, client_id: int, valid_rows: list[tuple]) -> list[int]:
+    """
+    在同一個交易內寫入所有專案，回傳新專案 id (依列號排序)。
+    暫存表是 TEMP + ON COMMIT DROP，交易結束就消失，不同請求之間互不干擾。
+    """
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                CREATE TEMP TABLE project_import_staging (
+                    row_no INT NOT NULL,
+                    title VARCHAR(255) NOT NULL,
+                    description TEXT NOT NULL,
+                    deadline TIMESTAMPTZ NOT NULL,
+                    budget VARCHAR(100) NOT NULL
+                ) ON COMMIT DROP
+                """
+            )
+            async with cur.copy(
+                "COPY project_import_staging (row_no, title, description, deadline, budget) FROM STDIN"
+            ) as copy:
+                for row in valid_rows:
+                    await copy.write_row(row)
+
+            await cur.execute(
+                """
+                INSERT INTO projects (client_id, title, description, deadline, status, budget)
+                SELECT %s, title, description, deadline, 'open', budget
+                FROM project_import_staging
+                ORDER BY row_no
+                RETURNING id
+                """,
+                (client_id,)
+            )
+            return sorted(r["id"] for r in await cur.fetchall())
+
+
+async def import_projects(conn, client_id: int, rows: list[dict], skip_invalid: bool = False) -> dict:
+    """
+    驗證 + 寫入，回傳報表：
+        {"total": 12, "inserted": 10, "project_ids": [...], "errors": [{"row": 3, "field": "budget", "message": "..."}]}
+    """
+    valid, errors = validate_rows(rows)
+    project_ids: list[int] = []
+    if valid and (skip_invalid or not errors):
+        project_ids = await insert_projects(conn, client_id, valid)
+    return {
+        "total": len(rows),
+        "inserted": len(project_ids),
+        "project_ids": project_ids,
+        "errors": errors,
+    }
@@ -0,0 +1,282 @@
+# query_trace.py
+"""
+請求層級的查詢追蹤 (Query tracing) 與 N+1 偵測
+
+QueryTraceMiddleware 在每個 HTTP 請求開始時開一份追蹤，請求結束時收尾：
+- 每條 SQL 的耗時、回傳筆數都記成一個 span，掛在請求 (根 span) 底下；
+  程式裡也可以用 `with span("render"):` 包住一段處理，期間的查詢會掛在那個 span 底下。
+- 同一種 SQL (把常數換成 ? 之後相同) 在一個請求內執行超過 QUERY_TRACE_N_PLUS_ONE_THRESHOLD 次，
+  視為 N+1 (在迴圈裡逐筆查詢)：一般環境印出警告；測試模式 (QUERY_TRACE_STRICT) 在回應開始送出
+  (http.response.start) 之前拋出 NPlusOneError，用戶端收到的是 500，不是原本的回應。
+  不放在 getDB 的 yield 之後檢查：那段程式碼在回應送出後才執行，拋錯也改變不了已經送出的 200。
+- 有設定 QUERY_TRACE_EXPORT_PATH 時，整棵 span tree 以一行 JSON 附加到該檔案 (寫檔在執行緒池進行)。
+
+參數 (params) 可能含有個資，不會寫進追蹤紀錄。
+"""
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from config import QUERY_TRACE_N_PLUS_ONE_THRESHOLD, QUERY_TRACE_STRICT, QUERY_TRACE_EXPORT_PATH
+from app_logging import request_id
+from metrics import route_label
+
+logger = logging.getLogger(__name__)
+
+# 單一請求最多保留幾個查詢 span (N+1 很嚴重時可能有上萬條，只統計次數不再保留細節)
+MAX_QUERY_SPANS = 500
+
+
+class NPlusOneError(RuntimeError):
+    """測試模式下偵測到 N+1 查詢時拋出。"""
+
+
+# --- 1. SQL 正規化 ---
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def _normalize(query: str) -> str:
+    query = _STRING_LITERAL.sub("?", query)
+    query = _NUMBER_LITERAL.sub("?", query)
+    query = _PLACEHOLDER_LIST.sub("(...)", query)  # IN (%s, %s, %s) 不因筆數不同而算成不同的 SQL
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def normalize_sql(query) -> str:
+    """
+    把 SQL 中的常數換成 ?，用來判斷「是不是同一種查詢」。
+    f-string 直接把數字組進 SQL 的寫法 (例如 INTERVAL '7 days') 也會被歸成同一種。
+    """
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query)  # psycopg.sql.Composed 等
+    return _normalize(query)
+
+
+# --- 2. Span / 追蹤資料 ---
+
+class Span:
+    __slots__ = ("name", "start", "end", "attributes", "children")
+
+    def __init__(self, name: str, start: float, attributes: dict | None = None):
+        self.name = name
+        self.start = start
+        self.end: float | None = None
+        self.attributes = attributes or {}
+        self.children: list["Span"] = []
+
+    def to_dict(self, origin: float) -> dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        data = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+        }
+        if self.attributes:
+            data["attributes"] = self.attributes
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class RequestTrace:
+    def __init__(self, method: str, route: str, path: str):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id.get()
+        self.root = Span(f"{method} {route}", time.perf_counter(),
+                         {"http.method": method, "http.route": route, "http.path": path})
+        self.stack = [self.root]
+        # 正規化後的 SQL -> [次數, 總耗時 (秒)]
+        self.statements: dict[str, list] = {}
+        self.query_count = 0
+        self.dropped_spans = 0
+        self.scope: dict | None = None  # ASGI scope (router 比對完後才有路由樣板)
+
+    def add_query(self, query, duration: float, rowcount: int, error: BaseException | None):
+        end = time.perf_counter()
+        statement = normalize_sql(query)
+        self.query_count += 1
+
+        stats = self.statements.get(statement)
+        if stats is None:
+            self.statements[statement] = [1, duration]
+        else:
+            stats[0] += 1
+            stats[1] += duration
+
+        if self.query_count > MAX_QUERY_SPANS:
+            self.dropped_spans += 1
+            return
+        query_span = Span("db.query", end - duration, {"db.statement": statement, "db.rowcount": rowcount})
+        query_span.end = end
+        if error is not None:
+            query_span.attributes["error"] = type(error).__name__
+        self.stack[-1].children.append(query_span)
+
+    def repeated_statements(self, threshold: int) -> list[dict]:
+        """
+        執行次數超過 threshold 的 SQL (次數多的排前面)。
+        """
+        repeated = [
+            {"statement": statement, "count": count, "total_ms": round(total * 1000, 3)}
+            for statement, (count, total) in self.statements.items()
+            if count > threshold
+        ]
+        repeated.sort(key=lambda item: item["count"], reverse=True)
+        return repeated
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "request_id": self.request_id,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "query_count": self.query_count,
+            "dropped_spans": self.dropped_spans,
+            "n_plus_one": self.repeated_statements(QUERY_TRACE_N_PLUS_ONE_THRESHOLD),
+            "root": self.root.to_dict(self.root.start),
+        }
+
+
+# 目前請求的追蹤 (沒有經過 getDB 的程式碼，例如背景工作，這裡是 None)
+current_trace: ContextVar[RequestTrace | None] = ContextVar("current_trace", default=None)
+
+
+# --- 3. 給 db.py / 其他模組呼叫的介面 ---
+
+def record_query(query, params, duration: float, rowcount: int, error: BaseException | None):
+    """
+    db.py 的查詢監聽 (見 db.add_query_hook)。
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_query(query, duration, rowcount, error)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    在目前的追蹤中開一個子 span，期間執行的查詢會掛在它底下：
+
+        with span("render", template="dashboard_client.html"):
+            ...
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    child = Span(name, time.perf_counter(), attributes)
+    trace.stack[-1].children.append(child)
+    trace.stack.append(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        trace.stack.pop()
+
+
+def start_trace(scope: dict) -> Token:
+    # 路由要等 router 比對完才知道，先用實際網址，check_n_plus_one / finish_trace 時再換成路由樣板
+    trace = RequestTrace(scope.get("method", ""), scope.get("path", ""), scope.get("path", ""))
+    trace.scope = scope
+    return current_trace.set(trace)
+
+
+def _name_root(trace: RequestTrace, scope: dict):
+    route = route_label(scope)
+    trace.root.name = f"{scope.get('method', '')} {route}"
+    trace.root.attributes["http.route"] = route
+
+
+def check_n_plus_one(trace: RequestTrace, scope: dict) -> str | None:
+    """
+    檢查 N+1 並記錄警告 (每個請求只檢查一次)，回傳警告訊息；沒有 N+1 時回傳 None。
+    """
+    if "n_plus_one" in trace.root.attributes:
+        return trace.root.attributes.get("n_plus_one_message")
+    _name_root(trace, scope)
+    repeated = trace.repeated_statements(QUERY_TRACE_N_PLUS_ONE_THRESHOLD)
+    trace.root.attributes["n_plus_one"] = bool(repeated)
+    if not repeated:
+        return None
+    worst = repeated[0]
+    message = (
+        f"N+1 查詢: {trace.root.name} 同一種 SQL 執行了 {worst['count']} 次 "
+        f"(上限 {QUERY_TRACE_N_PLUS_ONE_THRESHOLD}): {worst['statement'][:200]}"
+    )
+    trace.root.attributes["n_plus_one_message"] = message
+    logger.warning(message, extra={"n_plus_one": repeated[:3]})
+    return message
+
+
+def finish_trace(token: Token, scope: dict, failed: bool = False):
+    """
+    結束目前的追蹤：檢查 N+1 (回應送出前還沒檢查過的話)、輸出 span tree。
+    """
+    trace = current_trace.get()
+    current_trace.reset(token)
+    if trace is None:
+        return
+    trace.root.end = time.perf_counter()
+    trace.root.attributes["error"] = failed
+    check_n_plus_one(trace, scope)
+
+    # 沒有執行任何 SQL 的請求 (靜態檔、健康檢查) 不輸出
+    if QUERY_TRACE_EXPORT_PATH and trace.query_count:
+        line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+        asyncio.get_running_loop().run_in_executor(None, _append_line, QUERY_TRACE_EXPORT_PATH, line)
+
+
+class QueryTraceMiddleware:
+    """
+    純 ASGI middleware：每個 HTTP 請求一份追蹤。
+    回應開始送出 (http.response.start) 時檢查 N+1；測試模式下在這裡拋出 NPlusOneError，
+    回應還沒送出，外層的 ServerErrorMiddleware 會改回 500。
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = start_trace(scope)
+        trace = current_trace.get()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message_text = check_n_plus_one(trace, scope)
+                if message_text and QUERY_TRACE_STRICT:
+                    raise NPlusOneError(message_text)
+            await send(message)
+
+        failed = False
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            finish_trace(token, scope, failed)
+
+
+_export_lock = threading.Lock()
+
+
+def _append_line(path: str, line: str):
+    with _export_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
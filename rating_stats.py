@@ -0,0 +1,267 @@
+# rating_stats.py
+"""
+使用者評分統計 (user_rating_stats)
+
+個人檔案與 Hover 預覽卡都要顯示「平均幾顆星、共幾則評價」。與其每次把收到的評價全部撈出來加總，
+改為每個使用者一列預先算好的統計：評價數、平均分數加總、三個維度各自的加總、1~5 星分佈。
+顯示時只要一次主鍵查詢 (fetch_rating_stats)。
+
+維護方式：
+- 新增評價的路由 (client.submit_review / users.submit_general_review) 在寫入 reviews 的同一個交易內
+  呼叫 add_review_to_stats，評價與統計一起 commit 或一起 rollback，不會對不上。
+- 統計表壞掉、或資料是用 COPY 直接匯入的 (seed_data.py)，用重建指令從 reviews 重新計算：
+    python rating_stats.py --rebuild
+
+接案人排行榜 (contractor_leaderboard) 以貝氏平均排名，由排程 (tasks.refresh_contractor_leaderboard) 增量更新：
+只重算水位線之後 user_rating_stats 有變動的接案人。全站平均 (先驗) 沿用上次的值，
+變動超過 LEADERBOARD_PRIOR_TOLERANCE 才整份重算，否則新舊分數的基準會不一致。
+"""
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+
+import psycopg
+
+from db import DATABASE_URL
+from config import LEADERBOARD_PRIOR_REVIEWS, LEADERBOARD_PRIOR_TOLERANCE, ANALYTICS_ROLLUP_OVERLAP
+
+logger = logging.getLogger(__name__)
+
+# 星等分佈以「單則評價的平均分數」四捨五入 (1.5 -> 2 星)
+STAR_BUCKETS = (1, 2, 3, 4, 5)
+
+
+# --- 1. 寫入 (與 INSERT INTO reviews 同一個交易) ---
+
+ADD_REVIEW_SQL = """
+INSERT INTO user_rating_stats AS s (
+    user_id, review_count, score_sum, rating_1_sum, rating_2_sum, rating_3_sum,
+    stars_1, stars_2, stars_3, stars_4, stars_5, updated_at
+)
+VALUES (
+    %(user_id)s, 1, %(score)s, %(rating_1)s, %(rating_2)s, %(rating_3)s,
+    %(stars_1)s, %(stars_2)s, %(stars_3)s, %(stars_4)s, %(stars_5)s, NOW()
+)
+ON CONFLICT (user_id) DO UPDATE SET
+    review_count = s.review_count + 1,
+    score_sum = s.score_sum + EXCLUDED.score_sum,
+    rating_1_sum = s.rating_1_sum + EXCLUDED.rating_1_sum,
+    rating_2_sum = s.rating_2_sum + EXCLUDED.rating_2_sum,
+    rating_3_sum = s.rating_3_sum + EXCLUDED.rating_3_sum,
+    stars_1 = s.stars_1 + EXCLUDED.stars_1,
+    stars_2 = s.stars_2 + EXCLUDED.stars_2,
+    stars_3 = s.stars_3 + EXCLUDED.stars_3,
+    stars_4 = s.stars_4 + EXCLUDED.stars_4,
+    stars_5 = s.stars_5 + EXCLUDED.stars_5,
+    updated_at = NOW()
+"""
+
+
+def star_bucket(average_score) -> int:
+    return min(5, max(1, int(float(average_score) + 0.5)))
+
+
+async def add_review_to_stats(cur, review: dict):
+    """
+    把一則剛寫入的評價加進被評價者的統計。
+    review 是 INSERT INTO reviews ... RETURNING 的結果 (需要 reviewee_id、rating_1~3、average_score)，
+    用資料庫實際存下的 average_score (DECIMAL(3,1)) 才會跟重建結果一致。
+    """
+    star = star_bucket(review["average_score"])
+    await cur.execute(ADD_REVIEW_SQL, {
+        "user_id": review["reviewee_id"],
+        "score": review["average_score"],
+        "rating_1": review["rating_1"],
+        "rating_2": review["rating_2"],
+        "rating_3": review["rating_3"],
+        **{f"stars_{n}": int(n == star) for n in STAR_BUCKETS},
+    })
+
+
+# --- 2. 讀取 (一次主鍵查詢) ---
+
+def empty_stats() -> dict:
+    return {
+        "avg_rating": 0.0, # 總平均分
+        "count": 0,        # 評價總數
+        "dim1": 0.0,       # 維度1 (如：品質/需求合理性)
+        "dim2": 0.0,       # 維度2 (如：效率/驗收難度)
+        "dim3": 0.0,       # 維度3 (如：態度)
+        "histogram": [0] * len(STAR_BUCKETS),  # 1~5 星各有幾則 (histogram[0] = 1 星)
+    }
+
+
+def stats_from_row(row: dict | None) -> dict:
+    stats = empty_stats()
+    if not row or not row["review_count"]:
+        return stats
+    count = row["review_count"]
+    stats["count"] = count
+    # round(數值, 1) 表示取到小數點後第 1 位
+    stats["avg_rating"] = round(float(row["score_sum"]) / count, 1)
+    stats["dim1"] = round(row["rating_1_sum"] / count, 1)
+    stats["dim2"] = round(row["rating_2_sum"] / count, 1)
+    stats["dim3"] = round(row["rating_3_sum"] / count, 1)
+    stats["histogram"] = [row[f"stars_{n}"] for n in STAR_BUCKETS]
+    return stats
+
+
+async def fetch_rating_stats(cur, user_id: int) -> dict:
+    """
+    回傳 {avg_rating, count, dim1, dim2, dim3, histogram}；沒有評價時都是 0。
+    """
+    await cur.execute("SELECT * FROM user_rating_stats WHERE user_id = %s", (user_id,))
+    return stats_from_row(await cur.fetchone())
+
+
+# --- 3. 重建 ---
+
+REBUILD_SQL = """
+LOCK TABLE user_rating_stats IN SHARE ROW EXCLUSIVE MODE;
+DELETE FROM user_rating_stats;
+INSERT INTO user_rating_stats (
+    user_id, review_count, score_sum, rating_1_sum, rating_2_sum, rating_3_sum,
+    stars_1, stars_2, stars_3, stars_4, stars_5, updated_at
+)
+SELECT reviewee_id, COUNT(*), SUM(average_score), SUM(rating_1), SUM(rating_2), SUM(rating_3),
+       COUNT(*) FILTER (WHERE ROUND(average_score) <= 1),
+       COUNT(*) FILTER (WHERE ROUND(average_score) = 2),
+       COUNT(*) FILTER (WHERE ROUND(average_score) = 3),
+       COUNT(*) FILTER (WHERE ROUND(average_score) = 4),
+       COUNT(*) FILTER (WHERE ROUND(average_score) >= 5),
+       NOW()
+FROM reviews
+GROUP BY reviewee_id;
+"""
+
+
+def rebuild_rating_stats(cur) -> int:
+    """
+    從 reviews 重新計算全部統計 (同步游標，由呼叫端 commit)，回傳有評價的使用者數。
+    先鎖住統計表：重建期間新增的評價會等重建完成才累加上去，不會被重建結果覆蓋掉。
+    """
+    cur.execute(REBUILD_SQL)
+    cur.execute("SELECT COUNT(*) FROM user_rating_stats")
+    return cur.fetchone()[0]
+
+
+# --- 4. 接案人排行榜 ---
+
+LEADERBOARD_WATERMARK = "contractor_leaderboard"
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+UPSERT_LEADERBOARD_SQL = """
+INSERT INTO contractor_leaderboard (user_id, review_count, avg_rating, bayes_score, prior_mean, updated_at)
+SELECT s.user_id, s.review_count, ROUND(s.score_sum / s.review_count, 2),
+       (%(weight)s * %(prior)s + s.score_sum::float) / (%(weight)s + s.review_count),
+       %(prior)s, NOW()
+FROM user_rating_stats s
+JOIN users u ON u.id = s.user_id
+WHERE u.role = 'contractor' AND s.review_count > 0 AND s.updated_at > %(since)s
+ON CONFLICT (user_id) DO UPDATE SET
+    review_count = EXCLUDED.review_count,
+    avg_rating = EXCLUDED.avg_rating,
+    bayes_score = EXCLUDED.bayes_score,
+    prior_mean = EXCLUDED.prior_mean,
+    updated_at = NOW()
+"""
+
+
+def bayes_score(score_sum: float, review_count: int, prior_mean: float,
+                weight: int = LEADERBOARD_PRIOR_REVIEWS) -> float:
+    """
+    與 UPSERT_LEADERBOARD_SQL 相同的公式 (給只需要算單一接案人的地方用)。
+    """
+    return (weight * prior_mean + score_sum) / (weight + review_count)
+
+
+async def refresh_leaderboard(conn) -> int:
+    """
+    增量更新排行榜，回傳更新了幾位接案人。conn 為 dict_row 連線 (不在交易中)。
+    """
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT NOW() AS started,
+                       (SELECT last_seen FROM analytics_watermarks WHERE name = %s) AS last_seen,
+                       (SELECT prior_mean FROM contractor_leaderboard LIMIT 1) AS current_prior,
+                       (SELECT SUM(s.score_sum)::float / NULLIF(SUM(s.review_count), 0)
+                        FROM user_rating_stats s JOIN users u ON u.id = s.user_id
+                        WHERE u.role = 'contractor') AS global_mean
+                """,
+                (LEADERBOARD_WATERMARK,)
+            )
+            state = await cur.fetchone()
+            if state["global_mean"] is None:
+                return 0  # 還沒有任何接案人被評價
+
+            prior = state["current_prior"]
+            if prior is None or state["last_seen"] is None or abs(state["global_mean"] - prior) > LEADERBOARD_PRIOR_TOLERANCE:
+                # 先驗改變：所有人的分數都要用新的全站平均重算
+                prior = state["global_mean"]
+                since = _EPOCH
+            else:
+                since = state["last_seen"] - timedelta(seconds=ANALYTICS_ROLLUP_OVERLAP)
+
+            await cur.execute(UPSERT_LEADERBOARD_SQL, {
+                "weight": LEADERBOARD_PRIOR_REVIEWS, "prior": prior, "since": since,
+            })
+            updated = cur.rowcount
+            # 角色改成委託人的帳號移出排行榜
+            await cur.execute(
+                """
+                DELETE FROM contractor_leaderboard l USING users u
+                WHERE u.id = l.user_id AND u.role <> 'contractor'
+                """
+            )
+            await cur.execute(
+                """
+                INSERT INTO analytics_watermarks (name, last_seen, updated_at) VALUES (%s, %s, NOW())
+                ON CONFLICT (name) DO UPDATE SET last_seen = EXCLUDED.last_seen, updated_at = NOW()
+                """,
+                (LEADERBOARD_WATERMARK, state["started"])
+            )
+    return updated
+
+
+async def fetch_leaderboard(cur, limit: int) -> list[dict]:
+    """
+    前 limit 名 (沿著 idx_contractor_leaderboard_rank 讀，不做排序)。
+    """
+    await cur.execute(
+        """
+        SELECT l.user_id, u.username, u.avatar, l.review_count, l.avg_rating, l.bayes_score, l.updated_at
+        FROM contractor_leaderboard l
+        JOIN users u ON u.id = l.user_id
+        ORDER BY l.bayes_score DESC, l.review_count DESC, l.user_id
+        LIMIT %s
+        """,
+        (limit,)
+    )
+    rows = await cur.fetchall()
+    for rank, row in enumerate(rows, 1):
+        row["rank"] = rank
+        row["bayes_score"] = round(row["bayes_score"], 3)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用者評分統計 (user_rating_stats)")
+    parser.add_argument("--rebuild", action="store_true", help="從 reviews 重新計算全部統計")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        with conn.cursor() as cur:
+            users = rebuild_rating_stats(cur)
+        conn.commit()
+    logger.info("評分統計重建完成，共 %d 位使用者", users)
+
+
+if __name__ == "__main__":
+    from app_logging import setup_logging
+    setup_logging()
+    main()
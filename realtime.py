@@ -0,0 +1,115 @@
+# realtime.py
+import asyncio
+import json
+import logging
+import psycopg
+from db import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# --- 即時事件 (Postgres LISTEN/NOTIFY -> Server-Sent Events) ---
+#
+# 寫入端：留言、Issue 狀態變更的路由，在「同一個交易」裡呼叫 publish_project_event()，
+#         也就是執行 SELECT pg_notify(...)。交易 commit 之後 Postgres 才會真的送出通知，
+#         所以 rollback 的資料不會被推播出去。
+# 接收端：每個 worker 只開「一條」專用連線 LISTEN，收到通知後分送給訂閱該專案的
+#         SSE 連線 (routes/events.py)，不會因為線上人數增加而多佔資料庫連線。
+CHANNEL = "project_events"
+
+# NOTIFY 的 payload 上限是 8000 bytes，超過會讓 pg_notify 出錯、連帶整個交易 rollback。
+# 內容太長時截斷所有文字欄位 (留言、Issue 標題與描述…)，前端看到 truncated 會自行重新整理
+MAX_PAYLOAD_BYTES = 7000
+TRUNCATED_TEXT_LENGTH = 500
+# 每個訂閱者最多暫存幾個事件；瀏覽器太慢收不完時丟棄，避免記憶體無限成長
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+async def publish_project_event(cur, project_id: int, event_type: str, data: dict):
+    """
+    發布專案事件 (在呼叫端的交易內執行，commit 時才送出)。
+
+    參數:
+    - cur: 路由目前使用的 cursor
+    - event_type: "comment" / "issue_created" / "issue_status"
+    - data: 事件內容 (必須可以轉成 JSON)
+    """
+    event = {"type": event_type, "project_id": project_id, **data}
+    payload = json.dumps(event, ensure_ascii=False, default=str)
+
+    if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+        # 1. 每個文字欄位都截短
+        event = {
+            key: value[:TRUNCATED_TEXT_LENGTH] if isinstance(value, str) and key != "type" else value
+            for key, value in event.items()
+        }
+        event["truncated"] = True
+        payload = json.dumps(event, ensure_ascii=False, default=str)
+    if len(payload.encode("utf-8")) > MAX_PAYLOAD_BYTES:
+        # 2. 還是太長 (文字欄位很多)：只留 id 等非文字欄位，前端重新整理取得完整內容
+        event = {key: value for key, value in event.items() if key == "type" or not isinstance(value, str)}
+        payload = json.dumps(event, ensure_ascii=False, default=str)
+
+    await cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+
+
+class ProjectEventHub:
+    """
+    每個 worker 一個：維護一條 LISTEN 連線，並把事件分送給各專案的訂閱者 (asyncio.Queue)。
+    """
+
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, project_id: int) -> asyncio.Queue:
+        # 第一次有人訂閱時才啟動 LISTEN 連線
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(project_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, project_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(project_id)
+        if not queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[project_id]
+
+    def _dispatch(self, payload: str):
+        try:
+            event = json.loads(payload)
+            project_id = int(event["project_id"])
+        except (ValueError, KeyError, TypeError):
+            return
+        for queue in self._subscribers.get(project_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass  # 這個訂閱者太慢，丟掉事件 (前端重新連線時會重新整理)
+
+    async def _listen(self):
+        """
+        專用 LISTEN 連線 (autocommit)。斷線時自動重連，等待時間逐步加長 (最多 30 秒)。
+        """
+        backoff = 1
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(DATABASE_URL, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    logger.info("即時事件監聽已啟動 (LISTEN %s)", CHANNEL)
+                    backoff = 1
+                    async for notify in conn.notifies():
+                        self._dispatch(notify.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("即時事件監聽中斷: %s，%s 秒後重新連線...", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+# 全域實例 (每個 worker 一份)
+event_hub = ProjectEventHub()
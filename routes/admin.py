@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Request, Query
+from fastapi.responses import HTMLResponse
+from psycopg_pool import AsyncConnectionPool
+from db import getDB
+from routes.auth import get_current_admin_user
+from templating import templates
+from analytics import fetch_platform_analytics
+
+# 設定 Router (掛在 /admin 底下)
+router = APIRouter()
+
+# ---------------------------------------------------------
+# 平台統計 (只讀排程彙總好的 analytics_project_daily)
+# ---------------------------------------------------------
+@router.get("/analytics", response_class=HTMLResponse)
+async def get_admin_analytics(
+    request: Request,
+    days: int = Query(30, ge=1, le=365),
+    user: dict = Depends(get_current_admin_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    stats = await fetch_platform_analytics(conn, days)
+    # 趨勢長條圖以區間內單日最多的新專案數為 100%
+    max_created = max((d["projects_created"] for d in stats["daily"]), default=0)
+    return templates.TemplateResponse("admin_analytics.html", {
+        "request": request, "user": user, "stats": stats, "max_created": max_created
+    })
@@ -1,7 +1,12 @@
 import os
 import sys
+import time
+import logging
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
+from metrics import record_ai_call, AI_REQUESTS # 每個模型的延遲 / 錯誤次數
+
+logger = logging.getLogger(__name__)
 
 # --- 1. SDK 相容性檢查 ---
 # 這裡會嘗試匯入 Google 的官方 AI 套件。
@@ -11,15 +16,15 @@ try:
     from google import genai
     from google.genai import errors
     HAS_NEW_SDK = True
-    print("DEBUG: 成功匯入 google.genai (新版 SDK)")
+    logger.debug("成功匯入 google.genai (新版 SDK)")
 except ImportError:
     HAS_NEW_SDK = False
-    print("DEBUG: 未找到 google.genai，嘗試使用舊版 SDK...")
+    logger.debug("未找到 google.genai，嘗試使用舊版 SDK...")
     try:
         import google.generativeai as genai_old
     except ImportError:
-        # 如果兩版都沒裝，印出嚴重錯誤提示
-        print("CRITICAL ERROR: 沒有安裝任何 Google AI 套件！請執行 pip install google-genai")
+        # 如果兩版都沒裝，記錄嚴重錯誤提示
+        logger.critical("沒有安裝任何 Google AI 套件！請執行 pip install google-genai")
 
 router = APIRouter()
 # 從環境變數讀取 API Key，這是最安全的做法 (不要把 Key 直接寫在程式碼裡)
@@ -51,16 +56,21 @@ MODEL_CANDIDATES = [
     'gemini-pro',                # 最後備案
 ]
 
+# 先建立每個模型的監控數列 (數值 0)，還沒被呼叫過的備援模型也會出現在 /metrics
+for _model in MODEL_CANDIDATES:
+    AI_REQUESTS.inc(_model, "success", amount=0)
+
 @router.post("/chat")
 async def chat_with_ai(request: ChatRequest):
     """
     處理與 AI 的對話請求
     """
-    print(f"DEBUG: 收到使用者訊息: {request.message}")
+    # 只記錄長度：使用者訊息可能含有個資，不寫進日誌
+    logger.debug("收到使用者訊息 (%d 字)", len(request.message))
     
     # 檢查 API Key 是否存在
     if not api_key:
-        print("ERROR: API Key 缺失")
+        logger.error("API Key 缺失 (未設定 GEMINI_API_KEY)")
         return {"reply": "系統設定錯誤：未設定 API Key。"}
 
     # 組合完整的提示詞 (System Prompt + 使用者訊息)
@@ -75,32 +85,40 @@ async def chat_with_ai(request: ChatRequest):
             # 這是一個非常實用的設計：如果第一個模型失敗，它會自動試下一個
             last_error = None
             for model_name in MODEL_CANDIDATES:
+                call_start = time.perf_counter()
                 try:
-                    print(f"DEBUG: 嘗試使用模型: {model_name} ...")
+                    logger.debug("嘗試使用模型: %s", model_name)
                     response = client.models.generate_content(
                         model=model_name, 
                         contents=full_prompt
                     )
-                    print(f"DEBUG: 成功！模型 {model_name} 回傳了回應。")
+                    record_ai_call(model_name, time.perf_counter() - call_start, "success")
+                    logger.debug("模型 %s 回傳了回應", model_name)
                     return {"reply": response.text}
                 
                 except errors.ClientError as e:
+                    record_ai_call(model_name, time.perf_counter() - call_start, str(e.code))
                     # [錯誤處理] 
                     # 404: 模型名稱打錯或該模型還沒開放
                     # 429: 額度不足 (Resource Exhausted)
                     # 400: 請求格式錯誤
                     if e.code in [404, 400, 429]:
                         error_type = "找不到模型" if e.code == 404 else "額度不足" if e.code == 429 else "請求錯誤"
-                        print(f"DEBUG: 模型 {model_name} 無法使用 ({error_type}, code {e.code})，嘗試下一個...")
+                        logger.info("模型 %s 無法使用 (%s, code %s)，嘗試下一個", model_name, error_type, e.code,
+                                    extra={"model": model_name, "status_code": e.code})
                         last_error = e
                         continue # 跳過這次迴圈，試下一個模型
                     else:
                         # 其他未知錯誤 (如網路斷線) 才拋出異常
-                        print(f"DEBUG: 模型 {model_name} 發生未知錯誤: {e}")
+                        logger.error("模型 %s 發生未知錯誤: %s", model_name, e, extra={"model": model_name})
                         raise e
+                except Exception:
+                    # 網路中斷、逾時等非 ClientError 的錯誤
+                    record_ai_call(model_name, time.perf_counter() - call_start, "error")
+                    raise
             
             # 如果跑完所有模型都失敗 (例如每個模型都 429 額度不足)
-            print("ERROR: 所有模型嘗試皆失敗。")
+            logger.error("所有模型嘗試皆失敗")
             if last_error:
                 # 如果最後是因為額度不足，回傳友善訊息給前端
                 if hasattr(last_error, 'code') and last_error.code == 429:
@@ -112,20 +130,25 @@ async def chat_with_ai(request: ChatRequest):
         # --- 分支 B: 使用舊版 SDK (google.generativeai) ---
         # 如果伺服器只裝了舊版套件，會跑這裡
         else:
-            print("DEBUG: 使用舊版 SDK 呼叫中...")
+            logger.debug("使用舊版 SDK 呼叫中...")
             genai_old.configure(api_key=api_key)
             
+            call_start = time.perf_counter()
             try:
                 # 簡單的備援：先試 Flash，不行就試 Pro
                 model = genai_old.GenerativeModel('gemini-1.5-flash')
                 response = model.generate_content(full_prompt)
+                record_ai_call('gemini-1.5-flash', time.perf_counter() - call_start, "success")
             except:
+                record_ai_call('gemini-1.5-flash', time.perf_counter() - call_start, "error")
+                call_start = time.perf_counter()
                 model = genai_old.GenerativeModel('gemini-pro')
                 response = model.generate_content(full_prompt)
+                record_ai_call('gemini-pro', time.perf_counter() - call_start, "success")
                 
             return {"reply": response.text}
 
     except Exception as e:
         # 捕捉所有未預期的錯誤，避免伺服器崩潰 (Crash)
-        print(f"❌ AI 發生錯誤: {e}")
+        logger.exception("AI 發生錯誤: %s", e)
         return {"reply": f"抱歉，AI 發生連線錯誤，請稍後再試。"}
\ No newline at end of file
@@ -0,0 +1,301 @@
+from decimal import Decimal
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+from fastapi.responses import JSONResponse, Response
+from psycopg_pool import AsyncConnectionPool
+from db import getDB
+from routes.auth import get_session_user, invalidate_user_sessions, apply_session_version
+from config import ADMIN_USERNAMES
+# 與 HTML 頁面共用同一份查詢函式，資料內容保證一致
+from routes.client import fetch_client_dashboard, fetch_client_project_detail
+from routes.contractor import fetch_contractor_dashboard, fetch_contractor_project_detail
+from routes.users import fetch_user_profile
+from project_import import import_projects, FIELDS
+from config import PROJECT_IMPORT_MAX_ROWS
+from analytics import fetch_platform_analytics
+
+# --- 1. JSON 序列化 ---
+# 優先使用 orjson (比內建 json 快數倍，且原生支援 datetime)；沒安裝就退回內建 json。
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    import json
+    HAS_ORJSON = False
+
+
+def _json_default(obj):
+    # 資料庫的 DECIMAL 欄位 (quote、average_score) 會變成 Decimal，轉成 float 輸出
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if not HAS_ORJSON and hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    精簡 JSON 回應 (無空白、UTF-8 直出，中文不轉成 \\uXXXX)。
+    """
+    def render(self, content) -> bytes:
+        if HAS_ORJSON:
+            return orjson.dumps(content, default=_json_default)
+        return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# --- 2. 設定 Router ---
+# 所有路由預設回傳 FastJSONResponse，不經過樣板渲染
+router = APIRouter(default_response_class=FastJSONResponse)
+
+
+# --- 3. API 專用權限檢查 ---
+# HTML 頁面沒登入時會被 302 導向登入頁；API 則應該直接回 401 / 403，讓前端自行處理
+
+async def get_api_user(user: dict | None = Depends(get_session_user)) -> dict:
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return user
+
+async def get_api_client_user(user: dict = Depends(get_api_user)) -> dict:
+    if user["role"] != "client":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied: User is not a client")
+    return user
+
+async def get_api_contractor_user(user: dict = Depends(get_api_user)) -> dict:
+    if user["role"] != "contractor":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied: User is not a contractor")
+    return user
+
+async def get_api_admin_user(user: dict = Depends(get_api_user)) -> dict:
+    if user["username"] not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied: User is not an admin")
+    return user
+
+
+# =========================================================
+# 4. 委託人 (Client)
+# =========================================================
+
+@router.get("/client/dashboard")
+async def api_client_dashboard(
+    status_param: str = Query("open", alias="status"),
+    user: dict = Depends(get_api_client_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    委託人儀表板：篩選後的專案列表 + 各狀態的數量 (取代 HTML 版傳整包 all_projects)。
+    """
+    data = await fetch_client_dashboard(conn, user["id"], status_param)
+
+    counts = {}
+    for p in data["all_projects"]:
+        counts[p["status"]] = counts.get(p["status"], 0) + 1
+
+    return {"projects": data["projects"], "counts": counts, "current_filter": status_param}
+
+
+@router.get("/client/projects/{project_id}")
+async def api_client_project_detail(
+    project_id: int,
+    user: dict = Depends(get_api_client_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    委託人專案詳情：專案、提案 (proposals)、交付檔案、Issue 與留言、我的評價。
+    """
+    data = await fetch_client_project_detail(conn, project_id, user["id"])
+    if data is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return data
+
+
+@router.post("/client/projects/import")
+async def api_client_import_projects(
+    response: Response,
+    payload: list | dict = Body(...),
+    user: dict = Depends(get_api_client_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    批次建立專案。Body 為專案物件陣列，或 {"projects": [...], "skip_invalid": true}。
+    有建立任何專案回 201，否則 422；兩者都附上逐列錯誤報表。
+    """
+    skip_invalid = False
+    if isinstance(payload, dict):
+        skip_invalid = bool(payload.get("skip_invalid", False))
+        payload = payload.get("projects")
+    if not isinstance(payload, list) or not payload or not all(isinstance(item, dict) for item in payload):
+        raise HTTPException(status_code=400, detail="Body must be a non-empty list of project objects")
+    if len(payload) > PROJECT_IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {PROJECT_IMPORT_MAX_ROWS} projects per import")
+
+    rows = [
+        {field: (None if item.get(field) is None else str(item[field]).strip()) for field in FIELDS}
+        for item in payload
+    ]
+    report = await import_projects(conn, user["id"], rows, skip_invalid)
+    response.status_code = status.HTTP_201_CREATED if report["inserted"] else status.HTTP_422_UNPROCESSABLE_ENTITY
+    return report
+
+
+# =========================================================
+# 5. 接案人 (Contractor)
+# =========================================================
+
+@router.get("/contractor/dashboard")
+async def api_contractor_dashboard(
+    status_filter: str = Query("open", alias="status"),
+    q: str | None = Query(None),
+    min_budget: int | None = Query(None),
+    max_budget: int | None = Query(None),
+    deadline_days: str | None = Query(None),
+    custom_deadline: str | None = Query(None),
+    sort: str | None = Query("newest"),
+    user: dict = Depends(get_api_contractor_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    接案人儀表板 / 案件搜尋 (參數與 HTML 版相同)。
+    """
+    return await fetch_contractor_dashboard(
+        conn, user["id"], status_filter,
+        q=q, min_b_val=min_budget, max_b_val=max_budget,
+        deadline_days=deadline_days, custom_deadline=custom_deadline, sort=sort,
+    )
+
+
+@router.get("/contractor/projects/{project_id}")
+async def api_contractor_project_detail(
+    project_id: int,
+    user: dict = Depends(get_api_contractor_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    接案人專案詳情：專案、是否已投標、Issue 與留言、我的評價。
+    """
+    data = await fetch_contractor_project_detail(conn, project_id, user["id"])
+    if data is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return data
+
+
+# =========================================================
+# 6. 個人檔案 (Profile)
+# =========================================================
+
+@router.get("/users/{user_id}")
+async def api_user_profile(
+    user_id: int,
+    current_user: dict | None = Depends(get_session_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    個人檔案：基本資料、收到的評價、評分統計。
+    Email 只回傳給本人。
+    """
+    data = await fetch_user_profile(conn, user_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if not current_user or current_user["id"] != user_id:
+        data["target_user"].pop("email", None)
+    return data
+
+
+# =========================================================
+# 7. 站內通知 (Notifications)
+# =========================================================
+# 由 outbox.py 的發送程式寫入；前端只要輪詢這一支輕量 API，不必重新整理整個儀表板
+
+@router.get("/notifications")
+async def api_list_notifications(
+    unread_only: bool = Query(True),
+    limit: int = Query(20, ge=1, le=100),
+    user: dict = Depends(get_api_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    async with conn.cursor() as cur:
+        await cur.execute(
+            f"""
+            SELECT id, title, body, event_count, is_read, created_at
+            FROM notifications
+            WHERE user_id = %s {"AND NOT is_read" if unread_only else ""}
+            ORDER BY created_at DESC
+            LIMIT %s
+            """,
+            (user["id"], limit)
+        )
+        notifications = await cur.fetchall()
+    return {"notifications": notifications}
+
+
+@router.post("/notifications/read")
+async def api_mark_notifications_read(
+    user: dict = Depends(get_api_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    async with conn.cursor() as cur:
+        await cur.execute(
+            "UPDATE notifications SET is_read = TRUE WHERE user_id = %s AND NOT is_read",
+            (user["id"],)
+        )
+        updated = cur.rowcount
+    return {"updated": updated}
+
+
+# =========================================================
+# 8. 管理後台 (Admin)
+# =========================================================
+
+@router.get("/admin/analytics")
+async def api_admin_analytics(
+    days: int = Query(30, ge=1, le=365),
+    user: dict = Depends(get_api_admin_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    平台統計 (與 /admin/analytics 頁面相同資料)：只讀排程彙總的 analytics_project_daily。
+    比率欄位在分母為 0 時是 null。
+    """
+    return await fetch_platform_analytics(conn, days)
+
+
+@router.put("/admin/users/{user_id}/role")
+async def api_admin_change_role(
+    user_id: int,
+    role: str = Body(..., embed=True),
+    user: dict = Depends(get_api_admin_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    變更使用者角色。同一個交易內遞增 session_version，對方現有的 Session 會被強制登出，
+    不會拿著舊角色繼續通過權限檢查。
+    """
+    if role not in ("client", "contractor"):
+        raise HTTPException(status_code=400, detail="role must be 'client' or 'contractor'")
+    # 明確的交易：commit 之後才讓本機的版本號生效 (getDB 的 commit 要等回應送出後才執行)
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            await cur.execute("UPDATE users SET role = %s WHERE id = %s RETURNING id", (role, user_id))
+            if await cur.fetchone() is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            version = await invalidate_user_sessions(cur, user_id)
+    apply_session_version(user_id, version)
+    return {"id": user_id, "role": role}
+
+
+@router.post("/admin/users/{user_id}/sessions/revoke")
+async def api_admin_revoke_sessions(
+    user_id: int,
+    user: dict = Depends(get_api_admin_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    強制登出某位使用者的所有 Session (帳號外洩、停權前使用)。
+    """
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            version = await invalidate_user_sessions(cur, user_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    apply_session_version(user_id, version)
+    return {"id": user_id, "revoked": True}
@@ -1,14 +1,99 @@
 from fastapi import APIRouter, Depends, Request, Form, HTTPException, status
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from psycopg_pool import AsyncConnectionPool
-from db import getDB # 資料庫連線函式
+from db import getDB, get_pool # 資料庫連線函式
+from config import SESSION_IDENTITY_TTL, ADMIN_USERNAMES
+from templating import templates # 全站共用的樣板引擎
+import time
+from passwords import hash_password, verify_password # 密碼雜湊 (在專用執行緒池執行)
 
 # --- 1. 設定 Router 與樣板 ---
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
-# --- 2. 核心依賴函式：取得當前登入者 ---
+# --- 2. Session 身分 (Identity) ---
+# 登入後，Session Cookie 除了 user_id 之外還會帶一份精簡的身分資料：
+#   {"id": 1, "role": "client", "username": "test", "ver": 3, "iat": 1700000000}
+# Cookie 由 SessionMiddleware 用 SECRET_KEY 簽章，使用者無法竄改。
+# 角色檢查 (get_current_client_user / get_current_contractor_user) 直接讀這份資料，
+# 大部分請求完全不用查資料庫；超過 SESSION_IDENTITY_TTL 才回資料庫比對版本號 (ver)。
+IDENTITY_KEY = "identity"
+
+# 本機 (同一個 worker) 已知的最新版本號：呼叫 invalidate_user_sessions 後立刻生效，
+# 不必等 TTL 過期。其他 worker 則在 TTL 到期時從資料庫得知。
+_min_session_versions: dict[int, int] = {}
+
+def store_session_identity(request: Request, user: dict):
+    """
+    把使用者身分寫入 Session (登入成功、或從資料庫重新驗證後呼叫)。
+    user 必須包含 id / username / role / session_version。
+    """
+    request.session["user_id"] = user["id"]
+    request.session[IDENTITY_KEY] = {
+        "id": user["id"],
+        "role": user["role"],
+        "username": user["username"],
+        "ver": user["session_version"],
+        "iat": int(time.time()),
+    }
+
+def read_session_identity(request: Request) -> dict | None:
+    """
+    讀取 Session 裡的身分，不查資料庫。
+    資料格式不對、已過期、或版本號已被撤銷時回傳 None (呼叫端應改查資料庫)。
+    """
+    identity = request.session.get(IDENTITY_KEY)
+    if not isinstance(identity, dict):
+        return None
+    try:
+        user_id = int(identity["id"])
+        version = int(identity["ver"])
+        issued_at = int(identity["iat"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if identity.get("id") != request.session.get("user_id"):
+        return None
+    if time.time() - issued_at > SESSION_IDENTITY_TTL:
+        return None
+    if version < _min_session_versions.get(user_id, 0):
+        return None
+
+    return {"id": user_id, "username": identity.get("username"), "role": identity.get("role")}
+
+def session_identity_version(request: Request) -> int | None:
+    """
+    Session 身分裡的版本號 (不檢查 TTL)；沒有身分或格式不對時回傳 None。
+    """
+    identity = request.session.get(IDENTITY_KEY)
+    if not isinstance(identity, dict):
+        return None
+    try:
+        return int(identity["ver"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+async def invalidate_user_sessions(cur, user_id: int) -> int | None:
+    """
+    使某位使用者所有現存的 Session 身分失效 (角色變更、帳號停用等情況呼叫)，回傳新的版本號。
+    需在呼叫端的交易內執行；其他 worker 會在 TTL 到期、回資料庫比對版本號時發現 (見 get_current_user)。
+    交易 commit 之後，呼叫端再用 apply_session_version 讓本機立刻生效
+    (交易 rollback 時不能生效，否則本機會一直拒絕其實還有效的 Session)。
+    """
+    await cur.execute(
+        "UPDATE users SET session_version = session_version + 1 WHERE id = %s RETURNING session_version",
+        (user_id,)
+    )
+    row = await cur.fetchone()
+    return row["session_version"] if row else None
+
+def apply_session_version(user_id: int, version: int | None):
+    """
+    invalidate_user_sessions 的交易 commit 之後呼叫：本機 (同一個 worker) 立刻拒絕舊版本號的 Session。
+    """
+    if version is not None and version > _min_session_versions.get(user_id, 0):
+        _min_session_versions[user_id] = version
+
+# --- 3. 核心依賴函式：取得當前登入者 ---
 # 這是一個 "Dependency"，會在其他路由執行前先跑過一遍
 async def get_current_user(request: Request, conn: AsyncConnectionPool = Depends(getDB)):
     """
@@ -18,7 +103,9 @@ async def get_current_user(request: Request, conn: AsyncConnectionPool = Depends
     運作原理：
     1. 瀏覽器發送請求時會帶上 Cookie (Session ID)。
     2. 伺服器解密 Cookie 取得 "user_id"。
-    3. 用這個 ID 去資料庫查是不是真的有這個人。
+    3. 用這個 ID 去資料庫查是不是真的有這個人，並比對 Session 身分的版本號：
+       比資料庫舊 (角色變更、Session 被撤銷) 就強制登出。
+    4. Session 身分不存在、已過期、或與資料庫不同時才重寫 (否則 Session 不變，不會每次都送出新的 Cookie)。
     """
     # 嘗試從 Session 取得 user_id
     user_id = request.session.get("user_id")
@@ -33,7 +120,7 @@ async def get_current_user(request: Request, conn: AsyncConnectionPool = Depends
         
     async with conn.cursor() as cur:
         # 去資料庫撈使用者資料 (只撈需要的欄位)
-        await cur.execute("SELECT id, username, email, role FROM users WHERE id = %s", (user_id,))
+        await cur.execute("SELECT id, username, email, role, session_version FROM users WHERE id = %s", (user_id,))
         user = await cur.fetchone()
         
     if not user:
@@ -41,10 +128,39 @@ async def get_current_user(request: Request, conn: AsyncConnectionPool = Depends
         # 那就清除 Session，強制登出
         request.session.clear()
         return None
+
+    # 版本號比資料庫舊 (或沒有版本號) 表示這個 Session 已被撤銷，強制登出
+    version = session_identity_version(request)
+    if version is None or version < user["session_version"]:
+        request.session.clear()
+        return None
+
+    # 身分過期或內容跟資料庫不同 (角色、使用者名稱) 才刷新
+    identity = read_session_identity(request)
+    if (identity is None or identity["role"] != user["role"] or identity["username"] != user["username"]
+            or version != user["session_version"]):
+        store_session_identity(request, user)
         
     return user # user 是一個 dict, e.g., {'id': 1, 'username': 'test', 'role': 'client'}
 
-# --- 3. 註冊功能 ---
+async def get_session_user(request: Request) -> dict | None:
+    """
+    角色檢查專用的「快速版」get_current_user：
+    - Session 身分有效 -> 直接回傳 {id, username, role}，不借用資料庫連線
+    - 身分過期或不存在 -> 借一條連線回資料庫驗證一次，並刷新 Session
+    """
+    identity = read_session_identity(request)
+    if identity:
+        return identity
+
+    if not request.session.get("user_id"):
+        return None
+
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        return await get_current_user(request, conn)
+
+# --- 4. 註冊功能 ---
 
 # 顯示註冊頁面 (GET)
 @router.get("/register", response_class=HTMLResponse)
@@ -94,8 +210,8 @@ async def handle_registration(
         }, status_code=400)
 
     # 步驟 3: 寫入資料庫
-    # 注意：專案範例為了簡單，密碼是明碼儲存。
-    # 在正式產品中，這裡必須使用 bcrypt 或 argon2 進行雜湊 (Hash) 加密！
+    # 密碼先用 Argon2 雜湊後才儲存 (雜湊在背景執行緒池計算，不會卡住其他請求)
+    hashed_password = await hash_password(password)
     try:
         async with conn.cursor() as cur:
             await cur.execute(
@@ -103,7 +219,7 @@ async def handle_registration(
                 INSERT INTO users (username, email, hashed_password, role)
                 VALUES (%s, %s, %s, %s)
                 """,
-                (username, email, password, role) 
+                (username, email, hashed_password, role) 
             )
     except Exception as e:
         return templates.TemplateResponse("register.html", {
@@ -115,7 +231,7 @@ async def handle_registration(
     return RedirectResponse(url="/login?registered=true", status_code=status.HTTP_303_SEE_OTHER)
 
 
-# --- 4. 登入功能 ---
+# --- 5. 登入功能 ---
 
 # 顯示登入頁面 (GET)
 @router.get("/login", response_class=HTMLResponse)
@@ -144,28 +260,41 @@ async def handle_login(
     # 步驟 1: 去資料庫找這個使用者
     async with conn.cursor() as cur:
         await cur.execute(
-            "SELECT id, username, hashed_password, role FROM users WHERE username = %s", 
+            "SELECT id, username, hashed_password, role, session_version FROM users WHERE username = %s", 
             (username,)
         )
         user = await cur.fetchone()
 
     # 步驟 2: 驗證密碼
     # 如果 user 不存在 OR 密碼不對
-    if not user or user["hashed_password"] != password:
+    password_ok, new_hash = (False, None)
+    if user:
+        password_ok, new_hash = await verify_password(user["hashed_password"], password)
+    if not password_ok:
         return templates.TemplateResponse("login.html", {
             "request": request,
             "error": "無效的使用者名稱或密碼。"
         }, status_code=401)
+
+    # 步驟 2.5: 透明升級
+    # 舊帳號的密碼如果還是明碼 (或雜湊參數已調整)，登入成功時順便寫回新的雜湊值
+    if new_hash:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "UPDATE users SET hashed_password = %s WHERE id = %s",
+                (new_hash, user["id"])
+            )
     
     # 步驟 3: 登入成功，設定 Session
     # 這行程式碼執行後，FastAPI 會自動幫我們把加密後的 Cookie 塞給瀏覽器
-    request.session["user_id"] = user["id"]
+    # 同時寫入精簡身分 (id / role / username / 版本號)，之後的角色檢查就不用再查資料庫
+    store_session_identity(request, user)
     
     # 導向首頁 (main.py 的 root 函式會負責再把你導向對應的儀表板)
     return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
 
 
-# --- 5. 登出功能 ---
+# --- 6. 登出功能 ---
 @router.get("/logout")
 async def handle_logout(request: Request):
     """
@@ -175,13 +304,14 @@ async def handle_logout(request: Request):
     return RedirectResponse(url="/")
 
 
-# --- 6. 權限控管依賴函式 (重要！) ---
+# --- 7. 權限控管依賴函式 (重要！) ---
 # 這些函式用來保護特定路由，例如只有 "委託人" 才能建立專案
+# 只需要 id 與 role，所以改用 get_session_user：大部分請求直接讀 Session 身分，不查資料庫
 
 # [委託人 Client] 專用權限檢查
 async def get_current_client_user(
     request: Request, 
-    user: dict | None = Depends(get_current_user)
+    user: dict | None = Depends(get_session_user)
 ) -> dict:
     """
     檢查：
@@ -206,7 +336,7 @@ async def get_current_client_user(
 # [接案人 Contractor] 專用權限檢查
 async def get_current_contractor_user(
     request: Request, 
-    user: dict | None = Depends(get_current_user)
+    user: dict | None = Depends(get_session_user)
 ) -> dict:
     """
     檢查：
@@ -224,4 +354,21 @@ async def get_current_contractor_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied: User is not a contractor",
         )
-    return user
\ No newline at end of file
+    return user
+# [管理員 Admin] 專用權限檢查 (帳號列在 ADMIN_USERNAMES 環境變數裡)
+async def get_current_admin_user(
+    request: Request,
+    user: dict | None = Depends(get_session_user)
+) -> dict:
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_302_FOUND,
+            detail="Not authenticated",
+            headers={"Location": "/login"},
+        )
+    if user["username"] not in ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied: User is not an admin",
+        )
+    return user
@@ -1,52 +1,55 @@
-from fastapi import APIRouter, Depends, Request, Form, HTTPException, status
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
+import logging
+from fastapi import APIRouter, Depends, Request, Form, HTTPException, status, UploadFile, File
+from fastapi.responses import HTMLResponse, RedirectResponse
 from psycopg_pool import AsyncConnectionPool
 from db import getDB 
 # 匯入我們在 auth.py 寫好的權限檢查函式
 # 這非常重要！確保只有「委託人」身分才能呼叫這裡的 API
 from routes.auth import get_current_client_user 
 from datetime import datetime
-from main import templates 
+from templating import templates
 from utils import save_upload_file, FOLDER_PROPOSALS, FOLDER_DELIVERABLES
-import os
+from file_serving import download_response
+from fragment_cache import invalidate_fragment # 資料變動後讓樣板片段快取失效
+from realtime import publish_project_event # 即時推播 (LISTEN/NOTIFY)
+from outbox import enqueue_outbox # 通知寄件匣 (與狀態變更同一個交易)
+from project_import import parse_rows, import_projects, ImportFormatError # 批次匯入
+from rating_stats import add_review_to_stats # 評分統計 (與評價同一個交易)
+from config import PROJECT_IMPORT_MAX_BYTES
 import urllib.parse
 
 # 設定 Router
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # =========================================================
 # 第一部分：儀表板與專案建立
 # =========================================================
 
-# 1. 委託人儀表板
-@router.get("/dashboard", response_class=HTMLResponse)
-async def get_client_dashboard(
-    request: Request, 
-    # 使用 Dependency Injection (依賴注入)
-    # FastAPI 會自動執行 get_current_client_user，如果沒登入或身分不對，會直接被擋下來
-    user: dict = Depends(get_current_client_user), 
-    conn: AsyncConnectionPool = Depends(getDB)
-):
-    """
-    顯示委託人的主控台，列出所有專案狀態。
+# --- 查詢函式 ---
+# HTML 頁面 (本檔) 與 JSON API (routes/api.py) 共用同一份查詢邏輯
+
+async def fetch_client_dashboard(conn, client_id: int, status_param: str = "open") -> dict:
     """
-    # 取得網址上的參數 ?status=... (預設為 open)
-    status_param = request.query_params.get("status", "open")
+    撈出委託人的所有專案 (含提案數)，並依 status_param 篩選。
 
+    回傳:
+    - {"all_projects": [...], "projects": [...]}
+    """
     projects = []
     all_projects = []
 
     async with conn.cursor() as cur:
-        # 步驟 A: 查詢該使用者 (client_id = user["id"]) 的所有專案
+        # 步驟 A: 查詢該使用者 (client_id) 的所有專案
         # 這裡撈出所有欄位，包含預算 (budget) 和截止日
         await cur.execute(
             """
-            SELECT id, title, description, status, created_at, deadline, budget
+            SELECT id, title, description, status, created_at, updated_at, deadline, budget
             FROM projects
             WHERE client_id = %s
             ORDER BY created_at DESC
             """,
-            (user["id"],)
+            (client_id,)
         )
         all_projects = await cur.fetchall()
 
@@ -61,14 +64,36 @@ async def get_client_dashboard(
     # 如果選 'all' 就顯示全部，否則只顯示對應狀態
     if status_param == 'all':
         projects = all_projects
+    elif status_param == 'open':
+        # 提案已截止 (expired) 的專案還在等委託人選人，一起列在「開放中」
+        projects = [p for p in all_projects if p["status"] in ('open', 'expired')]
     else:
         projects = [p for p in all_projects if p["status"] == status_param]
 
+    return {"all_projects": all_projects, "projects": projects}
+
+# 1. 委託人儀表板
+@router.get("/dashboard", response_class=HTMLResponse)
+async def get_client_dashboard(
+    request: Request, 
+    # 使用 Dependency Injection (依賴注入)
+    # FastAPI 會自動執行 get_current_client_user，如果沒登入或身分不對，會直接被擋下來
+    user: dict = Depends(get_current_client_user), 
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    顯示委託人的主控台，列出所有專案狀態。
+    """
+    # 取得網址上的參數 ?status=... (預設為 open)
+    status_param = request.query_params.get("status", "open")
+
+    data = await fetch_client_dashboard(conn, user["id"], status_param)
+
     return templates.TemplateResponse("dashboard_client.html", {
         "request": request,
         "user": user,
-        "all_projects": all_projects, # 傳全部專案給前端做統計數字 (左上角的數字)
-        "projects": projects,         # 傳篩選後的專案給列表顯示
+        "all_projects": data["all_projects"], # 傳全部專案給前端做統計數字 (左上角的數字)
+        "projects": data["projects"],         # 傳篩選後的專案給列表顯示
         "current_filter": status_param
     })
 
@@ -116,19 +141,47 @@ async def handle_create_project(
     # 建立成功後，導回儀表板
     return RedirectResponse(url="/client/dashboard", status_code=303)
 
+# 3-1. 批次匯入專案 (CSV / JSON 檔案)
+@router.post("/import_projects", response_class=HTMLResponse)
+async def handle_import_projects(
+    request: Request,
+    file: UploadFile = File(...),
+    skip_invalid: bool = Form(False),
+    user: dict = Depends(get_current_client_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    驗證 + COPY 寫入見 project_import.py；結果 (含逐列錯誤) 顯示在建立專案頁面。
+    """
+    data = await file.read(PROJECT_IMPORT_MAX_BYTES + 1)
+    report = None
+    error = None
+    if len(data) > PROJECT_IMPORT_MAX_BYTES:
+        error = f"檔案太大 (上限 {PROJECT_IMPORT_MAX_BYTES // 1024} KB)"
+    else:
+        try:
+            rows = parse_rows(data, file.filename or "", file.content_type or "")
+            report = await import_projects(conn, user["id"], rows, skip_invalid)
+        except ImportFormatError as e:
+            error = str(e)
+
+    return templates.TemplateResponse("create_project.html", {
+        "request": request, "user": user, "import_report": report, "import_error": error
+    })
+
 
 # =========================================================
 # 第二部分：專案詳情與編輯
 # =========================================================
 
-# 4. 顯示專案詳情頁 (這頁最複雜，要撈很多資料)
-@router.get("/project/{project_id}", response_class=HTMLResponse)
-async def get_project_details(
-    request: Request,
-    project_id: int,
-    user: dict = Depends(get_current_client_user),
-    conn: AsyncConnectionPool = Depends(getDB)
-):
+async def fetch_client_project_detail(conn, project_id: int, client_id: int) -> dict | None:
+    """
+    撈出委託人專案詳情頁需要的所有資料。
+    專案不存在、或不是這位委託人的專案時回傳 None。
+
+    回傳:
+    - {"project", "proposals", "files", "issues", "my_review"}
+    """
     project = None
     proposals = []
     files = []
@@ -144,12 +197,12 @@ async def get_project_details(
             LEFT JOIN users u ON p.contractor_id = u.id
             WHERE p.id = %s AND p.client_id = %s
             """, 
-            (project_id, user["id"])
+            (project_id, client_id)
         )
         project = await cur.fetchone()
         
         if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
+            return None
 
         # B. 撈提案列表 (Proposals) - 只有在 status='open' 時最重要
         # 按報價由低到高排序
@@ -213,18 +266,34 @@ async def get_project_details(
         if project["status"] == 'completed':
             await cur.execute(
                 "SELECT * FROM reviews WHERE project_id = %s AND reviewer_id = %s",
-                (project_id, user["id"])
+                (project_id, client_id)
             )
             my_review = await cur.fetchone()
 
-    return templates.TemplateResponse("project_detail_client.html", {
-        "request": request,
-        "user": user,
+    return {
         "project": project,
         "proposals": proposals,
         "files": files,
         "issues": issues,
         "my_review": my_review,
+    }
+
+# 4. 顯示專案詳情頁 (這頁最複雜，要撈很多資料)
+@router.get("/project/{project_id}", response_class=HTMLResponse)
+async def get_project_details(
+    request: Request,
+    project_id: int,
+    user: dict = Depends(get_current_client_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    data = await fetch_client_project_detail(conn, project_id, user["id"])
+    if data is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    return templates.TemplateResponse("project_detail_client.html", {
+        "request": request,
+        "user": user,
+        **data,
         # 接收 URL 上的 ?message=... 或 ?error=... 顯示提示訊息
         "message": request.query_params.get("message", None),
         "error": request.query_params.get("error", None)
@@ -290,8 +359,9 @@ async def handle_edit_project(
             )
             if cur.rowcount == 0:
                 raise HTTPException(status_code=403, detail="無法更新，專案可能已非開放狀態。")
+        invalidate_fragment("project", project_id)
     except Exception as e:
-        print(f"Update error: {e}") 
+        logger.warning("專案 %s 更新失敗: %s", project_id, e)
         return RedirectResponse(url=f"/client/project/{project_id}?error=Update+failed", status_code=303)
     
     return RedirectResponse(url=f"/client/project/{project_id}?message=Project+updated", status_code=303)
@@ -307,9 +377,8 @@ async def download_file(path: str, user: dict = Depends(get_current_client_user)
     # 防止路徑遍歷攻擊 (Path Traversal)，不允許路徑包含 ".."
     if ".." in path or not path.startswith("uploads/"):
         raise HTTPException(status_code=403, detail="Invalid file path")
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(path)
+    # 檔案存在檢查與實際送檔 (直接回傳 / X-Accel-Redirect / 簽章網址) 交給 file_serving 處理
+    return download_response(path)
 
 # 8. 選擇提案 (關鍵流程：Open -> In Progress)
 @router.post("/select_proposal/{project_id}/{proposal_id}")
@@ -334,10 +403,19 @@ async def select_proposal(
             """
             UPDATE projects 
             SET contractor_id = %s, status = 'in_progress' 
-            WHERE id = %s AND client_id = %s AND status = 'open'
+            WHERE id = %s AND client_id = %s AND status IN ('open', 'expired') -- 提案截止後仍可從已收到的提案中選擇
+            RETURNING title
             """, 
             (proposal["contractor_id"], project_id, user["id"])
         )
+        updated = await cur.fetchone()
+
+        # 通知得標的接案人
+        if updated:
+            await enqueue_outbox(cur, proposal["contractor_id"], "project_status", {
+                "project_id": project_id, "title": updated["title"], "status": "in_progress",
+            })
+    invalidate_fragment("project", project_id)
     return RedirectResponse(url=f"/client/project/{project_id}?message=Contractor+selected", status_code=303)
 
 # 9. 建立 Issue (發起問題)
@@ -357,9 +435,17 @@ async def create_issue(
             raise HTTPException(status_code=403, detail="Access denied")
             
         await cur.execute(
-            "INSERT INTO project_issues (project_id, creator_id, title, description, status) VALUES (%s, %s, %s, %s, 'open')", 
+            "INSERT INTO project_issues (project_id, creator_id, title, description, status) VALUES (%s, %s, %s, %s, 'open') RETURNING id, created_at", 
             (project_id, user["id"], title, description)
         )
+        issue = await cur.fetchone()
+
+        # 即時通知接案人 (同一個交易，commit 後才會送出)
+        await publish_project_event(cur, project_id, "issue_created", {
+            "issue_id": issue["id"], "title": title, "description": description,
+            "creator_id": user["id"], "creator_name": user["username"],
+            "created_at": issue["created_at"].isoformat(),
+        })
     return RedirectResponse(url=f"/client/project/{project_id}?message=Issue+created", status_code=status.HTTP_303_SEE_OTHER)
 
 # 10. 回覆 Issue (留言)
@@ -385,7 +471,18 @@ async def client_comment_issue(
         if not project: 
             raise HTTPException(status_code=403, detail="Access denied")
             
-        await cur.execute("INSERT INTO issue_comments (issue_id, user_id, message) VALUES (%s, %s, %s)", (issue_id, user["id"], message))
+        await cur.execute(
+            "INSERT INTO issue_comments (issue_id, user_id, message) VALUES (%s, %s, %s) RETURNING id, created_at",
+            (issue_id, user["id"], message)
+        )
+        comment = await cur.fetchone()
+
+        # 即時推播新留言給正在看這個專案的人
+        await publish_project_event(cur, project["id"], "comment", {
+            "issue_id": issue_id, "comment_id": comment["id"],
+            "user_id": user["id"], "username": user["username"], "role": user["role"],
+            "message": message, "created_at": comment["created_at"].isoformat(),
+        })
         
     return RedirectResponse(url=f"/client/project/{project['id']}?message=Comment+added", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -414,6 +511,8 @@ async def resolve_issue(
         if not result: 
             raise HTTPException(status_code=403, detail="Access denied or issue not found")
         project_id = result["id"]
+
+        await publish_project_event(cur, project_id, "issue_status", {"issue_id": issue_id, "status": "resolved"})
         
     return RedirectResponse(url=f"/client/project/{project_id}?message=Issue+resolved", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -436,13 +535,20 @@ async def approve_project(
             UPDATE projects 
             SET status = 'completed' 
             WHERE id = %s AND client_id = %s AND status = 'pending_approval' 
-            RETURNING id
+            RETURNING id, title, contractor_id
             """, 
             (project_id, user["id"])
         )
-        if not await cur.fetchone(): 
+        updated = await cur.fetchone()
+        if not updated: 
             raise HTTPException(status_code=400, detail="Cannot complete project")
+
+        # 通知接案人：驗收結果
+        await enqueue_outbox(cur, updated["contractor_id"], "project_status", {
+            "project_id": project_id, "title": updated["title"], "status": "completed",
+        })
             
+    invalidate_fragment("project", project_id)
     return RedirectResponse(url=f"/client/project/{project_id}?message=Project+Completed!", status_code=303)
 
 # 13. 退件 (Reject -> Rejected)
@@ -459,13 +565,20 @@ async def reject_project(
             UPDATE projects 
             SET status = 'rejected' 
             WHERE id = %s AND client_id = %s AND status = 'pending_approval' 
-            RETURNING id
+            RETURNING id, title, contractor_id
             """, 
             (project_id, user["id"])
         )
-        if not await cur.fetchone(): 
+        updated = await cur.fetchone()
+        if not updated: 
             raise HTTPException(status_code=400, detail="Cannot reject project")
+
+        # 通知接案人：驗收結果
+        await enqueue_outbox(cur, updated["contractor_id"], "project_status", {
+            "project_id": project_id, "title": updated["title"], "status": "rejected",
+        })
             
+    invalidate_fragment("project", project_id)
     return RedirectResponse(url=f"/client/project/{project_id}?message=Project+Rejected", status_code=303)
 
 # 14. 提交評價 (Review)
@@ -511,11 +624,18 @@ async def submit_review(
                 """
                 INSERT INTO reviews (project_id, reviewer_id, reviewee_id, target_role, rating_1, rating_2, rating_3, average_score, comment)
                 VALUES (%s, %s, %s, 'contractor', %s, %s, %s, %s, %s)
+                RETURNING reviewee_id, rating_1, rating_2, rating_3, average_score
                 """,
                 (project_id, user["id"], project["contractor_id"], rating_1, rating_2, rating_3, avg, clean_comment)
             )
+            review = await cur.fetchone()
         except Exception as e:
             # 如果重複評價 (違反 Unique Constraint)
             return RedirectResponse(url=f"/client/project/{project_id}?error=Already+Reviewed", status_code=303)
 
+        # 接案人的評分統計 (同一個交易)
+        await add_review_to_stats(cur, review)
+
+    # 接案人的評價列表多了一筆
+    invalidate_fragment("reviews", project["contractor_id"])
     return RedirectResponse(url=f"/client/project/{project_id}?message=Review+Submitted", status_code=303)
\ No newline at end of file
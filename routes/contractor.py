@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, Request, Form, HTTPException, status, UploadFile, File
 from fastapi import Query
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
+from fastapi.responses import HTMLResponse, RedirectResponse
 from psycopg_pool import AsyncConnectionPool
 from db import getDB 
 # 匯入我們在 auth.py 寫好的權限檢查函式
@@ -9,8 +9,12 @@ from routes.auth import get_current_contractor_user
 import os
 import aiofiles
 from utils import save_upload_file, FOLDER_PROPOSALS, FOLDER_DELIVERABLES
+from file_serving import download_response
+from fragment_cache import invalidate_fragment # 資料變動後讓樣板片段快取失效
+from realtime import publish_project_event # 即時推播 (LISTEN/NOTIFY)
+from outbox import enqueue_outbox # 通知寄件匣 (與狀態變更同一個交易)
 from datetime import datetime
-from main import templates
+from templating import templates
 import urllib.parse
 import re
 
@@ -26,6 +30,18 @@ os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 # 因為資料庫存的是 "5,000 以下" 這種文字，但篩選時需要轉成數字
 # ---------------------------------------------------------
 
+# 預算對照表 (Key 必須跟 create_project.html 的 value 一模一樣；批次匯入也用這份表驗證)
+BUDGET_RANGES = {
+    "5,000 以下": (0, 5000),
+    "5,001 - 10,000": (5001, 10000),
+    "10,001 - 50,000": (10001, 50000),
+    "50,001 - 100,000": (50001, 100000),
+    "100,001 - 300,000": (100001, 300000),
+    "300,001 - 1,000,000": (300001, 1000000),
+    "1,000,001 - 3,000,000": (1000001, 3000000),
+    "3,000,000 以上": (3000001, float('inf'))
+}
+
 def get_budget_limit(budget_str: str):
     """
     將預算下拉選單的文字 (e.g., "5,000 以下") 轉換為 (最小值, 最大值) 的數字 Tuple。
@@ -36,19 +52,7 @@ def get_budget_limit(budget_str: str):
         
     clean_str = budget_str.strip()
 
-    # 定義預算對照表 (Key 必須跟 create_project.html 的 value 一模一樣)
-    mapping = {
-        "5,000 以下": (0, 5000),
-        "5,001 - 10,000": (5001, 10000),
-        "10,001 - 50,000": (10001, 50000),
-        "50,001 - 100,000": (50001, 100000),
-        "100,001 - 300,000": (100001, 300000),
-        "300,001 - 1,000,000": (300001, 1000000),
-        "1,000,001 - 3,000,000": (1000001, 3000000),
-        "3,000,000 以上": (3000001, float('inf'))
-    }
-    
-    return mapping.get(clean_str, (0, float('inf')))
+    return BUDGET_RANGES.get(clean_str, (0, float('inf')))
 
 def parse_budget_max_value(budget_str: str) -> int:
     """
@@ -85,27 +89,27 @@ def parse_budget_max_value(budget_str: str) -> int:
     return 0
 
 # ---------------------------------------------------------
-# 1. 接案人儀表板 (Dashboard) & 搜尋引擎
+# 查詢函式
+# HTML 頁面 (本檔) 與 JSON API (routes/api.py) 共用同一份查詢邏輯
 # ---------------------------------------------------------
-@router.get("/dashboard", response_class=HTMLResponse)
-async def get_contractor_dashboard(
-    request: Request, 
-    user: dict = Depends(get_current_contractor_user), # 權限檢查
-    conn: AsyncConnectionPool = Depends(getDB),
-    status_filter: str = Query("open", alias="status"), # 從網址 ?status=... 取得，預設 'open'
-    search_query: str | None = Query(None, alias="search"), # 舊版搜尋參數 (保留相容性)
-    # --- 新版進階篩選參數 ---
-    q: str | None = Query(None),                 # 關鍵字搜尋
-    min_budget: str | None = Query(None),        # 最低預算 (使用者輸入的數字)
-    max_budget: str | None = Query(None),        # 最高預算
-    deadline_days: str | None = Query(None),     # 截止天數 (例如 "3", "7", "custom")
-    custom_deadline: str | None = Query(None),   # 自訂截止日期 (YYYY-MM-DD)
-    sort: str | None = Query('newest')           # 排序方式
-):
-    # 資料清理：把預算轉成整數，如果使用者亂填文字就變 None
-    min_b_val = int(min_budget) if min_budget and min_budget.strip().isdigit() else None
-    max_b_val = int(max_budget) if max_budget and max_budget.strip().isdigit() else None
 
+async def fetch_contractor_dashboard(
+    conn,
+    contractor_id: int,
+    status_filter: str = "open",
+    q: str | None = None,
+    min_b_val: int | None = None,
+    max_b_val: int | None = None,
+    deadline_days: str | None = None,
+    custom_deadline: str | None = None,
+    sort: str | None = "newest",
+) -> dict:
+    """
+    撈出接案人儀表板的統計數字與專案列表。
+
+    回傳:
+    - {"projects": [...], "stats": {...}}
+    """
     projects = []
     
     # 統計數據 (顯示在儀表板頂端的數字卡片)
@@ -116,10 +120,11 @@ async def get_contractor_dashboard(
     async with conn.cursor() as cur:
         
         # 1. 計算各狀態的案件數量
-        await cur.execute("""
-            SELECT COUNT(*) as count FROM projects 
-            WHERE status = 'open' AND (deadline IS NULL OR deadline > NOW())
-        """)
+        # status = 'open' 走部分索引 (過期專案由背景排程改成 expired，不會留在索引裡)；
+        # 截止日仍再檢查一次：排程兩次執行之間、或沒有啟動 worker 時，剛過期的專案也不會被算進來
+        await cur.execute(
+            "SELECT COUNT(*) as count FROM projects WHERE status = 'open' AND (deadline IS NULL OR deadline > NOW())"
+        )
         stats["open"] = (await cur.fetchone())["count"]
 
         # 計算接案人「自己」相關的案件數量 (執行中、待驗收、已結案)
@@ -128,11 +133,11 @@ async def get_contractor_dashboard(
             ("('pending_approval')", "pending"), 
             ("('completed')", "completed")
         ]:
-            # 注意：這裡的 WHERE 條件多了 contractor_id = user["id"]
+            # 注意：這裡的 WHERE 條件多了 contractor_id = 接案人本人
             # 因為「執行中」只需要看「我接的案子」，而不是全平台的案子
             await cur.execute(
                 f"SELECT COUNT(*) as count FROM projects WHERE contractor_id = %s AND status IN {s}",
-                (user["id"],)
+                (contractor_id,)
             )
             stats[key] = (await cur.fetchone())["count"]
 
@@ -151,9 +156,9 @@ async def get_contractor_dashboard(
                 FROM projects p
                 JOIN users u ON p.client_id = u.id
                 WHERE p.status = 'open'
-                AND (p.deadline IS NULL OR p.deadline > NOW()) 
+                AND (p.deadline IS NULL OR p.deadline > NOW()) -- 排程還沒處理到的過期專案 (見上方統計)
             """
-            params = [user["id"]]
+            params = [contractor_id]
 
             # A-1. 關鍵字搜尋 (標題 或 描述)
             if q:
@@ -221,29 +226,59 @@ async def get_contractor_dashboard(
                 WHERE p.contractor_id = %s {status_condition}
                 ORDER BY p.created_at DESC
             """
-            await cur.execute(sql, (user["id"],))
+            await cur.execute(sql, (contractor_id,))
             projects = await cur.fetchall()
 
+    return {"projects": projects, "stats": stats}
+
+# ---------------------------------------------------------
+# 1. 接案人儀表板 (Dashboard) & 搜尋引擎
+# ---------------------------------------------------------
+@router.get("/dashboard", response_class=HTMLResponse)
+async def get_contractor_dashboard(
+    request: Request, 
+    user: dict = Depends(get_current_contractor_user), # 權限檢查
+    conn: AsyncConnectionPool = Depends(getDB),
+    status_filter: str = Query("open", alias="status"), # 從網址 ?status=... 取得，預設 'open'
+    search_query: str | None = Query(None, alias="search"), # 舊版搜尋參數 (保留相容性)
+    # --- 新版進階篩選參數 ---
+    q: str | None = Query(None),                 # 關鍵字搜尋
+    min_budget: str | None = Query(None),        # 最低預算 (使用者輸入的數字)
+    max_budget: str | None = Query(None),        # 最高預算
+    deadline_days: str | None = Query(None),     # 截止天數 (例如 "3", "7", "custom")
+    custom_deadline: str | None = Query(None),   # 自訂截止日期 (YYYY-MM-DD)
+    sort: str | None = Query('newest')           # 排序方式
+):
+    # 資料清理：把預算轉成整數，如果使用者亂填文字就變 None
+    min_b_val = int(min_budget) if min_budget and min_budget.strip().isdigit() else None
+    max_b_val = int(max_budget) if max_budget and max_budget.strip().isdigit() else None
+
+    data = await fetch_contractor_dashboard(
+        conn, user["id"], status_filter,
+        q=q, min_b_val=min_b_val, max_b_val=max_b_val,
+        deadline_days=deadline_days, custom_deadline=custom_deadline, sort=sort,
+    )
+
     return templates.TemplateResponse("dashboard_contractor.html", {
         "request": request,
         "user": user,
-        "projects": projects,
+        "projects": data["projects"],
         "current_filter": status_filter,
         "search_query": q,
-        "stats": stats
+        "stats": data["stats"]
     })
 
 
 # ---------------------------------------------------------
 # 2. 專案詳情 (Project Detail)
 # ---------------------------------------------------------
-@router.get("/project/{project_id}", response_class=HTMLResponse)
-async def get_contractor_project_details(
-    request: Request,
-    project_id: int,
-    user: dict = Depends(get_current_contractor_user),
-    conn: AsyncConnectionPool = Depends(getDB)
-):
+async def fetch_contractor_project_detail(conn, project_id: int, contractor_id: int) -> dict | None:
+    """
+    撈出接案人專案詳情頁需要的所有資料，專案不存在時回傳 None。
+
+    回傳:
+    - {"project", "has_proposed", "issues", "my_review"}
+    """
     project = None
     has_proposed = False 
     my_review = None 
@@ -259,13 +294,13 @@ async def get_contractor_project_details(
         project = await cur.fetchone()
         
         if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
+            return None
 
         # B. 檢查是否投過標 (用於顯示「已投標」狀態)
         if project["status"] == 'open':
             await cur.execute(
                 "SELECT id FROM proposals WHERE project_id = %s AND contractor_id = %s",
-                (project_id, user["id"])
+                (project_id, contractor_id)
             )
             has_proposed = await cur.fetchone() is not None
 
@@ -273,7 +308,7 @@ async def get_contractor_project_details(
         if project["status"] == 'completed':
             await cur.execute(
                 "SELECT * FROM reviews WHERE project_id = %s AND reviewer_id = %s",
-                (project_id, user["id"])
+                (project_id, contractor_id)
             )
             my_review = await cur.fetchone()
 
@@ -305,15 +340,30 @@ async def get_contractor_project_details(
                     (issue["id"],)
                 )
                 issue["comments"] = await cur.fetchall()
-                issues.append(issue)    
+                issues.append(issue)
 
-    return templates.TemplateResponse("project_detail_contractor.html", {
-        "request": request,
-        "user": user,
+    return {
         "project": project,
         "has_proposed": has_proposed,
         "issues": issues,
         "my_review": my_review,
+    }
+
+@router.get("/project/{project_id}", response_class=HTMLResponse)
+async def get_contractor_project_details(
+    request: Request,
+    project_id: int,
+    user: dict = Depends(get_current_contractor_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    data = await fetch_contractor_project_detail(conn, project_id, user["id"])
+    if data is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    return templates.TemplateResponse("project_detail_contractor.html", {
+        "request": request,
+        "user": user,
+        **data,
         "message": request.query_params.get("message", None),
         "error": request.query_params.get("error", None)
     })
@@ -337,7 +387,7 @@ async def handle_propose(
         raise HTTPException(status_code=400, detail="提案計畫書必須是 PDF 格式")
 
     async with conn.cursor() as cur:
-        await cur.execute("SELECT deadline, status, budget FROM projects WHERE id = %s", (project_id,))
+        await cur.execute("SELECT client_id, title, deadline, status, budget FROM projects WHERE id = %s", (project_id,))
         project = await cur.fetchone()
         
         if not project:
@@ -375,7 +425,15 @@ async def handle_propose(
             """,
             (project_id, user["id"], quote, message, file_path)
         )
+
+        # 通知委託人：收到新提案
+        await enqueue_outbox(cur, project["client_id"], "proposal_received", {
+            "project_id": project_id, "title": project["title"],
+            "contractor_name": user["username"], "quote": quote,
+        })
         
+    # 委託人儀表板上的提案數量改變了
+    invalidate_fragment("project", project_id)
     return RedirectResponse(url=f"/contractor/project/{project_id}?message=Proposed", status_code=303)
 
 
@@ -391,7 +449,7 @@ async def upload_project_file(
     conn: AsyncConnectionPool = Depends(getDB)
 ):
     async with conn.cursor() as cur:
-        await cur.execute("SELECT status, contractor_id FROM projects WHERE id = %s", (project_id,))
+        await cur.execute("SELECT client_id, title, status, contractor_id FROM projects WHERE id = %s", (project_id,))
         project = await cur.fetchone()
         
         # 權限檢查：必須是該專案的得標者
@@ -417,7 +475,13 @@ async def upload_project_file(
             "UPDATE projects SET status = 'pending_approval' WHERE id = %s",
             (project_id,)
         )
+
+        # 通知委託人：有新的交付檔案，等待驗收
+        await enqueue_outbox(cur, project["client_id"], "deliverable_uploaded", {
+            "project_id": project_id, "title": project["title"], "filename": file.filename,
+        })
         
+    invalidate_fragment("project", project_id)
     return RedirectResponse(url=f"/contractor/project/{project_id}?message=File+Updated", status_code=303)
 
 
@@ -447,9 +511,17 @@ async def contractor_comment_issue(
             raise HTTPException(status_code=403, detail="Access denied")
             
         await cur.execute(
-            "INSERT INTO issue_comments (issue_id, user_id, message) VALUES (%s, %s, %s)",
+            "INSERT INTO issue_comments (issue_id, user_id, message) VALUES (%s, %s, %s) RETURNING id, created_at",
             (issue_id, user["id"], message)
         )
+        comment = await cur.fetchone()
+
+        # 即時推播新留言給正在看這個專案的人
+        await publish_project_event(cur, project["id"], "comment", {
+            "issue_id": issue_id, "comment_id": comment["id"],
+            "user_id": user["id"], "username": user["username"], "role": user["role"],
+            "message": message, "created_at": comment["created_at"].isoformat(),
+        })
         
     return RedirectResponse(url=f"/contractor/project/{project['id']}?message=Comment+added", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -466,7 +538,5 @@ async def download_file(
     if ".." in path or not path.startswith("uploads/"):
         raise HTTPException(status_code=403, detail="Invalid file path")
     
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="File not found")
-        
-    return FileResponse(path)
\ No newline at end of file
+    # 檔案存在檢查與實際送檔 (直接回傳 / X-Accel-Redirect / 簽章網址) 交給 file_serving 處理
+    return download_response(path)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from db import get_pool
+from routes.auth import get_session_user
+from realtime import event_hub
+
+# 設定 Router
+router = APIRouter()
+
+# 沒有事件時，每隔幾秒送一次註解行，避免代理伺服器 / 瀏覽器判定連線閒置而切斷
+HEARTBEAT_SECONDS = 15
+
+# ---------------------------------------------------------
+# 專案即時事件串流 (Server-Sent Events)
+# ---------------------------------------------------------
+@router.get("/events/project/{project_id}")
+async def project_event_stream(
+    request: Request,
+    project_id: int,
+    user: dict | None = Depends(get_session_user)
+):
+    """
+    專案詳情頁用 EventSource 連到這裡，即時收到新留言、新 Issue、Issue 狀態變更。
+
+    注意：這裡「不」使用 Depends(getDB)。
+    SSE 連線可能維持好幾分鐘，如果整段期間都佔著連線池的連線，很快就會把池子用光；
+    所以權限檢查只短暫借一條連線，查完立刻歸還。
+    """
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+    # 權限檢查：必須是專案的委託人，或是得標的接案人
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "SELECT id FROM projects WHERE id = %s AND (client_id = %s OR contractor_id = %s)",
+                (project_id, user["id"], user["id"])
+            )
+            if not await cur.fetchone():
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+
+    queue = event_hub.subscribe(project_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"  # 斷線後 3 秒自動重連
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                data = json.dumps(event, ensure_ascii=False)
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+        finally:
+            event_hub.unsubscribe(project_id, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # 告訴 nginx 不要緩衝，事件才會立即送達
+    })
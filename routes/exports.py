@@ -0,0 +1,93 @@
+import uuid
+from datetime import date
+from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from db import getDB
+from routes.auth import get_current_client_user
+from templating import templates
+from file_serving import download_response
+from exports import DATASETS, HAS_OPENPYXL, stream_csv, xlsx_export_path
+from tasks import export_project_history_xlsx
+
+# 設定 Router (掛在 /client 底下)
+router = APIRouter()
+
+# ---------------------------------------------------------
+# 1. CSV：邊讀邊送
+# ---------------------------------------------------------
+@router.get("/export/{dataset}.csv")
+async def export_csv(dataset: str, user: dict = Depends(get_current_client_user)):
+    """
+    不使用 Depends(getDB)：stream_csv 開始讀取時才借連線，游標讀完就歸還。
+    """
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail="Unknown export dataset")
+    filename = f"project_history_{dataset}_{date.today():%Y%m%d}.csv"
+    return StreamingResponse(
+        stream_csv(dataset, user["id"]),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# ---------------------------------------------------------
+# 2. XLSX：交給背景工作產生
+# ---------------------------------------------------------
+@router.post("/export/xlsx")
+async def request_xlsx_export(
+    user: dict = Depends(get_current_client_user),
+    conn = Depends(getDB)
+):
+    if not HAS_OPENPYXL:
+        raise HTTPException(status_code=503, detail="XLSX 匯出目前無法使用，請改用 CSV。")
+
+    dedupe_key = f"export_xlsx:{user['id']}"  # 同一位委託人同時只會有一個匯出在排隊 / 執行
+    async with conn.transaction():
+        async with conn.cursor() as cur:
+            job_id = await export_project_history_xlsx.enqueue(
+                cur, dedupe_key=dedupe_key, client_id=user["id"], export_id=uuid.uuid4().hex
+            )
+            if job_id is None:
+                await cur.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = %s AND status IN ('queued', 'running')",
+                    (dedupe_key,)
+                )
+                row = await cur.fetchone()
+                if row is None:
+                    # 剛好在這一瞬間完成了，請使用者再按一次
+                    return RedirectResponse(url="/client/dashboard", status_code=303)
+                job_id = row["id"]
+    return RedirectResponse(url=f"/client/export/xlsx/{job_id}", status_code=303)
+
+@router.get("/export/xlsx/{job_id}", response_class=HTMLResponse)
+async def xlsx_export_status(
+    request: Request,
+    job_id: int,
+    download: bool = False,
+    user: dict = Depends(get_current_client_user),
+    conn = Depends(getDB)
+):
+    async with conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT status, args, created_at, finished_at
+            FROM jobs
+            WHERE id = %s AND name = %s AND (args->>'client_id')::int = %s
+            """,
+            (job_id, export_project_history_xlsx.name, user["id"])
+        )
+        job_row = await cur.fetchone()
+    if not job_row:
+        raise HTTPException(status_code=404, detail="Export not found")
+
+    path = xlsx_export_path(user["id"], job_row["args"]["export_id"])
+    if download:
+        if job_row["status"] != "done":
+            raise HTTPException(status_code=409, detail="Export is not ready yet")
+        return download_response(path)
+
+    return templates.TemplateResponse("export_status.html", {
+        "request": request,
+        "user": user,
+        "job_id": job_id,
+        "job": job_row,
+    })
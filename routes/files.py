@@ -0,0 +1,39 @@
+from fastapi import APIRouter, HTTPException
+from file_serving import is_safe_upload_path, send_upload_file, verify_signed_url
+import os
+
+# 設定 Router
+router = APIRouter()
+
+# ---------------------------------------------------------
+# 1. 短效簽章下載 (不需要登入，網址本身就是授權)
+# ---------------------------------------------------------
+@router.get("/files/signed")
+async def download_signed_file(path: str, expires: int, sig: str):
+    """
+    由 download_file 導過來的簽章網址。
+    簽章錯誤或已過期 -> 403；通過後依 FILE_SERVING_MODE 送檔。
+    """
+    if not is_safe_upload_path(path):
+        raise HTTPException(status_code=403, detail="Invalid file path")
+    if not verify_signed_url(path, expires, sig):
+        raise HTTPException(status_code=403, detail="Link expired or invalid")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return send_upload_file(path)
+
+# ---------------------------------------------------------
+# 2. 公開上傳檔案 (頭像等)
+# ---------------------------------------------------------
+# 開發模式 (direct) 時，main.py 直接掛載 StaticFiles 到 /uploads，這個路由不會被註冊。
+# 正式模式時改由這個路由回傳 X-Accel-Redirect / X-Sendfile，讓反向代理送檔。
+public_router = APIRouter()
+
+@public_router.get("/uploads/{file_path:path}", name="uploads")
+async def serve_public_upload(file_path: str):
+    path = f"uploads/{file_path}"
+    if not is_safe_upload_path(path):
+        raise HTTPException(status_code=403, detail="Invalid file path")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return send_upload_file(path)
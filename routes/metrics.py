@@ -0,0 +1,33 @@
+import hmac
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import PlainTextResponse
+from config import METRICS_TOKEN
+from db import pool_stats
+from metrics import render_metrics, add_collector, DB_POOL
+
+# 設定 Router
+router = APIRouter()
+
+# ---------------------------------------------------------
+# 連線池狀態：Prometheus 抓取時才讀取
+# ---------------------------------------------------------
+def collect_pool_stats():
+    # pool_size / pool_available / requests_waiting 等 (見 psycopg_pool 文件)
+    for stat, value in pool_stats().items():
+        DB_POOL.set(value, stat)
+
+add_collector(collect_pool_stats)
+
+# ---------------------------------------------------------
+# GET /metrics (Prometheus 抓取用)
+# ---------------------------------------------------------
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(request: Request):
+    """
+    有設定 METRICS_TOKEN 時，需帶 Authorization: Bearer <token> 才能讀取。
+    """
+    if METRICS_TOKEN:
+        auth = request.headers.get("authorization", "")
+        if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
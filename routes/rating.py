@@ -1,11 +1,25 @@
 # routes/rating.py
-from fastapi import APIRouter, Depends, HTTPException, Request, status, Form
-from fastapi.responses import RedirectResponse
-from typing import Optional
+"""
+評價提交、接案人評分預覽與接案人排行榜
+
+評價與其他頁面共用 reviews 表 (rating_1~3 三個維度)，不另開 ratings 表：
+- 委託人評接案人：產出品質 / 執行效率 / 合作態度
+- 接案人評委託人：需求合理性 / 驗收難度 / 合作態度
+預覽與排行榜只讀預先算好的 user_rating_stats / contractor_leaderboard (見 rating_stats.py)。
+"""
+import html
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Form, Query
+from fastapi.responses import HTMLResponse, RedirectResponse
+from psycopg_pool import AsyncConnectionPool
 from db import getDB
 from routes.auth import get_current_user
+from templating import templates
+from fragment_cache import invalidate_fragment # 資料變動後讓樣板片段快取失效
+from rating_stats import add_review_to_stats, fetch_rating_stats, fetch_leaderboard
 
-router = APIRouter( tags=["rating"])
+router = APIRouter(tags=["rating"])
+
+LEADERBOARD_MAX_K = 100
 
 
 # ------------------------------------------------------
@@ -15,8 +29,6 @@ router = APIRouter( tags=["rating"])
 async def create_rating(
     project_id: int = Form(...),
 
-
-
     overall_comment: str | None = Form(None),
 
     output_quality_score: int | None = Form(None),
@@ -27,13 +39,37 @@ async def create_rating(
     acceptance_difficulty_score: int | None = Form(None),
     client_attitude_score: int | None = Form(None),
 
-    conn=Depends(getDB),
-    user: dict = Depends(get_current_user),
+    conn: AsyncConnectionPool = Depends(getDB),
+    user: dict | None = Depends(get_current_user),
 ):
+    if not user:
+        return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
+
+    # 1. 依角色決定「評價方向」：表單欄位對應到 reviews 的三個維度
+    if user["role"] == "client":
+        redirect_url = f"/client/project/{project_id}"
+        target_role = "contractor"
+        scores = (output_quality_score, execution_efficiency_score, contractor_attitude_score)
+    elif user["role"] == "contractor":
+        redirect_url = f"/contractor/project/{project_id}"
+        target_role = "client"
+        scores = (requirement_rationality_score, acceptance_difficulty_score, client_attitude_score)
+    else:
+        raise HTTPException(status_code=403)
+
+    # 資料驗證：三個維度都必填，且在 1~5 之間
+    if not all(score is not None and 1 <= score <= 5 for score in scores):
+        return RedirectResponse(
+            url=f"{redirect_url}?error=Invalid+Rating+Score+(Must+be+1-5)",
+            status_code=status.HTTP_303_SEE_OTHER
+        )
 
+    clean_comment = html.escape(overall_comment.strip()) if overall_comment else None
+    if clean_comment and len(clean_comment) > 1000:
+        return RedirectResponse(url=f"{redirect_url}?error=Comment+too+long", status_code=status.HTTP_303_SEE_OTHER)
 
     async with conn.cursor() as cur:
-        # 1️.專案檢查
+        # 2. 專案檢查
         await cur.execute(
             "SELECT client_id, contractor_id, status FROM projects WHERE id = %s",
             (project_id,)
@@ -42,119 +78,64 @@ async def create_rating(
 
         if not project or project["status"] != "completed":
             raise HTTPException(status_code=400, detail="Project not completed")
-            
-        # 2. 依角色決定「評價方向」與「被評者」
+
         if user["role"] == "client":
             if user["id"] != project["client_id"]:
                 raise HTTPException(status_code=403)
-
-            rating_direction = "client_to_contractor"
             ratee_id = project["contractor_id"]
-
-        elif user["role"] == "contractor":
+        else:
             if user["id"] != project["contractor_id"]:
                 raise HTTPException(status_code=403)
-
-            rating_direction = "contractor_to_client"
             ratee_id = project["client_id"]
 
-        else:
-            raise HTTPException(status_code=403)
-
-        # 3.防止重複評價（依 direction）
+        # 3. 寫入評價 (UNIQUE(project_id, reviewer_id) 防止重複評價，重複時不會回傳任何列)
         await cur.execute(
             """
-            SELECT 1
-            FROM ratings
-            WHERE project_id = %s
-              AND rater_id = %s
-              AND ratee_id = %s
-              AND rating_direction = %s
+            INSERT INTO reviews (project_id, reviewer_id, reviewee_id, target_role, rating_1, rating_2, rating_3, average_score, comment)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (project_id, reviewer_id) DO NOTHING
+            RETURNING reviewee_id, rating_1, rating_2, rating_3, average_score
             """,
-            (project_id, user["id"], ratee_id, rating_direction)
+            (project_id, user["id"], ratee_id, target_role, *scores, sum(scores) / 3.0, clean_comment)
         )
-
-        if await cur.fetchone():
-            if user["role"] == "client":
-                redirect_url = f"/client/project/{project_id}"
-            else:
-                redirect_url = f"/contractor/project/{project_id}"
-
+        review = await cur.fetchone()
+        if review is None:
             return RedirectResponse(
                 url=f"{redirect_url}?message=Already+rated",
                 status_code=status.HTTP_303_SEE_OTHER
             )
 
-        # 3️⃣ 寫入評價
-        await cur.execute(
-            """
-            INSERT INTO ratings (
-                project_id, rater_id, ratee_id, rating_direction,
-                overall_comment,
-                output_quality_score, execution_efficiency_score, contractor_attitude_score,
-                requirement_rationality_score, acceptance_difficulty_score, client_attitude_score
-            )
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            """,
-            (
-                project_id,
-                user["id"],
-                ratee_id,
-                rating_direction,
-                overall_comment,
-                output_quality_score,
-                execution_efficiency_score,
-                contractor_attitude_score,
-                requirement_rationality_score,
-                acceptance_difficulty_score,
-                client_attitude_score,
-            )
-        )
-
-    # 4️⃣ 依角色 redirect（這裡不再用 payload）
-    if user["role"] == "client":
-        redirect_url = f"/client/project/{project_id}"
-        msg = "你已成功評價接案人"
-    else:
-        redirect_url = f"/contractor/project/{project_id}"
-        msg = "你已成功評價委託人"
+        # 被評價者的評分統計 (同一個交易)
+        await add_review_to_stats(cur, review)
 
+    invalidate_fragment("reviews", ratee_id)
     return RedirectResponse(
-    url=f"{redirect_url}?message=Rating+submitted",
-    status_code=status.HTTP_303_SEE_OTHER
-)
+        url=f"{redirect_url}?message=Rating+submitted",
+        status_code=status.HTTP_303_SEE_OTHER
+    )
 
+
+# ------------------------------------------------------
+# 接案人評分預覽 (一次主鍵查詢 + 最近 3 則留言)
+# ------------------------------------------------------
 @router.get("/contractors/{contractor_id}/rating-preview")
 async def get_contractor_rating_preview(
     contractor_id: int,
-    conn=Depends(getDB)
+    conn: AsyncConnectionPool = Depends(getDB)
 ):
     async with conn.cursor() as cur:
-        # 平均評價
-        await cur.execute(
-            """
-            SELECT
-                AVG(output_quality_score)       AS output_quality_avg,
-                AVG(execution_efficiency_score) AS efficiency_avg,
-                AVG(contractor_attitude_score)  AS attitude_avg,
-                COUNT(*)                        AS rating_count
-            FROM ratings
-            WHERE ratee_id = %s
-              AND rating_direction = 'client_to_contractor'
-            """,
-            (contractor_id,)
-        )
-        summary = await cur.fetchone()
+        # 平均評價：讀預先算好的各維度加總
+        stats = await fetch_rating_stats(cur, contractor_id)
 
-        # 最近評論
+        # 最近評論 (沿著 idx_reviews_reviewee_created 讀)
         await cur.execute(
             """
-            SELECT overall_comment, rating_date
-            FROM ratings
-            WHERE ratee_id = %s
-              AND rating_direction = 'client_to_contractor'
-              AND overall_comment IS NOT NULL
-            ORDER BY rating_date DESC
+            SELECT comment AS overall_comment, created_at AS rating_date
+            FROM reviews
+            WHERE reviewee_id = %s
+              AND target_role = 'contractor'
+              AND comment IS NOT NULL AND comment <> ''
+            ORDER BY created_at DESC, id DESC
             LIMIT 3
             """,
             (contractor_id,)
@@ -162,6 +143,43 @@ async def get_contractor_rating_preview(
         comments = await cur.fetchall()
 
     return {
-        "summary": dict(summary) if summary else None,
-        "comments": [dict(c) for c in comments],
+        "summary": {
+            "output_quality_avg": stats["dim1"],
+            "efficiency_avg": stats["dim2"],
+            "attitude_avg": stats["dim3"],
+            "average_score": stats["avg_rating"],
+            "rating_count": stats["count"],
+        },
+        "comments": comments,
     }
+
+
+# ------------------------------------------------------
+# 接案人排行榜 (貝氏平均，排程增量更新)
+# ------------------------------------------------------
+@router.get("/contractors/top")
+async def get_top_contractors(
+    k: int = Query(10, ge=1, le=LEADERBOARD_MAX_K),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    前 k 名接案人。bayes_score 會把評價數少的人拉向全站平均，只有一則 5 星的人不會排在最前面。
+    """
+    async with conn.cursor() as cur:
+        contractors = await fetch_leaderboard(cur, k)
+    return {"contractors": contractors}
+
+
+@router.get("/contractors/leaderboard", response_class=HTMLResponse)
+async def get_contractor_leaderboard_page(
+    request: Request,
+    user: dict | None = Depends(get_current_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    async with conn.cursor() as cur:
+        contractors = await fetch_leaderboard(cur, LEADERBOARD_MAX_K)
+    return templates.TemplateResponse("contractor_leaderboard.html", {
+        "request": request,
+        "user": user,
+        "contractors": contractors,
+    })
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, Request
 from fastapi.responses import HTMLResponse
-from main import templates
+from templating import templates
 from routes.auth import get_current_user
 
 router = APIRouter()
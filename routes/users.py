@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, Request, Form, HTTPException, status, UploadFile, File
-from fastapi.responses import HTMLResponse, RedirectResponse
+import base64
+import hashlib
+from datetime import datetime
+from fastapi import APIRouter, Depends, Request, Form, HTTPException, status, UploadFile, File, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from psycopg_pool import AsyncConnectionPool
 from db import getDB
 # 匯入通用的權限檢查 (不分角色，只要有登入即可)
 from routes.auth import get_current_user
 # 匯入儲存頭像的工具函式
 from utils import save_avatar_file
-from main import templates
+from tasks import shrink_avatar
+from templating import templates
+from fragment_cache import invalidate_fragment # 資料變動後讓樣板片段快取失效
+from rating_stats import add_review_to_stats, fetch_rating_stats # 預先算好的評分統計
+from config import PROFILE_REVIEWS_PAGE_SIZE, USER_PREVIEW_MAX_AGE
 
 # 設定 Router
 router = APIRouter()
@@ -14,26 +21,69 @@ router = APIRouter()
 # =========================================================
 # 1. 查看個人檔案 (公開/私人)
 # =========================================================
-@router.get("/profile/{user_id}", response_class=HTMLResponse)
-async def view_user_profile(
-    request: Request,
-    user_id: int,
-    # 這裡使用 get_current_user，因為不管有沒有登入，或許都能看別人的檔案 (視需求而定)
-    # 但這裡的設計是：current_user 用來判斷「我是不是正在看我自己的檔案」以便顯示編輯按鈕
-    current_user: dict | None = Depends(get_current_user),
-    conn: AsyncConnectionPool = Depends(getDB)
-):
-    target_user = None
-    reviews = []
-    # 初始化統計數據結構
-    stats = {
-        "avg_rating": 0.0, # 總平均分
-        "count": 0,        # 評價總數
-        "dim1": 0.0,       # 維度1 (如：品質/需求合理性)
-        "dim2": 0.0,       # 維度2 (如：效率/驗收難度)
-        "dim3": 0.0        # 維度3 (如：態度)
-    }
 
+# --- 評價列表分頁 (Keyset Pagination) ---
+# 依 (created_at, id) 由新到舊，下一頁從「上一頁最後一筆」之後接著讀，
+# 不用 OFFSET：評價再多，每一頁都只沿著 idx_reviews_reviewee_created 讀 PAGE_SIZE 筆。
+# cursor 是最後一筆的 created_at 與 id 編成的字串，前端原樣帶回來即可。
+
+def encode_review_cursor(review: dict) -> str:
+    raw = f"{review['created_at'].isoformat()}|{review['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_review_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    格式不對時拋出 ValueError。
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, review_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(review_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+async def fetch_user_reviews(cur, user_id: int, cursor: str | None = None,
+                             limit: int = PROFILE_REVIEWS_PAGE_SIZE) -> tuple[list[dict], str | None]:
+    """
+    讀取一頁「收到的評價」，回傳 (評價, 下一頁的 cursor)；沒有下一頁時 cursor 為 None。
+    評價者名稱、頭像與專案標題在同一個查詢裡 JOIN 進來，不會逐筆再查。
+    """
+    keyset = ""
+    params: list = [user_id]
+    if cursor:
+        before_created_at, before_id = decode_review_cursor(cursor)
+        keyset = "AND (r.created_at, r.id) < (%s, %s)"
+        params += [before_created_at, before_id]
+
+    # 多讀一筆，用來判斷還有沒有下一頁
+    await cur.execute(
+        f"""
+        SELECT r.id, r.project_id, r.reviewer_id, r.rating_1, r.rating_2, r.rating_3,
+               r.average_score, r.comment, r.created_at,
+               u.username AS reviewer_name, u.avatar AS reviewer_avatar, p.title AS project_title
+        FROM reviews r
+        JOIN users u ON r.reviewer_id = u.id
+        JOIN projects p ON r.project_id = p.id
+        WHERE r.reviewee_id = %s {keyset}
+        ORDER BY r.created_at DESC, r.id DESC
+        LIMIT %s
+        """,
+        (*params, limit + 1)
+    )
+    reviews = await cur.fetchall()
+    if len(reviews) <= limit:
+        return reviews, None
+    reviews = reviews[:limit]
+    return reviews, encode_review_cursor(reviews[-1])
+
+async def fetch_user_profile(conn, user_id: int) -> dict | None:
+    """
+    撈出個人檔案頁需要的資料 (基本資料、第一頁收到的評價、評分統計)。
+    使用者不存在時回傳 None。HTML 頁面與 JSON API (routes/api.py) 共用。
+
+    回傳:
+    - {"target_user", "reviews", "next_cursor", "stats"}
+    """
     async with conn.cursor() as cur:
         # A. 撈取目標使用者的基本資料
         await cur.execute(
@@ -43,41 +93,33 @@ async def view_user_profile(
         target_user = await cur.fetchone()
         
         if not target_user:
-            raise HTTPException(status_code=404, detail="User not found")
+            return None
 
-        # B. 撈取該使用者「收到」的評價 (reviewee_id = 目標用戶)
-        # 同時 JOIN projects 取得專案標題，JOIN users 取得評價者(reviewer)的資訊
-        await cur.execute(
-            """
-            SELECT r.*, u.username AS reviewer_name, u.avatar AS reviewer_avatar, p.title AS project_title
-            FROM reviews r
-            JOIN users u ON r.reviewer_id = u.id
-            JOIN projects p ON r.project_id = p.id
-            WHERE r.reviewee_id = %s
-            ORDER BY r.created_at DESC
-            """,
-            (user_id,)
-        )
-        reviews = await cur.fetchall()
-
-        # C. 計算統計數據 (算術平均數)
-        if reviews:
-            total_avg = sum(r["average_score"] for r in reviews)
-            stats["count"] = len(reviews)
-            # round(數值, 1) 表示取到小數點後第 1 位
-            stats["avg_rating"] = round(total_avg / stats["count"], 1)
-            
-            # 分別計算三個維度的平均分
-            stats["dim1"] = round(sum(r["rating_1"] for r in reviews) / stats["count"], 1)
-            stats["dim2"] = round(sum(r["rating_2"] for r in reviews) / stats["count"], 1)
-            stats["dim3"] = round(sum(r["rating_3"] for r in reviews) / stats["count"], 1)
+        # B. 撈取該使用者「收到」的評價 (只讀第一頁，其餘由「載入更多」呼叫 list_user_reviews)
+        reviews, next_cursor = await fetch_user_reviews(cur, user_id)
+
+        # C. 評分統計：預先算好的 user_rating_stats (一次主鍵查詢，不再把評價加總一遍)
+        stats = await fetch_rating_stats(cur, user_id)
+
+    return {"target_user": target_user, "reviews": reviews, "next_cursor": next_cursor, "stats": stats}
+
+@router.get("/profile/{user_id}", response_class=HTMLResponse)
+async def view_user_profile(
+    request: Request,
+    user_id: int,
+    # 這裡使用 get_current_user，因為不管有沒有登入，或許都能看別人的檔案 (視需求而定)
+    # 但這裡的設計是：current_user 用來判斷「我是不是正在看我自己的檔案」以便顯示編輯按鈕
+    current_user: dict | None = Depends(get_current_user),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    data = await fetch_user_profile(conn, user_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
     return templates.TemplateResponse("profile_view.html", {
         "request": request,
         "user": current_user,       # 當前登入者 (用來決定 Layout 右上角顯示什麼)
-        "target_user": target_user, # 被查看的人 (頁面主角)
-        "reviews": reviews,
-        "stats": stats
+        **data,                     # target_user: 被查看的人 (頁面主角)、reviews、stats
     })
 
 # =========================================================
@@ -115,12 +157,27 @@ async def handle_edit_profile(
         if avatar and avatar.filename:
             # 呼叫 utils.py 的函式存檔案
             avatar_path = await save_avatar_file(avatar, user["id"])
+
+            # 記下舊頭像，交給背景工作刪除
+            await cur.execute("SELECT avatar FROM users WHERE id = %s", (user["id"],))
+            old_avatar = (await cur.fetchone())["avatar"]
             
             # 更新資料庫：同時更新文字介紹與頭像路徑
             await cur.execute(
                 "UPDATE users SET introduction = %s, avatar = %s WHERE id = %s",
                 (introduction, avatar_path, user["id"])
             )
+
+            # 頭像會顯示在「我評價過的人」的評價列表裡，那些片段也要失效
+            await cur.execute(
+                "SELECT DISTINCT reviewee_id FROM reviews WHERE reviewer_id = %s",
+                (user["id"],)
+            )
+            for row in await cur.fetchall():
+                invalidate_fragment("reviews", row["reviewee_id"])
+
+            # 縮圖與刪除舊檔不在請求內執行，由 worker.py 處理
+            await shrink_avatar.enqueue(cur, path=avatar_path, old_path=old_avatar)
         else:
             # 情況 B: 只更新文字介紹，保留原頭像
             await cur.execute(
@@ -194,9 +251,11 @@ async def submit_general_review(
                 INSERT INTO reviews 
                 (project_id, reviewer_id, reviewee_id, target_role, rating_1, rating_2, rating_3, average_score, comment)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING reviewee_id, rating_1, rating_2, rating_3, average_score
                 """,
                 (project_id, user["id"], reviewee_id, target_role, rating_1, rating_2, rating_3, avg_score, clean_comment)
             )
+            review = await cur.fetchone()
         except Exception:
             # 如果資料庫回報錯誤 (通常是違反唯一性限制，代表評過了)
              return RedirectResponse(
@@ -204,56 +263,115 @@ async def submit_general_review(
                 status_code=303
             )
 
+        # E. 被評價者的評分統計 (同一個交易，評價與統計一起 commit)
+        await add_review_to_stats(cur, review)
+
+    # 被評價者的評價列表多了一筆
+    invalidate_fragment("reviews", reviewee_id)
+
     # 評價成功，根據角色導回對應的專案詳情頁
     base_url = "/client" if user["role"] == "client" else "/contractor"
     return RedirectResponse(url=f"{base_url}/project/{project_id}?message=Review+Submitted", status_code=303)
 
 # =========================================================
-# 5. API: 取得使用者預覽資訊 (Hover Card)
+# 5. API: 載入更多評價 (個人檔案頁的「載入更多」按鈕)
 # =========================================================
+@router.get("/api/reviews/{user_id}")
+async def list_user_reviews(
+    user_id: int,
+    cursor: str | None = Query(None),
+    limit: int = Query(PROFILE_REVIEWS_PAGE_SIZE, ge=1, le=100),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    回傳 {"reviews": [...], "next_cursor": "..."}；next_cursor 為 null 代表已經沒有更多評價。
+    """
+    async with conn.cursor() as cur:
+        try:
+            reviews, next_cursor = await fetch_user_reviews(cur, user_id, cursor, limit)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"reviews": reviews, "next_cursor": next_cursor}
+
+# =========================================================
+# 6. API: 取得使用者預覽資訊 (Hover Card)
+# =========================================================
+
+# 預覽卡只需要 users 與 user_rating_stats 兩張表的主鍵資料，一次 JOIN 查完
+PREVIEW_SQL = """
+SELECT u.id, u.username, u.avatar, u.role, s.review_count, s.score_sum
+FROM users u
+LEFT JOIN user_rating_stats s ON s.user_id = u.id
+WHERE u.id = ANY(%s)
+"""
+# 批次預覽一次最多幾個使用者
+PREVIEW_BATCH_LIMIT = 100
+
+def _preview_from_row(row: dict) -> dict:
+    stats = {"rating": "尚無評價", "count": 0}
+    if row["review_count"]:
+        stats["rating"] = f"{round(float(row['score_sum']) / row['review_count'], 1)} ⭐"
+        stats["count"] = row["review_count"]
+    return {
+        "id": row["id"],
+        "username": row["username"],
+        "avatar": f"/{row['avatar']}" if row["avatar"] else None, # 補上斜線確保路徑正確
+        "role": row["role"],
+        "stats": stats
+    }
+
+def _cached_json(request: Request, content) -> Response:
+    """
+    預覽資料幾乎不會變：讓瀏覽器快取 USER_PREVIEW_MAX_AGE 秒，過期後帶 If-None-Match 回來，
+    內容沒變就回 304 (不必再傳一次 JSON)。ETag 是回應內容的雜湊。
+    """
+    response = JSONResponse(content)
+    etag = f'W/"{hashlib.sha1(response.body).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={USER_PREVIEW_MAX_AGE}"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
+
 @router.get("/api/preview/{target_id}")
 async def get_user_preview_data(
+    request: Request,
     target_id: int,
     conn: AsyncConnectionPool = Depends(getDB)
 ):
     """
     這是一個回傳 JSON 的 API，給前端 JavaScript (layout.html) 使用。
     當滑鼠移到使用者連結上時，顯示小框框預覽。
+    (layout.html 現在改用下方的批次 API；這支保留給只需要單一使用者的呼叫端)
     """
     async with conn.cursor() as cur:
-        # 1. 查基本資料
-        await cur.execute(
-            "SELECT id, username, avatar, role, created_at FROM users WHERE id = %s",
-            (target_id,)
-        )
-        user = await cur.fetchone()
-        
-        if not user:
-            return {"error": "User not found"}
-            
-        # 2. 查該用戶的歷史平均評分
-        await cur.execute(
-            "SELECT average_score FROM reviews WHERE reviewee_id = %s",
-            (target_id,)
-        )
-        reviews = await cur.fetchall()
-        
-        stats = {
-            "rating": "尚無評價",
-            "count": 0
-        }
-        
-        if reviews:
-            count = len(reviews)
-            avg = sum(r["average_score"] for r in reviews) / count
-            stats["rating"] = f"{round(avg, 1)} ⭐"
-            stats["count"] = count
+        await cur.execute(PREVIEW_SQL, ([target_id],))
+        row = await cur.fetchone()
 
-    # 回傳 JSON 格式
-    return {
-        "id": user["id"],
-        "username": user["username"],
-        "avatar": f"/{user['avatar']}" if user["avatar"] else None, # 補上斜線確保路徑正確
-        "role": user["role"],
-        "stats": stats
-    }
\ No newline at end of file
+    if not row:
+        return {"error": "User not found"}
+    return _cached_json(request, _preview_from_row(row))
+
+@router.get("/api/previews")
+async def get_user_previews(
+    request: Request,
+    ids: str = Query(..., description="以逗號分隔的使用者 id，例如 3,8,15"),
+    conn: AsyncConnectionPool = Depends(getDB)
+):
+    """
+    批次預覽：頁面載入後把畫面上所有 .user-link 的 id 一次查完，滑鼠移過去時直接顯示。
+    回傳 {"users": {"3": {...}, "8": {...}}}；不存在的 id 不會出現在結果裡。
+    """
+    try:
+        user_ids = sorted({int(part) for part in ids.split(",") if part.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not user_ids or len(user_ids) > PREVIEW_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Provide 1 to {PREVIEW_BATCH_LIMIT} user ids")
+
+    async with conn.cursor() as cur:
+        await cur.execute(PREVIEW_SQL, (user_ids,))
+        rows = await cur.fetchall()
+
+    users = {str(row["id"]): _preview_from_row(row) for row in sorted(rows, key=lambda r: r["id"])}
+    return _cached_json(request, {"users": users})
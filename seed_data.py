@@ -0,0 +1,332 @@
+# seed_data.py
+"""
+大量測試資料產生器 (Synthetic data generator)
+
+用 PostgreSQL 的 COPY 批次寫入，幾百萬筆資料只要幾分鐘，方便在本機重現正式環境規模的效能問題。
+同一個 --seed + 相同參數 -> 產生完全相同的資料 (時間以 --base-date 為基準)，不同次的基準測試可以互相比較。
+
+執行方式 (在專案根目錄，需先執行 init_db.py 建好資料表)：
+    python seed_data.py --truncate                                  # 預設規模
+    python seed_data.py --truncate --users 200000 --projects 1000000 --seed 7
+    python seed_data.py --truncate --files                          # 一併產生佔位用的上傳檔案
+
+所有帳號的密碼都是 --password (預設 "password")，壓力測試可以直接登入。
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+import psycopg
+from db import DATABASE_URL
+from passwords import hash_password
+from rating_stats import rebuild_rating_stats
+from utils import UPLOAD_ROOT, FOLDER_PROPOSALS, FOLDER_DELIVERABLES
+
+# --- 1. 資料內容 ---
+
+# Key 必須跟 create_project.html 的 value 一模一樣；後面是產生報價用的 (最小值, 最大值)
+BUDGET_BUCKETS = [
+    ("5,000 以下", 500, 5000),
+    ("5,001 - 10,000", 5001, 10000),
+    ("10,001 - 50,000", 10001, 50000),
+    ("50,001 - 100,000", 50001, 100000),
+    ("100,001 - 300,000", 100001, 300000),
+    ("300,001 - 1,000,000", 300001, 1000000),
+    ("1,000,001 - 3,000,000", 1000001, 3000000),
+    ("3,000,000 以上", 3000001, 5000000),
+]
+# 小案子比大案子多
+BUDGET_WEIGHTS = [25, 20, 25, 12, 8, 5, 3, 2]
+
+# 專案狀態分布 (百分比)
+STATUS_WEIGHTS = {
+    "open": 35,
+    "expired": 10,
+    "in_progress": 20,
+    "pending_approval": 8,
+    "rejected": 5,
+    "completed": 22,
+}
+# 這些狀態代表已經選定接案人
+ASSIGNED_STATUSES = {"in_progress", "pending_approval", "rejected", "completed"}
+
+TITLE_PREFIX = ["急徵", "長期合作", "徵求", "誠徵", "小型", "大型", "新創", "預算充足", ""]
+TITLE_SUBJECT = [
+    "日系風格咖啡廳", "電商網站", "品牌", "手機 App", "餐廳訂位系統", "企業官網", "社群貼文",
+    "產品包裝", "線上課程平台", "寵物用品店", "補習班", "民宿", "健身房會員系統", "Podcast 節目",
+]
+TITLE_TASK = [
+    "Logo 設計", "前端開發", "後端 API 開發", "UI/UX 設計", "影片剪輯", "文案撰寫", "資料庫規劃",
+    "爬蟲程式", "SEO 優化", "插畫繪製", "翻譯 (中翻英)", "攝影", "行銷企劃", "系統維護",
+]
+DESCRIPTION_LINES = [
+    "希望能在期限內完成，過程中需要定期回報進度。",
+    "需要有相關作品集，請在提案中附上過去的案例。",
+    "預算可依提案內容再討論，歡迎提出建議。",
+    "我們是小團隊，希望找能長期配合的夥伴。",
+    "請注意：需要提供原始檔與使用授權。",
+    "可遠端作業，必要時需要線上開會討論需求。",
+]
+MESSAGES = [
+    "您好，我有多年相關經驗，附件是我的計畫書，請參考。",
+    "可以配合您的時程，報價包含兩次修改。",
+    "想先確認一下需求細節，方便的話可以約時間討論。",
+    "已經依照回饋修改完成，麻煩再確認一次。",
+    "收到，我這兩天會處理。",
+    "這部分跟原本的需求不太一樣，需要調整報價嗎？",
+    "沒問題，就照這個方向進行。",
+]
+ISSUE_TITLES = ["顏色需要調整", "登入頁面錯誤", "交付檔案格式不對", "進度確認", "需求變更", "文字有錯字"]
+REVIEW_COMMENTS = ["合作愉快，溝通順暢！", "準時交付，品質很好。", "有些地方需要多次溝通。", "非常專業，推薦。", None]
+
+# 佔位用的最小 PDF
+PLACEHOLDER_PDF = b"%PDF-1.4\n1 0 obj<<>>endobj\ntrailer<<>>\n%%EOF\n"
+
+
+# --- 2. 工具函式 ---
+
+def copy_rows(cur, table: str, columns: list[str], rows) -> int:
+    """
+    用 COPY ... FROM STDIN 寫入 (rows 可以是 generator，不必整批放在記憶體)。
+    """
+    count = 0
+    with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+            count += 1
+    return count
+
+
+def poisson_like(rng: random.Random, avg: float) -> int:
+    """
+    平均值為 avg 的非負整數 (幾何分布，少數專案特別熱門)。
+    """
+    if avg <= 0:
+        return 0
+    return int(rng.expovariate(1 / avg))
+
+
+# --- 3. 各資料表 ---
+
+def gen_users(args, rng: random.Random, base: datetime, hashed: str, clients: list[int], contractors: list[int]):
+    for user_id in range(1, args.users + 1):
+        role = "client" if rng.random() < args.client_ratio else "contractor"
+        (clients if role == "client" else contractors).append(user_id)
+        created_at = base - timedelta(days=rng.uniform(30, 1000))
+        intro = f"{rng.choice(TITLE_TASK)}專長，{rng.choice(DESCRIPTION_LINES)}"
+        yield (user_id, f"user{user_id:07d}", f"user{user_id:07d}@example.com", hashed, role, None, intro, created_at)
+
+
+def gen_projects(args, rng: random.Random, base: datetime, clients: list[int], contractors: list[int], projects: list[tuple]):
+    statuses = list(STATUS_WEIGHTS)
+    status_weights = list(STATUS_WEIGHTS.values())
+    for project_id in range(1, args.projects + 1):
+        status = rng.choices(statuses, status_weights)[0]
+        bucket = rng.choices(range(len(BUDGET_BUCKETS)), BUDGET_WEIGHTS)[0]
+        client_id = rng.choice(clients)
+        contractor_id = rng.choice(contractors) if status in ASSIGNED_STATUSES else None
+        created_at = base - timedelta(days=rng.uniform(1, 365))
+        if status == "open":
+            deadline = base + timedelta(days=rng.uniform(1, 60))
+        else:
+            deadline = created_at + timedelta(days=rng.uniform(1, 30))
+            if status == "expired":
+                deadline = min(deadline, base - timedelta(hours=1))
+        # 由 created_at 推算的時間一律不超過 base (不能出現未來的資料)
+        updated_at = min(created_at + timedelta(days=rng.uniform(0, 30)), base) if status != "open" else created_at
+        # 選定接案人的時間 (平台統計的「平均選定時間」)：介於建立與最後更新之間
+        awarded_at = None
+        if status in ASSIGNED_STATUSES:
+            awarded_at = created_at + (updated_at - created_at) * rng.uniform(0.05, 0.5)
+        title = f"{rng.choice(TITLE_PREFIX)}{rng.choice(TITLE_SUBJECT)}{rng.choice(TITLE_TASK)}"
+        description = "\n".join(rng.sample(DESCRIPTION_LINES, 3))
+
+        # 後面產生提案 / 檔案 / Issue 時需要的最少資訊
+        projects.append((project_id, client_id, contractor_id, status, bucket, created_at))
+        yield (project_id, client_id, contractor_id, title, description, status, deadline,
+               BUDGET_BUCKETS[bucket][0], created_at, updated_at, awarded_at)
+
+
+def gen_proposals(args, rng: random.Random, base: datetime, contractors: list[int], projects: list[tuple], files: list[str]):
+    proposal_id = 0
+    for project_id, _client_id, contractor_id, status, bucket, created_at in projects:
+        n = poisson_like(rng, args.proposals)
+        if contractor_id is not None:
+            n = max(n, 1)  # 已選定接案人的專案，至少要有得標者那一份提案
+        n = min(n, len(contractors))
+        bidders = rng.sample(contractors, n)
+        if contractor_id is not None and contractor_id not in bidders:
+            bidders[0] = contractor_id
+        _, low, high = BUDGET_BUCKETS[bucket]
+        for bidder in bidders:
+            proposal_id += 1
+            path = f"{UPLOAD_ROOT}/{project_id}/{FOLDER_PROPOSALS}/seed_{proposal_id}.pdf"
+            if args.files:
+                files.append(path)
+            yield (proposal_id, project_id, bidder, round(rng.uniform(low, high), 0),
+                   rng.choice(MESSAGES), path, min(created_at + timedelta(hours=rng.uniform(1, 72)), base))
+
+
+def gen_project_files(args, rng: random.Random, base: datetime, projects: list[tuple], files: list[str]):
+    file_id = 0
+    for project_id, _client_id, contractor_id, status, _bucket, created_at in projects:
+        if status not in ("pending_approval", "rejected", "completed"):
+            continue
+        for version in range(1, rng.randint(1, 3) + 1):
+            file_id += 1
+            filename = f"deliverable_v{version}.pdf"
+            path = f"{UPLOAD_ROOT}/{project_id}/{FOLDER_DELIVERABLES}/seed_{file_id}_{filename}"
+            if args.files:
+                files.append(path)
+            yield (file_id, project_id, contractor_id, filename, path, version,
+                   f"第 {version} 版交付", min(created_at + timedelta(days=5 * version), base))
+
+
+def gen_issues_and_comments(args, rng: random.Random, base: datetime, projects: list[tuple], comments: list[tuple]):
+    issue_id = 0
+    comment_id = 0
+    for project_id, client_id, contractor_id, status, _bucket, created_at in projects:
+        if contractor_id is None:
+            continue
+        for _ in range(poisson_like(rng, args.issues)):
+            issue_id += 1
+            issue_created = min(created_at + timedelta(days=rng.uniform(1, 20)), base)
+            issue_status = "open" if status in ("in_progress", "rejected") and rng.random() < 0.5 else "resolved"
+            yield (issue_id, project_id, client_id, rng.choice(ISSUE_TITLES), rng.choice(MESSAGES), issue_status, issue_created)
+            for i in range(poisson_like(rng, args.comments)):
+                comment_id += 1
+                author = client_id if i % 2 == 0 else contractor_id
+                comments.append((comment_id, issue_id, author, rng.choice(MESSAGES), min(issue_created + timedelta(hours=i + 1), base)))
+
+
+def gen_reviews(rng: random.Random, base: datetime, projects: list[tuple]):
+    review_id = 0
+    for project_id, client_id, contractor_id, status, _bucket, created_at in projects:
+        if status != "completed":
+            continue
+        # 雙向評價：委託人評接案人、接案人評委託人
+        for reviewer, reviewee, target_role in ((client_id, contractor_id, "contractor"), (contractor_id, client_id, "client")):
+            review_id += 1
+            r1, r2, r3 = (min(5, max(1, round(rng.gauss(4.2, 0.9)))) for _ in range(3))
+            yield (review_id, project_id, reviewer, reviewee, target_role, r1, r2, r3,
+                   round((r1 + r2 + r3) / 3, 1), rng.choice(REVIEW_COMMENTS), min(created_at + timedelta(days=40), base))
+
+
+def write_placeholder_files(paths: list[str]):
+    """
+    產生佔位檔案：先寫一份，其餘用硬連結 (幾十萬個檔案也只佔一份空間)。
+    """
+    template = os.path.join(UPLOAD_ROOT, ".seed_placeholder.pdf")
+    os.makedirs(UPLOAD_ROOT, exist_ok=True)
+    with open(template, "wb") as f:
+        f.write(PLACEHOLDER_PDF)
+    for path in paths:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            continue
+        try:
+            os.link(template, path)
+        except OSError:
+            shutil.copyfile(template, path)
+
+
+# --- 4. 主程式 ---
+
+TABLES = ["reviews", "issue_comments", "project_issues", "project_files", "proposals", "projects", "users"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產生大量測試資料 (COPY 批次寫入)")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子 (相同種子 = 相同資料)")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--client-ratio", type=float, default=0.4, help="委託人佔使用者的比例")
+    parser.add_argument("--projects", type=int, default=50000)
+    parser.add_argument("--proposals", type=float, default=4, help="每個專案平均提案數")
+    parser.add_argument("--issues", type=float, default=1.5, help="每個已接案專案平均 Issue 數")
+    parser.add_argument("--comments", type=float, default=3, help="每個 Issue 平均留言數")
+    parser.add_argument("--password", default="password", help="所有帳號共用的密碼")
+    parser.add_argument("--base-date", default=None, help="時間基準 (YYYY-MM-DD，預設今天)；open 專案的截止日都在這之後")
+    parser.add_argument("--files", action="store_true", help="一併在 uploads/ 產生佔位檔案")
+    parser.add_argument("--truncate", action="store_true", help="先清空相關資料表 (會刪除現有資料！)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.base_date:
+        base = datetime.strptime(args.base_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    else:
+        base = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    # 雜湊很慢，只算一次，所有帳號共用
+    hashed = asyncio.run(hash_password(args.password))
+
+    clients: list[int] = []
+    contractors: list[int] = []
+    projects: list[tuple] = []
+    comments: list[tuple] = []
+    files: list[str] = []
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        with conn.cursor() as cur:
+            if args.truncate:
+                cur.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+            else:
+                cur.execute("SELECT EXISTS (SELECT 1 FROM users)")
+                if cur.fetchone()[0]:
+                    parser.error("資料庫已經有資料，請加上 --truncate (會清空現有資料)")
+
+            steps = [
+                ("users", ["id", "username", "email", "hashed_password", "role", "avatar", "introduction", "created_at"],
+                 lambda: gen_users(args, rng, base, hashed, clients, contractors)),
+                ("projects", ["id", "client_id", "contractor_id", "title", "description", "status", "deadline",
+                              "budget", "created_at", "updated_at", "awarded_at"],
+                 lambda: gen_projects(args, rng, base, clients, contractors, projects)),
+                ("proposals", ["id", "project_id", "contractor_id", "quote", "message", "proposal_file", "created_at"],
+                 lambda: gen_proposals(args, rng, base, contractors, projects, files)),
+                ("project_files", ["id", "project_id", "uploader_id", "filename", "filepath", "version",
+                                   "description", "uploaded_at"],
+                 lambda: gen_project_files(args, rng, base, projects, files)),
+                ("project_issues", ["id", "project_id", "creator_id", "title", "description", "status", "created_at"],
+                 lambda: gen_issues_and_comments(args, rng, base, projects, comments)),
+                ("issue_comments", ["id", "issue_id", "user_id", "message", "created_at"],
+                 lambda: iter(comments)),
+                ("reviews", ["id", "project_id", "reviewer_id", "reviewee_id", "target_role", "rating_1", "rating_2",
+                             "rating_3", "average_score", "comment", "created_at"],
+                 lambda: gen_reviews(rng, base, projects)),
+            ]
+
+            total_start = time.perf_counter()
+            for table, columns, rows in steps:
+                start = time.perf_counter()
+                count = copy_rows(cur, table, columns, rows())
+                print(f"{table:<16} {count:>10,} 筆  ({time.perf_counter() - start:.1f} s)")
+                if table == "users" and (not clients or not contractors):
+                    parser.error("使用者太少，委託人或接案人其中一種為 0")
+
+            # 明確指定了 id，要把 SERIAL 的序號推進，之後網站新增資料才不會撞號
+            for table in TABLES:
+                cur.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false)"
+                )
+            # 評價是直接 COPY 進去的，評分統計要從 reviews 重新計算
+            start = time.perf_counter()
+            count = rebuild_rating_stats(cur)
+            print(f"{'user_rating_stats':<16} {count:>10,} 筆  ({time.perf_counter() - start:.1f} s)")
+        conn.commit()
+
+        # 更新統計資訊，讓查詢規劃器 (planner) 知道資料量已經變了
+        conn.autocommit = True
+        for table in TABLES:
+            conn.execute(f"ANALYZE {table}")
+
+    if args.files:
+        start = time.perf_counter()
+        write_placeholder_files(files)
+        print(f"佔位檔案         {len(files):>10,} 個  ({time.perf_counter() - start:.1f} s)")
+
+    print(f"完成，共花費 {time.perf_counter() - total_start:.1f} 秒 (seed={args.seed})")
+
+
+if __name__ == "__main__":
+    main()
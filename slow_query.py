@@ -0,0 +1,221 @@
+# slow_query.py
+"""
+慢查詢紀錄 (Slow-query log) 與自動 EXPLAIN
+
+開發 / 測試機上，執行時間超過 SLOW_QUERY_THRESHOLD_MS 的 SQL 會以一行 JSON 寫入 SLOW_QUERY_LOG_PATH：
+SQL 原文、正規化後的樣式、參數、路由、耗時，以及 EXPLAIN (ANALYZE, BUFFERS) 的執行計畫。
+
+EXPLAIN 的注意事項：
+- 另外向連線池借一條連線執行，不佔用請求本身的連線；借不到 (連線池滿了) 就略過。
+- ANALYZE 會真的再執行一次，所以只對唯讀查詢 (SELECT / 不含寫入的 WITH) 使用；
+  INSERT / UPDATE / DELETE 與 FOR UPDATE 只取預估計畫 (不加 ANALYZE)，而且最後一律 rollback。
+- 同一種 SQL 在 SLOW_QUERY_EXPLAIN_INTERVAL 秒內只 EXPLAIN 一次，避免慢查詢越積越多。
+
+報表 (依查詢樣式排名)：
+    python slow_query.py                     # 依總耗時排序前 20 名
+    python slow_query.py --sort mean --top 10 --plans
+"""
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from config import (
+    SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG_PATH, SLOW_QUERY_EXPLAIN, SLOW_QUERY_EXPLAIN_INTERVAL,
+)
+from db import get_pool
+from app_logging import request_id
+from metrics import current_scope, route_label, sql_operation
+from query_trace import current_trace, normalize_sql
+
+# 參數中過長的字串 (例如專案描述) 只保留前面一段
+MAX_PARAM_LENGTH = 200
+# 借 EXPLAIN 用連線最多等幾秒
+EXPLAIN_CONNECTION_TIMEOUT = 1.0
+
+# 寫入或加鎖的關鍵字 (FOR UPDATE / FOR NO KEY UPDATE 也會被 UPDATE 比對到)
+_WRITE_KEYWORDS = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE)\b|\bFOR\s+(KEY\s+)?SHARE\b", re.IGNORECASE)
+
+# 正規化後的 SQL -> 上次 EXPLAIN 的時間 (time.monotonic)
+_last_explained: dict[str, float] = {}
+# 進行中的 EXPLAIN task (保留參照，避免被垃圾回收)
+_pending: set = set()
+
+
+# --- 1. 查詢監聽 ---
+
+def _current_route() -> str:
+    # 每次都從 ASGI scope 算路由樣板：追蹤的 http.route 在回應送出前還是實際網址 (/client/project/123)
+    scope = current_scope.get()
+    if scope is None:
+        # 沒開監控指標時 current_scope 不會被設定，改用查詢追蹤保留的 scope
+        trace = current_trace.get()
+        scope = trace.scope if trace is not None else None
+    return route_label(scope)
+
+
+def _serialize_params(params):
+    if params is None:
+        return None
+
+    def clip(value):
+        if isinstance(value, str) and len(value) > MAX_PARAM_LENGTH:
+            return value[:MAX_PARAM_LENGTH] + "…"
+        if isinstance(value, (bytes, bytearray)):
+            return f"<{len(value)} bytes>"
+        return value
+
+    if isinstance(params, dict):
+        return {key: clip(value) for key, value in params.items()}
+    return [clip(value) for value in params]
+
+
+def is_read_only(query: str) -> bool:
+    return sql_operation(query) in ("SELECT", "WITH") and not _WRITE_KEYWORDS.search(query)
+
+
+def record_slow_query(query, params, duration: float, rowcount: int, error: BaseException | None):
+    """
+    db.py 的查詢監聽 (見 db.add_query_hook)。
+    """
+    if duration * 1000 < SLOW_QUERY_THRESHOLD_MS:
+        return
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query)
+    if sql_operation(query) == "EXPLAIN":
+        return  # 自己發出的 EXPLAIN 不再記錄
+
+    statement = normalize_sql(query)
+    entry = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "duration_ms": round(duration * 1000, 3),
+        "route": _current_route(),
+        "request_id": request_id.get(),
+        "statement": statement,
+        "sql": query.strip(),
+        "params": _serialize_params(params),
+        "rowcount": rowcount,
+    }
+    if error is not None:
+        entry["error"] = type(error).__name__
+
+    loop = asyncio.get_running_loop()
+    now = time.monotonic()
+    if SLOW_QUERY_EXPLAIN and error is None and now - _last_explained.get(statement, -SLOW_QUERY_EXPLAIN_INTERVAL) >= SLOW_QUERY_EXPLAIN_INTERVAL:
+        if len(_last_explained) > 1000:
+            _last_explained.clear()
+        _last_explained[statement] = now
+        task = loop.create_task(_explain_and_write(entry, query, params))
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+    else:
+        loop.run_in_executor(None, _append_entry, entry)
+
+
+async def _explain_and_write(entry: dict, query: str, params):
+    analyze = is_read_only(query)
+    options = "ANALYZE, BUFFERS, FORMAT TEXT" if analyze else "FORMAT TEXT"
+    try:
+        pool = await get_pool()
+        async with pool.connection(timeout=EXPLAIN_CONNECTION_TIMEOUT) as conn:
+            try:
+                async with conn.cursor() as cur:
+                    await cur.execute(f"EXPLAIN ({options}) {query}", params)
+                    rows = await cur.fetchall()
+            finally:
+                await conn.rollback()
+        entry["plan"] = "\n".join(row["QUERY PLAN"] for row in rows)
+        entry["plan_analyzed"] = analyze
+    except Exception as e:
+        entry["plan_error"] = f"{type(e).__name__}: {e}"
+    await asyncio.get_running_loop().run_in_executor(None, _append_entry, entry)
+
+
+_write_lock = threading.Lock()
+
+
+def _append_entry(entry: dict):
+    line = json.dumps(entry, ensure_ascii=False, default=str)
+    with _write_lock:
+        with open(SLOW_QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# --- 2. 報表 (CLI) ---
+
+def load_entries(path: str) -> list[dict]:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # 寫到一半被中斷的行
+    return entries
+
+
+def summarize(entries: list[dict]) -> list[dict]:
+    """
+    依查詢樣式 (正規化後的 SQL) 分組，計算次數、總耗時、平均、p95、最大值與來源路由。
+    """
+    groups: dict[str, list[dict]] = defaultdict(list)
+    for entry in entries:
+        groups[entry["statement"]].append(entry)
+
+    shapes = []
+    for statement, items in groups.items():
+        durations = sorted(item["duration_ms"] for item in items)
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        plans = [item for item in items if item.get("plan")]
+        shapes.append({
+            "statement": statement,
+            "count": len(items),
+            "total": sum(durations),
+            "mean": statistics.mean(durations),
+            "p95": p95,
+            "max": durations[-1],
+            "routes": Counter(item.get("route", "?") for item in items).most_common(3),
+            "latest_plan": plans[-1]["plan"] if plans else None,
+        })
+    return shapes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="慢查詢報表：依查詢樣式排名")
+    parser.add_argument("--log", default=SLOW_QUERY_LOG_PATH, help="慢查詢紀錄檔 (JSONL)")
+    parser.add_argument("--sort", choices=["total", "mean", "p95", "max", "count"], default="total")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--plans", action="store_true", help="同時印出每種查詢最近一次的執行計畫")
+    args = parser.parse_args()
+
+    try:
+        entries = load_entries(args.log)
+    except FileNotFoundError:
+        print(f"找不到慢查詢紀錄: {args.log}")
+        return
+    shapes = sorted(summarize(entries), key=lambda s: s[args.sort], reverse=True)[:args.top]
+
+    print(f"共 {len(entries)} 筆慢查詢、{len(shapes)} 種樣式 (依 {args.sort} 排序)\n")
+    print(f"{'#':>3} {'次數':>6} {'總計ms':>10} {'平均ms':>9} {'p95ms':>9} {'最大ms':>9}  路由 / SQL")
+    for rank, shape in enumerate(shapes, 1):
+        routes = ", ".join(f"{route} ({count})" for route, count in shape["routes"])
+        print(f"{rank:>3} {shape['count']:>6} {shape['total']:>10.1f} {shape['mean']:>9.1f} "
+              f"{shape['p95']:>9.1f} {shape['max']:>9.1f}  {routes}")
+        print(f"{'':>52}{shape['statement'][:160]}")
+        if args.plans and shape["latest_plan"]:
+            for plan_line in shape["latest_plan"].splitlines():
+                print(f"{'':>8}| {plan_line}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
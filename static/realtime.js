@@ -0,0 +1,106 @@
+/* -----------------------------------
+   專案即時更新 (Server-Sent Events)
+   新留言、新 Issue、Issue 狀態變更會直接出現在頁面上，不用重新整理
+   ----------------------------------- */
+
+/**
+ * @param {object} options
+ *   - projectId   : 專案 ID
+ *   - authorLabel : function(comment) -> 顯示名稱 (例如「我」、「接案人」)
+ *   - commentUrl  : function(issueId) -> 留言表單的送出網址 (沒有則不顯示表單)
+ */
+function initProjectRealtime(options) {
+    if (!window.EventSource) return; // 舊瀏覽器：維持原本的重新整理行為
+
+    const source = new EventSource(`/events/project/${options.projectId}`);
+
+    function findIssueCard(issueId) {
+        return document.querySelector(`.issue-card[data-issue-id="${issueId}"]`);
+    }
+
+    // 1. 新留言：附加到對應 Issue 的留言區
+    source.addEventListener('comment', function(e) {
+        const data = JSON.parse(e.data);
+        if (data.truncated) { location.reload(); return; } // 內容太長，改用重新整理取得完整留言
+
+        const card = findIssueCard(data.issue_id);
+        if (!card) return;
+        const section = card.querySelector('.comments-section');
+        if (section.querySelector(`[data-comment-id="${data.comment_id}"]`)) return; // 已經顯示過
+
+        const div = document.createElement('div');
+        div.className = 'comment';
+        div.dataset.commentId = data.comment_id;
+        const strong = document.createElement('strong');
+        strong.textContent = options.authorLabel(data) + ':';
+        div.appendChild(strong);
+        div.appendChild(document.createTextNode(' ' + data.message)); // textContent：避免 XSS
+        section.appendChild(div);
+    });
+
+    // 2. Issue 狀態變更 (例如標記為已解決)
+    source.addEventListener('issue_status', function(e) {
+        const data = JSON.parse(e.data);
+        if (data.truncated) { location.reload(); return; } // 內容被截短或只剩 id，改用重新整理
+        const card = findIssueCard(data.issue_id);
+        if (!card) return;
+        const badge = card.querySelector('.issue-header [class^="issue-status-"]');
+        if (badge) {
+            badge.className = `issue-status-${data.status}`;
+            badge.textContent = data.status === 'resolved' ? '已解決' : '待解決';
+        }
+        if (data.status === 'resolved') {
+            card.querySelectorAll('form').forEach(form => form.remove()); // 已解決就不能再回覆
+        }
+    });
+
+    // 3. 新 Issue：在列表最上方插入一張卡片
+    source.addEventListener('issue_created', function(e) {
+        const data = JSON.parse(e.data);
+        if (data.truncated) { location.reload(); return; } // 標題 / 描述太長被截短，改用重新整理取得完整內容
+        const list = document.getElementById('issue-list');
+        if (!list) { location.reload(); return; } // 頁面上還沒有 Issue 區塊
+        if (findIssueCard(data.issue_id)) return;
+
+        const empty = list.querySelector('.issue-empty');
+        if (empty) empty.remove();
+
+        const card = document.createElement('div');
+        card.className = 'issue-card';
+        card.dataset.issueId = data.issue_id;
+
+        const header = document.createElement('div');
+        header.className = 'issue-header';
+        const left = document.createElement('div');
+        const badge = document.createElement('span');
+        badge.className = 'issue-status-open';
+        badge.textContent = '待解決';
+        const title = document.createElement('strong');
+        title.style.marginLeft = '10px';
+        title.textContent = data.title;
+        left.append(badge, title);
+        header.appendChild(left);
+
+        const desc = document.createElement('p');
+        desc.style.cssText = 'color: #666; margin: 10px 0;';
+        desc.textContent = data.description;
+
+        const section = document.createElement('div');
+        section.className = 'comments-section';
+        section.style.cssText = 'background: #fafafa; padding: 10px;';
+
+        card.append(header, desc, section);
+
+        if (options.commentUrl) {
+            const form = document.createElement('form');
+            form.method = 'POST';
+            form.action = options.commentUrl(data.issue_id);
+            form.style.cssText = 'display: flex; gap: 10px; margin-top: 10px;';
+            form.innerHTML = '<input type="text" name="message" placeholder="回覆..." required style="flex-grow: 1; padding: 5px;">'
+                           + '<button type="submit" class="btn btn-secondary btn-sm">送出</button>';
+            card.appendChild(form);
+        }
+
+        list.prepend(card);
+    });
+}
@@ -0,0 +1,103 @@
+# static_assets.py
+import json
+import os
+import stat
+from mimetypes import guess_type
+import anyio
+from starlette.datastructures import Headers
+from starlette.staticfiles import StaticFiles
+
+# --- 靜態資源 (CSS / 圖片) ---
+# build_assets.py 會把 static/ 底下的檔案輸出到 static/dist/：
+#   style.css -> dist/style.3f2a1b9c0d.css (+ .gz / .br 壓縮版)
+# 檔名帶有內容雜湊 (fingerprint)，內容一改檔名就變，所以可以放心讓瀏覽器永久快取。
+STATIC_DIR = "static"
+DIST_DIR = "dist"
+MANIFEST_PATH = os.path.join(STATIC_DIR, DIST_DIR, "manifest.json")
+
+# 帶雜湊的檔案：一年 + immutable (瀏覽器連重新驗證都不用)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 依偏好順序：brotli 壓縮率較好，其次 gzip
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest: dict[str, str] | None = None
+_manifest_mtime: float | None = None
+
+
+def _load_manifest() -> dict[str, str]:
+    """
+    讀取 manifest.json ({"style.css": "style.3f2a1b9c0d.css", ...})。
+    檔案更新 (重新 build) 時自動重新載入；還沒 build 過就回傳空的對照表。
+    """
+    global _manifest, _manifest_mtime
+    try:
+        mtime = os.stat(MANIFEST_PATH).st_mtime
+    except FileNotFoundError:
+        return {}
+    if _manifest is None or mtime != _manifest_mtime:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            _manifest = json.load(f)
+        _manifest_mtime = mtime
+    return _manifest
+
+
+def asset_url(path: str) -> str:
+    """
+    樣板用的輔助函式：{{ asset_url('style.css') }}
+    - 有 build 過 -> /static/dist/style.3f2a1b9c0d.css
+    - 開發環境沒 build -> /static/style.css (原始檔)
+    """
+    fingerprinted = _load_manifest().get(path)
+    if fingerprinted:
+        return f"/{STATIC_DIR}/{DIST_DIR}/{fingerprinted}"
+    return f"/{STATIC_DIR}/{path}"
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    """
+    解析 Accept-Encoding，例如 "gzip, deflate, br;q=0" -> {"gzip", "deflate"}。
+    """
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles 的加強版：
+    1. 瀏覽器支援 br / gzip 時，直接回傳 build 時預先壓縮好的 .br / .gz 檔 (不用每次即時壓縮)
+    2. dist/ 底下帶雜湊的檔案加上 Cache-Control: immutable
+    """
+
+    async def get_response(self, path: str, scope):
+        response = None
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+
+        for encoding, suffix in _ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                response = self.file_response(full_path, stat_result, scope)
+                # 內容類型要用「原始檔」的類型 (text/css)，而不是 .gz 的 application/gzip
+                media_type = guess_type(path)[0] or "application/octet-stream"
+                if media_type.startswith("text/"):
+                    media_type += "; charset=utf-8"
+                response.headers["content-type"] = media_type
+                response.headers["content-encoding"] = encoding
+                break
+
+        if response is None:
+            response = await super().get_response(path, scope)
+
+        # 同一個網址會依 Accept-Encoding 回傳不同內容，告訴 CDN / 代理要分開快取
+        response.headers["vary"] = "Accept-Encoding"
+        if path.startswith(f"{DIST_DIR}/") and response.status_code in (200, 304):
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        return response
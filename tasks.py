@@ -0,0 +1,142 @@
+# tasks.py
+"""
+背景工作定義 (由 worker.py 執行)。
+路由只負責 .enqueue(cur, ...)，耗時的檔案處理與定期排程放在這裡，不拖慢請求。
+"""
+import os
+import logging
+import psycopg
+from psycopg.rows import dict_row
+from db import DATABASE_URL
+from config import PROJECT_EXPIRY_SWEEP_INTERVAL, PROJECT_EXPIRY_BATCH_SIZE, ANALYTICS_ROLLUP_INTERVAL, LEADERBOARD_REFRESH_INTERVAL
+from file_serving import is_safe_upload_path
+from jobs import job
+from outbox import enqueue_outbox
+from exports import write_xlsx, xlsx_export_path
+from analytics import refresh_rollups
+from rating_stats import refresh_leaderboard
+
+logger = logging.getLogger(__name__)
+
+# --- 套件相容性檢查 ---
+# 縮圖需要 Pillow (pip install Pillow)；沒安裝就保留原圖，不影響功能
+try:
+    from PIL import Image, ImageOps
+    HAS_PILLOW = True
+except ImportError:
+    HAS_PILLOW = False
+
+# 頭像在頁面上最大只顯示約 150px，保留 2 倍給高解析度螢幕
+AVATAR_MAX_SIZE = 300
+
+
+# --- 1. 頭像縮圖 ---
+
+def _shrink_image_in_place(path: str, max_size: int):
+    with Image.open(path) as img:
+        if img.width <= max_size and img.height <= max_size:
+            return
+        img = ImageOps.exif_transpose(img)  # 手機照片要先依 EXIF 轉正，不然縮完會躺著
+        img.thumbnail((max_size, max_size))
+        # 先寫暫存檔再替換，避免縮到一半時有人讀到壞掉的圖片
+        tmp_path = f"{path}.tmp"
+        img.save(tmp_path, format=Image.registered_extensions().get(os.path.splitext(path)[1].lower(), "PNG"))
+    os.replace(tmp_path, path)
+
+
+@job("shrink_avatar", priority=5, max_attempts=3)
+def shrink_avatar(path: str, old_path: str | None = None):
+    """
+    把使用者上傳的頭像縮到 AVATAR_MAX_SIZE 以內 (原地覆寫)，並刪除被換掉的舊頭像。
+    """
+    if HAS_PILLOW and is_safe_upload_path(path) and os.path.exists(path):
+        _shrink_image_in_place(path, AVATAR_MAX_SIZE)
+
+    # 舊頭像已經沒有任何地方引用
+    if old_path and old_path != path and is_safe_upload_path(old_path) and os.path.exists(old_path):
+        os.remove(old_path)
+
+
+# --- 2. 過期專案清理 ---
+
+@job("expire_overdue_projects", every=PROJECT_EXPIRY_SWEEP_INTERVAL, max_attempts=1)
+async def expire_overdue_projects():
+    """
+    把「已過提案截止日、但還是 open」的專案改成 expired，並通知委託人。
+
+    分批處理 (每批一個交易)：一次 UPDATE 幾萬筆會長時間鎖住資料列，
+    也會讓委託人剛好在編輯 / 選擇提案時卡住。
+    """
+    total = 0
+    async with await psycopg.AsyncConnection.connect(DATABASE_URL, row_factory=dict_row) as conn:
+        while True:
+            async with conn.transaction():
+                async with conn.cursor() as cur:
+                    # 走 idx_projects_open_deadline；SKIP LOCKED 跳過正在被路由修改的專案，下一輪再處理
+                    await cur.execute(
+                        """
+                        WITH due AS (
+                            SELECT id FROM projects
+                            WHERE status = 'open' AND deadline <= NOW()
+                            ORDER BY deadline
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        UPDATE projects p SET status = 'expired'
+                        FROM due WHERE p.id = due.id
+                        RETURNING p.id, p.client_id, p.title
+                        """,
+                        (PROJECT_EXPIRY_BATCH_SIZE,)
+                    )
+                    expired = await cur.fetchall()
+                    for p in expired:
+                        await enqueue_outbox(cur, p["client_id"], "project_status", {
+                            "project_id": p["id"], "title": p["title"], "status": "expired",
+                        })
+            total += len(expired)
+            if len(expired) < PROJECT_EXPIRY_BATCH_SIZE:
+                break
+    if total:
+        logger.info("已將 %d 個過期專案標記為 expired", total)
+
+
+# --- 3. 專案歷史匯出 (XLSX) ---
+
+@job("export_project_history_xlsx", max_attempts=2)
+async def export_project_history_xlsx(client_id: int, export_id: str):
+    """
+    產生委託人的專案歷史活頁簿 (見 exports.py)。先寫暫存檔再改名，下載端不會拿到寫到一半的檔案。
+    """
+    path = xlsx_export_path(client_id, export_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    async with await psycopg.AsyncConnection.connect(DATABASE_URL) as conn:
+        await write_xlsx(conn, client_id, tmp_path)
+    os.replace(tmp_path, path)
+    logger.info("專案歷史匯出完成 (client %s): %s", client_id, path)
+
+
+# --- 4. 平台統計彙總 ---
+
+@job("refresh_analytics_rollups", every=ANALYTICS_ROLLUP_INTERVAL, max_attempts=1)
+async def refresh_analytics_rollups():
+    """
+    只重算水位線之後有變動的日期 (見 analytics.py)，管理後台讀的是彙總結果。
+    """
+    async with await psycopg.AsyncConnection.connect(DATABASE_URL, row_factory=dict_row) as conn:
+        refreshed = await refresh_rollups(conn)
+    if refreshed:
+        logger.info("平台統計已更新 %d 天", refreshed)
+
+
+# --- 5. 接案人排行榜 ---
+
+@job("refresh_contractor_leaderboard", every=LEADERBOARD_REFRESH_INTERVAL, max_attempts=1)
+async def refresh_contractor_leaderboard():
+    """
+    只重算水位線之後收到新評價的接案人 (見 rating_stats.py)；全站平均變動太多時整份重算。
+    """
+    async with await psycopg.AsyncConnection.connect(DATABASE_URL, row_factory=dict_row) as conn:
+        updated = await refresh_leaderboard(conn)
+    if updated:
+        logger.info("接案人排行榜已更新 %d 位", updated)
@@ -0,0 +1,46 @@
+# templating.py
+import os
+import time
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from config import IS_PRODUCTION, TEMPLATE_BYTECODE_CACHE_DIR
+from fragment_cache import FragmentCacheExtension
+from static_assets import asset_url
+
+# --- 共用樣板引擎 ---
+# 整個應用程式只建立「一個」 Jinja2 環境，所有路由都從這裡匯入 templates。
+# (以前 main.py 與 routes/auth.py 各自建立一份，同一個樣板會被解析、編譯兩次)
+#
+# - FileSystemBytecodeCache: 編譯結果寫到磁碟，重啟或其他 worker 可直接載入，不用重新解析
+# - auto_reload: 開發時改了 HTML 立即生效；正式環境關閉，省掉每次渲染前檢查檔案修改時間
+# - FragmentCacheExtension: 提供 {% cache %} 標籤，快取渲染好的 HTML 片段 (見 fragment_cache.py)
+TEMPLATE_DIR = "templates"
+
+os.makedirs(TEMPLATE_BYTECODE_CACHE_DIR, exist_ok=True)
+
+env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=True,  # 與 Starlette 預設相同：自動跳脫 HTML，防止 XSS
+    bytecode_cache=FileSystemBytecodeCache(TEMPLATE_BYTECODE_CACHE_DIR),
+    auto_reload=not IS_PRODUCTION,
+    cache_size=400,  # 記憶體內最多保留幾個已編譯樣板 (本專案樣板數量遠低於此)
+    extensions=[FragmentCacheExtension],
+)
+
+# 樣板中用 {{ asset_url('style.css') }} 取得帶雜湊的靜態檔網址 (見 static_assets.py)
+env.globals["asset_url"] = asset_url
+
+templates = Jinja2Templates(env=env)
+
+
+def precompile_templates() -> float:
+    """
+    啟動時預先載入 (編譯) 所有樣板，並寫入 bytecode 快取。
+
+    回傳:
+    - 花費的秒數 (方便在啟動紀錄中觀察)
+    """
+    start = time.perf_counter()
+    for name in env.list_templates(extensions=["html"]):
+        env.get_template(name)
+    return time.perf_counter() - start
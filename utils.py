@@ -1,8 +1,10 @@
 import os
 import shutil
+import time
 from datetime import datetime
 from fastapi import UploadFile, HTTPException
 import aiofiles # 這是非同步檔案處理套件，避免上傳大檔案時卡住整個伺服器
+from metrics import record_upload # 上傳量 / 速度監控
 
 # --- 1. 設定檔案儲存路徑常數 ---
 # 統一管理資料夾名稱，以後如果要改路徑，只要改這裡就好
@@ -57,9 +59,13 @@ async def save_upload_file(file: UploadFile, project_id: int, sub_folder: str) -
     # 3. 寫入檔案 (非同步串流寫入)
     # 使用 aiofiles 與 chunks (分塊) 讀取，這對於大檔案非常重要，
     # 可以避免記憶體爆掉，也不會因為硬碟寫入慢而卡住其他使用者的請求。
+    start = time.perf_counter()
+    size = 0
     async with aiofiles.open(file_path, 'wb') as out_file:
         while content := await file.read(1024):  # 每次讀取 1024 bytes
             await out_file.write(content)
+            size += len(content)
+    record_upload(sub_folder, size, time.perf_counter() - start)
             
     # 回傳給資料庫的路徑格式 (使用 / 分隔，確保跨平台相容性)
     return f"{UPLOAD_ROOT}/{project_id}/{sub_folder}/{new_filename}"
@@ -90,8 +96,12 @@ async def save_avatar_file(file: UploadFile, user_id: int) -> str:
     file_path = os.path.join(target_dir, new_filename)
     
     # 寫入檔案
+    start = time.perf_counter()
+    size = 0
     async with aiofiles.open(file_path, 'wb') as out_file:
         while content := await file.read(1024): 
             await out_file.write(content)
+            size += len(content)
+    record_upload(FOLDER_AVATARS, size, time.perf_counter() - start)
             
     return f"{UPLOAD_ROOT}/{FOLDER_AVATARS}/{new_filename}"
\ No newline at end of file
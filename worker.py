@@ -0,0 +1,25 @@
+# worker.py
+"""
+背景工作 worker 進入點 (與 uvicorn 分開啟動，可依負載開多個)：
+    python worker.py                 # 處理所有 queue
+    python worker.py --queue default --concurrency 8
+"""
+import argparse
+import asyncio
+from app_logging import setup_logging
+from jobs import run_worker
+from config import JOB_WORKER_CONCURRENCY
+import tasks  # noqa: F401  匯入時會透過 @job 註冊所有工作
+
+
+def main():
+    parser = argparse.ArgumentParser(description="背景工作 worker")
+    parser.add_argument("--queue", action="append", dest="queues", help="只處理指定的 queue (可重複指定)")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY, help="同時執行的工作數")
+    args = parser.parse_args()
+    setup_logging()
+    asyncio.run(run_worker(args.queues, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()